@@ -0,0 +1,143 @@
+"""
+التحكم في القبول وإسقاط الحمل (Admission Control & Load Shedding)
+يُقرَّر قبول الطلب قبل إنفاق أي رمز، بناءً على عمق الطابور، والرموز قيد التنفيذ،
+وصحة المزوّد الحالية، ومهلة العميل. الطلب المرفوض يحمل مدة Retry-After مقترحة.
+"""
+
+import math
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+from concurrency_limiter import AdaptiveConcurrencyLimiter
+from request_scheduler import FairScheduler
+from runtime_metrics import metrics
+
+# مدة الانتظار المقترحة عند تدهور صحة المزوّد
+_HEALTH_RETRY_SECONDS = 10.0
+_EWMA_ALPHA = 0.2
+# حدود معامل البطء حتى لا تشوّهه إصابات الذاكرة المؤقتة أو استدعاء شاذ واحد
+_MIN_SLOWDOWN = 0.25
+_MAX_SLOWDOWN = 4.0
+
+
+class AdmissionRejected(Exception):
+    """رفض فوري للطلب؛ retry_after بالثواني"""
+
+    def __init__(self, reason: str, retry_after: float, detail: str):
+        super().__init__(detail)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+@dataclass
+class AdmissionEstimate:
+    queue_wait_seconds: float
+    service_seconds: float
+    provider_health: float
+
+    @property
+    def completion_seconds(self) -> float:
+        return self.queue_wait_seconds + self.service_seconds
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        scheduler: FairScheduler,
+        limiter: AdaptiveConcurrencyLimiter,
+        max_queue_depth: int = 64,
+        max_inflight_tokens: int = 1_000_000,
+        min_provider_health: float = 0.5
+    ):
+        self.scheduler = scheduler
+        self.limiter = limiter
+        self.max_queue_depth = max_queue_depth
+        self.max_inflight_tokens = max_inflight_tokens
+        self.min_provider_health = min_provider_health
+        self.inflight_tokens = 0
+        # متوسط متحرك لنسبة الزمن الفعلي إلى زمن الخطة
+        self._slowdown = 1.0
+
+    # =============================================================================
+    # الواجهة العامة
+    # =============================================================================
+
+    def estimate(self, planned_seconds: float) -> AdmissionEstimate:
+        """تقدير زمن الانتظار في الطابور وزمن الخدمة في ظل الحمل والصحة الحالية"""
+        health = self.limiter.health()
+        service = planned_seconds * self._slowdown / max(health, 0.1)
+        waiting = self.scheduler.queue_depth
+        if self.scheduler.active + waiting < self.scheduler.max_concurrent:
+            wait = 0.0
+        else:
+            # كل مقعد يتحرر بعد زمن خدمة واحد تقريباً
+            wait = (waiting // self.scheduler.max_concurrent + 1) * service
+        return AdmissionEstimate(queue_wait_seconds=wait, service_seconds=service, provider_health=health)
+
+    def check(self, tokens: int, planned_seconds: float, deadline_seconds: Optional[float] = None) -> AdmissionEstimate:
+        """رفع AdmissionRejected إذا لم يكن بالإمكان خدمة الطلب الآن أو قبل مهلته"""
+        estimate = self.estimate(planned_seconds)
+
+        if estimate.provider_health < self.min_provider_health:
+            self._reject("provider_unhealthy", _HEALTH_RETRY_SECONDS,
+                         f"LLM provider degraded (health {estimate.provider_health:.0%})")
+        if self.scheduler.queue_depth >= self.max_queue_depth:
+            self._reject("queue_full", estimate.queue_wait_seconds,
+                         f"Queue is full ({self.scheduler.queue_depth} waiting)")
+        if self.inflight_tokens and self.inflight_tokens + tokens > self.max_inflight_tokens:
+            self._reject("token_capacity", estimate.completion_seconds,
+                         f"In-flight token capacity exceeded ({self.inflight_tokens} + {tokens} tokens)")
+        if deadline_seconds is not None and estimate.completion_seconds > deadline_seconds:
+            self._reject("deadline", estimate.queue_wait_seconds,
+                         f"Cannot finish within {deadline_seconds:.1f}s "
+                         f"(estimated {estimate.completion_seconds:.1f}s)")
+
+        metrics.incr("admission.accepted")
+        return estimate
+
+    def recheck(self, planned_seconds: float, remaining_seconds: float) -> None:
+        """فحص ثانٍ عند الخروج من الطابور: لا يبدأ عمل لن يكتمل قبل المهلة"""
+        service = self.estimate(planned_seconds).service_seconds
+        if service > remaining_seconds:
+            self._reject("deadline_in_queue", service,
+                         f"Deadline expired while queued ({remaining_seconds:.1f}s left, "
+                         f"{service:.1f}s needed)")
+
+    @contextmanager
+    def admitted(self, tokens: int) -> Iterator[None]:
+        """حجز رموز الطلب المقبول حتى انتهائه (في الطابور أو قيد التنفيذ)"""
+        self.inflight_tokens += tokens
+        metrics.set("admission.inflight_tokens", self.inflight_tokens)
+        try:
+            yield
+        finally:
+            self.inflight_tokens -= tokens
+            metrics.set("admission.inflight_tokens", self.inflight_tokens)
+
+    def record_service(self, planned_seconds: float, actual_seconds: float) -> None:
+        """تحديث معامل البطء من زمن الخدمة الفعلي مقارنة بالخطة"""
+        if planned_seconds <= 0:
+            return
+        ratio = min(_MAX_SLOWDOWN, max(_MIN_SLOWDOWN, actual_seconds / planned_seconds))
+        self._slowdown = (1 - _EWMA_ALPHA) * self._slowdown + _EWMA_ALPHA * ratio
+
+    def stats(self) -> dict:
+        return {
+            "inflight_tokens": self.inflight_tokens,
+            "max_inflight_tokens": self.max_inflight_tokens,
+            "queue_depth": self.scheduler.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "provider_health": round(self.limiter.health(), 3),
+            "min_provider_health": self.min_provider_health,
+            "slowdown": round(self._slowdown, 3),
+        }
+
+    # =============================================================================
+    # التنفيذ الداخلي
+    # =============================================================================
+
+    def _reject(self, reason: str, retry_after: float, detail: str) -> None:
+        metrics.incr("admission.rejected")
+        metrics.incr(f"admission.rejected.{reason}")
+        raise AdmissionRejected(reason, retry_after, detail)
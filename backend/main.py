@@ -5,14 +5,26 @@ Provides REST API endpoints for architectural analysis using LLMs
 
 import os
 import sys
+import asyncio
+import hashlib
+import hmac
+import json
 import logging
-from typing import Optional
+import re
+import time
+from contextlib import asynccontextmanager, nullcontext
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
 from datetime import datetime
 from pathlib import Path
 
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+import httpx
+import instructor
+from openai import APIConnectionError, APIStatusError, AsyncOpenAI, DefaultAsyncHttpxClient
+from pydantic import BaseModel, Field, ValidationError
 
 # Add parent directory to path to import enhanced_analyzer
 sys.path.append(str(Path(__file__).parent.parent))
@@ -21,8 +33,27 @@ from enhanced_analyzer import (
     EnhancedArchitecturalAnalystAgent,
     AppConfig,
     AnalysisType,
-    ComprehensiveArchitectureReport
+    ComprehensiveArchitectureReport,
+    COMPACT_STAGE_MODELS,
+    STAGE_MODELS,
+    plan_analysis
 )
+import compact_schemas
+import report_analytics
+import request_profiler
+from admission_control import AdmissionController, AdmissionRejected
+from concurrency_limiter import llm_limiter
+from llm_hedging import hedger
+from qa_session import answer_stream, build_messages, qa_sessions
+from report_analytics import ReportDirectory
+from report_diff import diff_reports, format_diff_markdown
+from response_compression import CompressionMiddleware, content_etag, etag_matches
+from request_profiler import RequestProfile
+from request_scheduler import FairScheduler, PriorityClass
+from runtime_metrics import metrics
+from summary_tree import SummaryResult
+from token_planner import BudgetExceededError, estimate_tokens, schema_tokens
+from traffic_recorder import TrafficRecorder
 
 # Configure logging
 logging.basicConfig(
@@ -31,11 +62,25 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up in the background; /ready reports 503 until it finishes"""
+    task = asyncio.create_task(warm_up())
+    try:
+        yield
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        if llm_client is not None:
+            await llm_client.close()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Architecture Analyzer API",
     description="REST API for analyzing system architectures using advanced LLMs",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -45,19 +90,35 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+# gzip/br/zstd negotiation for JSON, markdown and NDJSON responses (br/zstd when installed)
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("ANALYZER_COMPRESS_MIN_BYTES", "512")))
+
 # Request/Response Models
 class AnalysisRequest(BaseModel):
     text: str = Field(..., description="Architecture session text to analyze")
     analysis_type: str = Field(
         default="comprehensive",
-        description="Type of analysis: basic, failure, performance, integration, comparative, comprehensive"
+        description="Type of analysis: basic, failure, performance, integration, comprehensive (compare via comparison_text)"
     )
     model_name: Optional[str] = Field(
         default="gpt-4",
         description="LLM model to use for analysis"
     )
+    comparison_text: Optional[str] = Field(
+        default=None,
+        description="Optional second architecture; adds the comparison stage to comprehensive reports"
+    )
+    create_session: bool = Field(
+        default=False,
+        description="Keep a follow-up Q&A session over the comprehensive report (see /api/sessions)"
+    )
+    no_cache: bool = Field(
+        default=False,
+        description="Call the model for every stage instead of reusing cached stage results"
+    )
 
 class AnalysisResponse(BaseModel):
     success: bool
@@ -65,6 +126,10 @@ class AnalysisResponse(BaseModel):
     report: str
     generated_at: str
     message: Optional[str] = None
+    stage_timings: Optional[Dict[str, Any]] = None
+    report_id: Optional[str] = None
+    session_id: Optional[str] = None
+    profile: Optional[Dict[str, Any]] = None
 
 class HealthResponse(BaseModel):
     status: str
@@ -72,20 +137,290 @@ class HealthResponse(BaseModel):
     timestamp: str
 
 # Initialize analyzer agent
-def get_config() -> AppConfig:
+def get_config(require_api_key: bool = True) -> AppConfig:
     """Get configuration for the analyzer"""
     api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
+    if not api_key and require_api_key:
         raise ValueError("OPENAI_API_KEY environment variable not set")
     
+    max_cost = os.getenv("ANALYZER_MAX_COST_USD")
     return AppConfig(
-        api_key=api_key,
+        api_key=api_key or "",
         input_file="",  # Not used in API mode
         output_file="",  # Not used in API mode
         model_name="gpt-4",
-        temperature=0.2
+        temperature=0.2,
+        max_cost_usd=float(max_cost) if max_cost else None,
+        budget_policy=os.getenv("ANALYZER_BUDGET_POLICY", "downgrade"),
+        hedge_enabled=os.getenv("ANALYZER_HEDGE", "").lower() in ("1", "true", "yes"),
+        hedge_percentile=float(os.getenv("ANALYZER_HEDGE_PERCENTILE", "0.95")),
+        hedge_budget_ratio=float(os.getenv("ANALYZER_HEDGE_BUDGET", "0.1")),
+        compact_schemas=os.getenv("ANALYZER_COMPACT_SCHEMAS", "true").lower() not in ("0", "false", "no"),
+        summary_tree=os.getenv("ANALYZER_SUMMARY_TREE", "").lower() in ("1", "true", "yes")
     )
 
+# Comparison runs as a stage of a comprehensive report (comparison_text), not on its own
+SERVED_ANALYSIS_TYPES = [t for t in AnalysisType if t != AnalysisType.COMPARATIVE]
+
+def parse_analysis_type(value: str) -> AnalysisType:
+    """Validate the requested analysis type before any planning, admission or queueing"""
+    try:
+        analysis_type = AnalysisType(value.lower())
+    except ValueError:
+        analysis_type = None
+    if analysis_type not in SERVED_ANALYSIS_TYPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid analysis type. Must be one of: {[t.value for t in SERVED_ANALYSIS_TYPES]}"
+            + (" (use 'comprehensive' with comparison_text to compare)" if analysis_type == AnalysisType.COMPARATIVE else "")
+        )
+    return analysis_type
+
+T = TypeVar("T")
+
+# Weighted fair scheduler shared by all analysis requests in this process
+scheduler = FairScheduler(max_concurrent=int(os.getenv("ANALYZER_MAX_CONCURRENT", "4")))
+
+# Upper bound for the adaptive (AIMD) limit on concurrent LLM calls
+llm_limiter.max_limit = float(os.getenv("ANALYZER_LLM_MAX_CONCURRENCY", str(llm_limiter.max_limit)))
+
+# Load shedding before any tokens are spent (queue depth, in-flight tokens, provider health, deadline)
+admission = AdmissionController(
+    scheduler,
+    llm_limiter,
+    max_queue_depth=int(os.getenv("ANALYZER_MAX_QUEUE_DEPTH", "64")),
+    max_inflight_tokens=int(os.getenv("ANALYZER_MAX_INFLIGHT_TOKENS", "1000000")),
+    min_provider_health=float(os.getenv("ANALYZER_MIN_PROVIDER_HEALTH", "0.5"))
+)
+
+# Comprehensive reports from API runs are persisted here when set; /api/analytics reads the
+# same directory (default: batch_analyzer.py's output directory)
+REPORT_DIR = os.getenv("ANALYZER_REPORT_DIR")
+report_directory = ReportDirectory(REPORT_DIR or "reports")
+
+def store_report(report: ComprehensiveArchitectureReport) -> str:
+    """Persist a comprehensive report as JSON (analytics, GET /api/reports/{id}); returns its id"""
+    payload = report.model_dump_json(indent=2)
+    report_id = f"{datetime.now():%Y%m%d-%H%M%S}-{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:12]}"
+    directory = Path(REPORT_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / f"{report_id}.json").write_text(payload, encoding="utf-8")
+    return report_id
+
+# Shared LLM client built during warm-up; its pool keeps provider connections alive between requests
+llm_client: Optional[AsyncOpenAI] = None
+WARM_CONNECTIONS = int(os.getenv("ANALYZER_WARM_CONNECTIONS", "2"))
+KEEPALIVE_SECONDS = float(os.getenv("ANALYZER_KEEPALIVE_SECONDS", "60"))
+# Provider reachability is re-probed at most this often; each probe also refreshes a pooled connection
+PROBE_TTL_SECONDS = float(os.getenv("ANALYZER_READY_PROBE_TTL", "15"))
+PROBE_TIMEOUT_SECONDS = 5.0
+
+warmup_state: Dict[str, Any] = {"state": "pending", "steps": {}, "error": None}
+provider_probe: Dict[str, Any] = {}
+
+def build_llm_client(config: AppConfig) -> AsyncOpenAI:
+    """One instructor-patched client for every request (OPENAI_BASE_URL selects a local stand-in)"""
+    http_client = DefaultAsyncHttpxClient(limits=httpx.Limits(
+        max_connections=1000,
+        max_keepalive_connections=max(WARM_CONNECTIONS, 20),
+        keepalive_expiry=KEEPALIVE_SECONDS
+    ))
+    return instructor.patch(AsyncOpenAI(api_key=config.api_key, http_client=http_client))
+
+def warm_schemas(config: AppConfig) -> None:
+    """Build every tool schema and token estimate the first request would otherwise compute"""
+    for model in [*STAGE_MODELS.values(), *COMPACT_STAGE_MODELS.values(), SummaryResult]:
+        instructor.openai_schema(model).openai_schema
+        schema_tokens(model, config.model_name)
+    estimate_tokens("warm-up", config.model_name)
+    plan_analysis(config, "warm-up", AnalysisType.COMPREHENSIVE)
+
+async def probe_provider(force: bool = False) -> Dict[str, Any]:
+    """Check the LLM endpoint with a cheap models listing over the shared pool"""
+    if llm_client is None:
+        return {"reachable": False, "error": "client not built"}
+    if not force and provider_probe and time.monotonic() - provider_probe["_at"] < PROBE_TTL_SECONDS:
+        return provider_probe
+    started = time.perf_counter()
+    result: Dict[str, Any] = {"base_url": str(llm_client.base_url)}
+    try:
+        await llm_client.with_options(max_retries=0, timeout=PROBE_TIMEOUT_SECONDS).models.list()
+        result.update(reachable=True, status_code=200)
+    except APIStatusError as e:
+        # Any HTTP answer proves the endpoint is reachable; 401/403 means it cannot serve us
+        result.update(reachable=True, status_code=e.status_code)
+    except (APIConnectionError, httpx.HTTPError) as e:
+        result.update(reachable=False, error=str(e))
+    result["authorized"] = result["status_code"] not in (401, 403) if "status_code" in result else None
+    result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    result["checked_at"] = datetime.now().isoformat()
+    result["_at"] = time.monotonic()
+    provider_probe.clear()
+    provider_probe.update(result)
+    return provider_probe
+
+async def warm_up() -> None:
+    """Client construction, schema generation and keep-alive connections before the first request"""
+    global llm_client
+    warmup_state.update(state="running", started_at=datetime.now().isoformat())
+    started = time.perf_counter()
+    try:
+        config = get_config(require_api_key=False)
+        
+        step = time.perf_counter()
+        await asyncio.to_thread(warm_schemas, config)
+        warmup_state["steps"]["schemas"] = round(time.perf_counter() - step, 3)
+        
+        step = time.perf_counter()
+        llm_client = build_llm_client(config)
+        warmup_state["steps"]["client"] = round(time.perf_counter() - step, 3)
+        
+        # Concurrent probes leave WARM_CONNECTIONS connections (TLS done) in the pool
+        step = time.perf_counter()
+        probes = await asyncio.gather(*(probe_provider(force=True) for _ in range(max(WARM_CONNECTIONS, 1))))
+        warmup_state["steps"]["connections"] = round(time.perf_counter() - step, 3)
+        if not probes[-1].get("reachable"):
+            logger.warning(f"LLM endpoint not reachable during warm-up: {probes[-1].get('error')}")
+        
+        warmup_state.update(state="done", seconds=round(time.perf_counter() - started, 3))
+        logger.info(f"Warm-up finished in {warmup_state['seconds']:.2f}s")
+    except asyncio.CancelledError:
+        warmup_state["state"] = "cancelled"
+        raise
+    except Exception as e:
+        warmup_state.update(state="failed", error=str(e))
+        logger.error(f"Warm-up failed: {str(e)}")
+    finally:
+        warmup_state["finished_at"] = datetime.now().isoformat()
+
+# Follow-up Q&A sessions: LRU beyond ANALYZER_MAX_SESSIONS, dropped after ANALYZER_SESSION_TTL idle seconds
+qa_sessions.max_sessions = int(os.getenv("ANALYZER_MAX_SESSIONS", str(qa_sessions.max_sessions)))
+qa_sessions.ttl_seconds = float(os.getenv("ANALYZER_SESSION_TTL", str(qa_sessions.ttl_seconds)))
+
+# Opt-in traffic capture (ANALYZER_RECORD_DIR); replay with traffic_replay.py
+recorder = TrafficRecorder.from_env()
+
+def parse_priority(http_request: Request, default: PriorityClass = PriorityClass.INTERACTIVE) -> PriorityClass:
+    """Read the priority class from the X-Priority header (default: interactive)"""
+    value = http_request.headers.get("x-priority", default.value)
+    try:
+        return PriorityClass(value.lower())
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid priority. Must be one of: {[p.value for p in PriorityClass]}"
+        )
+
+def resolve_tenant(http_request: Request) -> str:
+    """Identify the caller by X-Tenant-ID, or by a hash of X-API-Key"""
+    tenant = http_request.headers.get("x-tenant-id")
+    if tenant:
+        return tenant
+    api_key = http_request.headers.get("x-api-key")
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+    return "anonymous"
+
+def parse_deadline(http_request: Request) -> Optional[float]:
+    """Read the client's time budget in seconds from the X-Request-Deadline header"""
+    value = http_request.headers.get("x-request-deadline")
+    if value is None:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        seconds = -1.0
+    if seconds <= 0:
+        raise HTTPException(status_code=400, detail="X-Request-Deadline must be a positive number of seconds")
+    return seconds
+
+# Admin token that unlocks per-request profiling; unset disables profiling entirely
+ADMIN_TOKEN = os.getenv("ANALYZER_ADMIN_TOKEN")
+
+def parse_profile(http_request: Request) -> Optional[RequestProfile]:
+    """Start a profile when an admin sends X-Profile: 1 with a valid X-Admin-Token"""
+    if http_request.headers.get("x-profile", "").lower() not in ("1", "true", "yes"):
+        return None
+    token = http_request.headers.get("x-admin-token", "")
+    if not ADMIN_TOKEN or not hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Profiling requires a valid X-Admin-Token")
+    return RequestProfile()
+
+def overloaded(e: AdmissionRejected) -> HTTPException:
+    """503 with a Retry-After hint for a shed request"""
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+# HTTP status used by proxies (nginx) for "client closed request"
+CLIENT_CLOSED_REQUEST = 499
+DISCONNECT_POLL_SECONDS = 0.5
+
+async def run_until_disconnected(http_request: Request, work: Awaitable[T]) -> T:
+    """
+    Run the analysis while watching the client connection
+    
+    If the client goes away (tab closed, proxy timeout) the analysis task is
+    cancelled, which propagates into every in-flight LLM call and concurrent
+    stage. Stages that already completed stay in the shared result cache.
+    """
+    task = asyncio.ensure_future(work)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                try:
+                    result = task.result()
+                except Exception:
+                    # Budget, validation and provider errors are failures, not completions
+                    metrics.incr("requests.failed")
+                    raise
+                metrics.incr("requests.completed")
+                return result
+            if await http_request.is_disconnected():
+                logger.warning("Client disconnected - cancelling in-flight analysis")
+                metrics.incr("requests.cancelled")
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client disconnected")
+    finally:
+        # Server shutdown / outer cancellation must not leave the task running
+        if not task.done():
+            task.cancel()
+
+async def run_analysis(
+    agent: EnhancedArchitecturalAnalystAgent,
+    analysis_type: AnalysisType,
+    text: str,
+    comparison_text: Optional[str] = None,
+    document_keys: Optional[Dict[str, str]] = None
+) -> str:
+    """Run the requested analysis and return the formatted markdown"""
+    # Long documents are analyzed from their cached summary tree when ANALYZER_SUMMARY_TREE is on;
+    # document_keys are the fingerprints already computed while planning
+    document_keys = document_keys or {}
+    text = await agent.condense(text, document_keys.get("raw_text"))
+    if comparison_text:
+        comparison_text = await agent.condense(comparison_text, document_keys.get("comparison_text"))
+    
+    if analysis_type == AnalysisType.COMPREHENSIVE:
+        result = await agent.generate_comprehensive_report(text, comparison_text)
+        formatter = agent.format_comprehensive_report
+    elif analysis_type == AnalysisType.BASIC:
+        result = await agent.analyze(text)
+        formatter = agent._format_basic_analysis
+    elif analysis_type == AnalysisType.FAILURE:
+        result = await agent.analyze_failure_points(text)
+        formatter = agent._format_failure_analysis
+    elif analysis_type == AnalysisType.PERFORMANCE:
+        result = await agent.analyze_performance(text)
+        formatter = agent._format_performance_analysis
+    elif analysis_type == AnalysisType.INTEGRATION:
+        result = await agent.analyze_integration(text)
+        formatter = agent._format_integration_analysis
+    else:
+        raise HTTPException(status_code=400, detail=f"Unsupported analysis type: {analysis_type.value}")
+    with request_profiler.segment("format"):
+        return formatter(result)
+
 # API Endpoints
 @app.get("/", response_model=HealthResponse)
 async def root():
@@ -105,65 +440,169 @@ async def health_check():
         timestamp=datetime.now().isoformat()
     )
 
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness probe: 200 once warm-up finished and the LLM endpoint (or stand-in) answers
+    
+    Unlike /health (liveness), this returns 503 while warming up, after a failed
+    warm-up, or when the provider is unreachable or rejects our credentials.
+    """
+    provider = await probe_provider() if warmup_state["state"] == "done" else {}
+    ready = warmup_state["state"] == "done" and provider.get("reachable", False) and provider.get("authorized", False)
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "ready": ready,
+            "warmup": warmup_state,
+            "provider": {k: v for k, v in provider.items() if not k.startswith("_")},
+            "timestamp": datetime.now().isoformat()
+        }
+    )
+
 @app.post("/api/analyze", response_model=AnalysisResponse)
-async def analyze_architecture(request: AnalysisRequest):
+async def analyze_architecture(request: AnalysisRequest, http_request: Request):
     """
     Analyze architecture from text input
     
     Args:
         request: Analysis request containing text and configuration
+        http_request: Raw HTTP request, used to detect client disconnects
         
     Returns:
         AnalysisResponse with the generated report
     """
+    if recorder is None:
+        return await _analyze_architecture(request, http_request)
+    
+    with recorder.capture(
+        request.text,
+        endpoint=http_request.url.path,
+        analysis_type=request.analysis_type,
+        model_name=request.model_name,
+        priority=http_request.headers.get("x-priority", PriorityClass.INTERACTIVE.value),
+        tenant=resolve_tenant(http_request)
+    ) as capture:
+        return await _analyze_architecture(request, http_request, capture.observe)
+
+async def _analyze_architecture(
+    request: AnalysisRequest,
+    http_request: Request,
+    call_observer: Optional[Callable] = None
+) -> AnalysisResponse:
+    """Run one analysis request (shared by /api/analyze and /api/analyze-file)"""
+    # /api/analyze-file starts its own profile so upload decoding is included
+    profile = parse_profile(http_request) if request_profiler.active() is None else None
+    with profile.capture() if profile is not None else nullcontext():
+        response = await execute_analysis(
+            request,
+            priority=parse_priority(http_request),
+            tenant=resolve_tenant(http_request),
+            deadline_seconds=parse_deadline(http_request),
+            call_observer=call_observer,
+            # Cancel the analysis (queued or running) if the client disconnects
+            supervise=lambda work: run_until_disconnected(http_request, work)
+        )
+    if profile is not None:
+        response.profile = profile.to_dict()
+    return response
+
+async def execute_analysis(
+    request: AnalysisRequest,
+    priority: PriorityClass,
+    tenant: str,
+    deadline_seconds: Optional[float] = None,
+    call_observer: Optional[Callable] = None,
+    supervise: Optional[Callable[[Awaitable[str]], Awaitable[str]]] = None
+) -> AnalysisResponse:
+    """
+    Plan, admit, schedule and run one analysis
+    
+    Errors are raised as HTTPException so every caller maps them the same way.
+    supervise wraps the scheduled work (e.g. disconnect watching); without it
+    the work is awaited directly.
+    """
     try:
         logger.info(f"Received analysis request - Type: {request.analysis_type}")
         
         # Validate analysis type
-        try:
-            analysis_type = AnalysisType(request.analysis_type.lower())
-        except ValueError:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Invalid analysis type. Must be one of: {[t.value for t in AnalysisType]}"
-            )
+        analysis_type = parse_analysis_type(request.analysis_type)
+        deadline = time.monotonic() + deadline_seconds if deadline_seconds is not None else None
         
         # Create config
         config = get_config()
         config.model_name = request.model_name or "gpt-4"
         
-        # Create agent
-        agent = EnhancedArchitecturalAnalystAgent(config)
-        
-        # Perform analysis based on type
-        if analysis_type == AnalysisType.COMPREHENSIVE:
-            report = await agent.generate_comprehensive_report(request.text)
-            content = agent.format_comprehensive_report(report)
-        elif analysis_type == AnalysisType.BASIC:
-            analysis = await agent.analyze(request.text)
-            content = agent._format_basic_analysis(analysis)
-        elif analysis_type == AnalysisType.FAILURE:
-            analysis = await agent.analyze_failure_points(request.text)
-            content = agent._format_failure_analysis(analysis)
-        elif analysis_type == AnalysisType.PERFORMANCE:
-            analysis = await agent.analyze_performance(request.text)
-            content = agent._format_performance_analysis(analysis)
-        elif analysis_type == AnalysisType.INTEGRATION:
-            analysis = await agent.analyze_integration(request.text)
-            content = agent._format_integration_analysis(analysis)
-        else:
-            raise HTTPException(status_code=400, detail=f"Unsupported analysis type: {analysis_type.value}")
+        # Pre-flight budget check before any tokens are spent; tokenizing a large upload
+        # is CPU-bound, so planning runs off the event loop
+        comparison_text = request.comparison_text if analysis_type == AnalysisType.COMPREHENSIVE else None
+        plan = await asyncio.to_thread(plan_analysis, config, request.text, analysis_type, comparison_text)
+        # Optional stages (comparison) must not count against the deadline at admission
+        required_seconds = (
+            await asyncio.to_thread(
+                plan_analysis, config, request.text, analysis_type, document_keys=plan.document_keys
+            )
+            if comparison_text else plan
+        ).expected_latency_seconds
+        tokens = plan.total_input_tokens + plan.total_output_tokens
+        
+        # Shed load now rather than failing deep in the pipeline after spending tokens
+        admission.check(tokens, required_seconds, deadline_seconds)
+        
+        # Create agent; cached stage results are scoped to the tenant
+        config.enable_cache = not request.no_cache
+        agent = EnhancedArchitecturalAnalystAgent(config, client=llm_client)
+        agent.cache_namespace = tenant
+        agent.input_budget = plan.input_budget
+        agent.call_observer = call_observer
+        agent.deadline = deadline
+        agent.stage_estimates = {stage.stage: stage.latency_seconds for stage in plan.stages}
+        
+        # Token-cost-aware fair scheduling: a 4-stage report costs more than one stage
+        cost = tokens / 1000
+        
+        async def scheduled_analysis() -> str:
+            with admission.admitted(tokens):
+                async with scheduler.slot(tenant, priority, cost):
+                    if deadline is not None:
+                        admission.recheck(required_seconds, deadline - time.monotonic())
+                    started = time.perf_counter()
+                    content = await run_analysis(
+                        agent, analysis_type, request.text, comparison_text, plan.document_keys
+                    )
+                    admission.record_service(required_seconds, time.perf_counter() - started)
+                    return content
+        
+        work = scheduled_analysis()
+        content = await (supervise(work) if supervise is not None else work)
         
         logger.info(f"Analysis completed successfully - Type: {request.analysis_type}")
+        report_id = store_report(agent.last_report) if REPORT_DIR and agent.last_report is not None else None
+        session_id = None
+        if request.create_session and agent.last_report is not None:
+            # Tokenizing and indexing the source text is CPU-bound; keep it off the event loop
+            session = await asyncio.to_thread(qa_sessions.create, agent.last_report, request.text, config.model_name)
+            session_id = session.id
         
         return AnalysisResponse(
             success=True,
             analysis_type=request.analysis_type,
             report=content,
             generated_at=datetime.now().isoformat(),
-            message="Analysis completed successfully"
+            message="Analysis completed successfully",
+            stage_timings=agent.last_run.summary() if agent.last_run else None,
+            report_id=report_id,
+            session_id=session_id
         )
         
+    except HTTPException:
+        raise
+    except AdmissionRejected as e:
+        logger.warning(f"Request shed ({e.reason}): {str(e)}")
+        raise overloaded(e)
+    except BudgetExceededError as e:
+        logger.warning(f"Budget exceeded: {str(e)}")
+        raise HTTPException(status_code=413, detail=f"Budget exceeded: {str(e)}")
     except ValueError as e:
         logger.error(f"Configuration error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Configuration error: {str(e)}")
@@ -171,8 +610,33 @@ async def analyze_architecture(request: AnalysisRequest):
         logger.error(f"Analysis error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
+@app.post("/api/estimate")
+async def estimate_analysis(request: AnalysisRequest):
+    """
+    Estimate tokens, chunks, cost and latency for an analysis without calling the LLM
+    
+    Args:
+        request: Analysis request containing text and configuration
+        
+    Returns:
+        The pre-flight plan, including per-stage budgets and totals
+    """
+    analysis_type = parse_analysis_type(request.analysis_type)
+    
+    config = get_config(require_api_key=False)
+    config.model_name = request.model_name or "gpt-4"
+    
+    comparison_text = request.comparison_text if analysis_type == AnalysisType.COMPREHENSIVE else None
+    try:
+        plan = await asyncio.to_thread(plan_analysis, config, request.text, analysis_type, comparison_text)
+    except BudgetExceededError as e:
+        raise HTTPException(status_code=413, detail=f"Budget exceeded: {str(e)}")
+    
+    return plan.to_dict()
+
 @app.post("/api/analyze-file", response_model=AnalysisResponse)
 async def analyze_from_file(
+    http_request: Request,
     file: UploadFile = File(...),
     analysis_type: str = "comprehensive",
     model_name: Optional[str] = "gpt-4"
@@ -191,26 +655,372 @@ async def analyze_from_file(
     try:
         logger.info(f"Received file upload - Filename: {file.filename}")
         
-        # Read file content
-        content = await file.read()
-        text = content.decode('utf-8')
-        
-        # Create analysis request
-        request = AnalysisRequest(
-            text=text,
-            analysis_type=analysis_type,
-            model_name=model_name
-        )
-        
-        # Delegate to analyze endpoint
-        return await analyze_architecture(request)
+        profile = parse_profile(http_request)
+        with profile.capture() if profile is not None else nullcontext():
+            # Read file content
+            with request_profiler.segment("decode"):
+                content = await file.read()
+                text = content.decode('utf-8')
+            
+            # Create analysis request
+            request = AnalysisRequest(
+                text=text,
+                analysis_type=analysis_type,
+                model_name=model_name
+            )
+            
+            # Delegate to analyze endpoint
+            response = await analyze_architecture(request, http_request)
+        if profile is not None:
+            response.profile = profile.to_dict()
+        return response
         
+    except HTTPException:
+        raise
     except UnicodeDecodeError:
         raise HTTPException(status_code=400, detail="File must be UTF-8 encoded text")
     except Exception as e:
         logger.error(f"File upload error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"File processing failed: {str(e)}")
 
+# Upper bound on documents per /api/analyze-batch call
+MAX_BATCH_DOCUMENTS = int(os.getenv("ANALYZER_MAX_BATCH_DOCUMENTS", "100"))
+
+class BatchDocument(BaseModel):
+    """One document of a batch, with its caller-facing identifier"""
+    index: int
+    id: str
+    request: Optional[AnalysisRequest] = None
+    error: Optional[str] = None
+
+async def read_batch_documents(http_request: Request) -> list:
+    """
+    Parse a batch from multipart files or a JSON array
+    
+    Multipart: one or more `files` parts plus optional `analysis_type` / `model_name` fields.
+    JSON: an array of AnalysisRequest objects, or {"documents": [...]} with shared defaults.
+    Per-document problems (bad encoding) become item errors instead of failing the batch.
+    """
+    content_type = http_request.headers.get("content-type", "")
+    documents = []
+    
+    if content_type.startswith("multipart/form-data"):
+        form = await http_request.form()
+        analysis_type = str(form.get("analysis_type") or "comprehensive")
+        model_name = str(form.get("model_name") or "gpt-4")
+        for index, upload in enumerate(form.getlist("files")):
+            if not hasattr(upload, "read"):
+                continue
+            doc_id = upload.filename or f"document-{index}"
+            try:
+                text = (await upload.read()).decode("utf-8")
+            except UnicodeDecodeError:
+                documents.append(BatchDocument(index=index, id=doc_id, error="File must be UTF-8 encoded text"))
+                continue
+            documents.append(BatchDocument(
+                index=index,
+                id=doc_id,
+                request=AnalysisRequest(text=text, analysis_type=analysis_type, model_name=model_name)
+            ))
+    else:
+        try:
+            body = await http_request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be multipart/form-data or a JSON array")
+        defaults = {}
+        if isinstance(body, dict):
+            defaults = {k: body[k] for k in ("analysis_type", "model_name") if k in body}
+            body = body.get("documents")
+        if not isinstance(body, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array of documents")
+        for index, item in enumerate(body):
+            item = {"text": item} if isinstance(item, str) else item
+            doc_id = str(item.get("id", f"document-{index}")) if isinstance(item, dict) else f"document-{index}"
+            try:
+                request = AnalysisRequest.model_validate({**defaults, **item})
+            except (ValidationError, TypeError) as e:
+                documents.append(BatchDocument(index=index, id=doc_id, error=str(e)))
+                continue
+            documents.append(BatchDocument(index=index, id=doc_id, request=request))
+    
+    if not documents:
+        raise HTTPException(status_code=400, detail="Batch contains no documents")
+    if len(documents) > MAX_BATCH_DOCUMENTS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch has {len(documents)} documents; the limit is {MAX_BATCH_DOCUMENTS}"
+        )
+    return documents
+
+@app.post("/api/analyze-batch")
+async def analyze_batch(http_request: Request):
+    """
+    Analyze many documents in one call, streaming NDJSON results as they complete
+    
+    Documents run concurrently through the shared scheduler (default class: batch)
+    and the process-wide LLM concurrency limiter. Each line carries the document
+    index, id and its own status, so one failure does not sink the batch.
+    """
+    documents = await read_batch_documents(http_request)
+    priority = parse_priority(http_request, default=PriorityClass.BATCH)
+    tenant = resolve_tenant(http_request)
+    deadline_seconds = parse_deadline(http_request)
+    # Keep one batch from filling the whole queue (and tripping admission control)
+    fan_out = asyncio.Semaphore(scheduler.max_concurrent)
+    
+    async def process(document: BatchDocument) -> dict:
+        item = {"index": document.index, "id": document.id}
+        if document.error is not None:
+            return {**item, "status": "error", "status_code": 400, "error": document.error}
+        try:
+            async with fan_out:
+                response = await execute_analysis(document.request, priority, tenant, deadline_seconds)
+        except HTTPException as e:
+            metrics.incr("batch.items.failed")
+            return {**item, "status": "error", "status_code": e.status_code, "error": e.detail}
+        metrics.incr("batch.items.completed")
+        return {**item, "status": "ok", "status_code": 200, **response.model_dump()}
+    
+    async def stream():
+        metrics.incr("batch.requests")
+        tasks = [asyncio.create_task(process(document)) for document in documents]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done, ensure_ascii=False) + "\n"
+        finally:
+            # Client went away mid-stream: stop the remaining documents
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+class SessionRequest(BaseModel):
+    report_id: Optional[str] = Field(default=None, description="A stored report (see /api/reports)")
+    report: Optional[ComprehensiveArchitectureReport] = Field(default=None, description="Or the report itself")
+    text: Optional[str] = Field(default=None, description="Optional source text, indexed alongside the report")
+    model_name: Optional[str] = Field(default="gpt-4", description="LLM model used for answers")
+
+class QuestionRequest(BaseModel):
+    question: str = Field(..., min_length=1, description="Follow-up question about the analyzed system")
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """One server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def get_session(session_id: str):
+    session = qa_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    return session
+
+@app.post("/api/sessions")
+async def create_session(request: SessionRequest):
+    """
+    Start a follow-up Q&A session from a stored or inline comprehensive report
+    
+    The report's entities (and the source text, if given) are indexed once;
+    questions are then answered from that compact context. Sessions can also
+    be created by /api/analyze with create_session=true.
+    """
+    report = request.report
+    if report is None:
+        if request.report_id is None:
+            raise HTTPException(status_code=400, detail="Provide report_id or report")
+        payload = await asyncio.to_thread(stored_report_path(request.report_id).read_bytes)
+        try:
+            report = ComprehensiveArchitectureReport.model_validate_json(payload)
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=f"Stored report is not a comprehensive report: {e.error_count()} errors")
+    session = await asyncio.to_thread(qa_sessions.create, report, request.text, request.model_name or "gpt-4")
+    return {**session.info(), "ttl_seconds": qa_sessions.ttl_seconds}
+
+@app.get("/api/sessions/{session_id}")
+async def get_session_info(session_id: str):
+    """Session details and its question history"""
+    session = get_session(session_id)
+    return {
+        **session.info(),
+        "history": [{"question": q, "answer": a} for q, a in session.history]
+    }
+
+@app.delete("/api/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """End a session and free its context"""
+    if not qa_sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    return {"deleted": session_id}
+
+@app.post("/api/sessions/{session_id}/ask")
+async def ask_session(session_id: str, request: QuestionRequest):
+    """
+    Answer a follow-up question as a server-sent event stream
+    
+    Events: `context` (the retrieved passages used), `delta` (answer text as it
+    is generated), then `done` or `error`. Closing the connection stops the
+    provider stream.
+    """
+    session = get_session(session_id)
+    messages, passages = build_messages(session, request.question)
+    client = llm_client
+    if client is None:
+        client = instructor.patch(AsyncOpenAI(api_key=get_config().api_key))
+    
+    async def stream():
+        yield sse_event("context", {"passages": [{"id": p.id, "kind": p.kind} for p in passages]})
+        started = time.perf_counter()
+        try:
+            async for delta in answer_stream(session, messages, request.question, client):
+                yield sse_event("delta", {"text": delta})
+        except Exception as e:
+            logger.error(f"Follow-up answer failed: {str(e)}")
+            yield sse_event("error", {"error": str(e)})
+            return
+        yield sse_event("done", {"seconds": round(time.perf_counter() - started, 3), "questions": len(session.history)})
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+class DiffRequest(BaseModel):
+    before: ComprehensiveArchitectureReport
+    after: ComprehensiveArchitectureReport
+    format: str = Field(default="json", description="json or markdown")
+
+@app.post("/api/diff")
+async def diff_report_versions(request: DiffRequest):
+    """
+    Structured diff between two comprehensive reports of the same system
+    
+    Entities (components, data flows, vulnerabilities, technologies, metrics)
+    are matched by normalized key, so the cost is linear in the report size.
+    """
+    diff = diff_reports(request.before, request.after)
+    response = diff.to_dict()
+    if request.format == "markdown":
+        response["markdown"] = format_diff_markdown(diff)
+    return response
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Get process-wide runtime counters (structured-output repairs, re-asks, ...)"""
+    return {
+        "metrics": metrics.snapshot(),
+        "hedging": hedger.stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/scheduler")
+async def get_scheduler_stats():
+    """Get queue depth, wait-time percentiles and weights per priority class"""
+    return {
+        "scheduler": scheduler.stats(),
+        "admission": admission.stats(),
+        "sessions": qa_sessions.stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/concurrency")
+async def get_concurrency():
+    """Get the current adaptive LLM concurrency limit and its recent adjustments"""
+    return {
+        "concurrency": llm_limiter.state(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/schemas")
+async def get_schemas(full: bool = False):
+    """Get per-stage schema token savings; full=true also returns the documented schemas"""
+    response = {
+        "compact_enabled": get_config(require_api_key=False).compact_schemas,
+        "savings": compact_schemas.schema_savings(STAGE_MODELS),
+        "timestamp": datetime.now().isoformat()
+    }
+    if full:
+        response["schemas"] = {
+            stage: json.loads(compact_schemas.full_schema(model)) for stage, model in STAGE_MODELS.items()
+        }
+    return response
+
+REPORT_ID_PATTERN = re.compile(r"^[\w-]+$")
+
+@lru_cache(maxsize=1)
+def report_formatter() -> EnhancedArchitecturalAnalystAgent:
+    """Agent used only for markdown formatting of stored reports (never calls the LLM)"""
+    return EnhancedArchitecturalAnalystAgent(get_config(require_api_key=False), client=llm_client)
+
+def stored_report_path(report_id: str) -> Path:
+    """Path of a stored report, or 404 (ids are file stems; no path separators)"""
+    path = report_directory.directory / f"{report_id}.json"
+    if not REPORT_ID_PATTERN.match(report_id) or not path.is_file():
+        raise HTTPException(status_code=404, detail=f"Report '{report_id}' not found")
+    return path
+
+@app.get("/api/reports")
+async def list_reports(limit: int = 50):
+    """List stored comprehensive reports, newest first"""
+    directory = report_directory.directory
+    paths = sorted(directory.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True) if directory.exists() else []
+    return {
+        "reports": [
+            {
+                "id": path.stem,
+                "bytes": path.stat().st_size,
+                "modified": datetime.fromtimestamp(path.stat().st_mtime).isoformat()
+            }
+            for path in paths[:max(limit, 0)]
+        ],
+        "total": len(paths)
+    }
+
+@app.get("/api/reports/{report_id}")
+async def get_report(report_id: str, http_request: Request, format: str = "json"):
+    """
+    Fetch a stored report as JSON or markdown
+    
+    Responses carry a content-hash ETag; a matching If-None-Match returns
+    304 without a body, so clients can re-validate a report they already have.
+    """
+    if format not in ("json", "markdown"):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'markdown'")
+    path = stored_report_path(report_id)
+    
+    payload = await asyncio.to_thread(path.read_bytes)
+    etag = content_etag(format.encode("utf-8"), payload)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(http_request.headers.get("if-none-match"), etag):
+        metrics.incr("reports.not_modified")
+        return Response(status_code=304, headers=headers)
+    
+    if format == "json":
+        return Response(content=payload, media_type="application/json", headers=headers)
+    try:
+        report = ComprehensiveArchitectureReport.model_validate_json(payload)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=f"Stored report is not a comprehensive report: {e.error_count()} errors")
+    markdown = report_formatter().format_comprehensive_report(report)
+    return Response(content=markdown, media_type="text/markdown; charset=utf-8", headers=headers)
+
+@app.get("/api/analytics")
+async def get_analytics(top: int = 10, min_reports: int = 1):
+    """
+    Fleet-wide aggregates over stored comprehensive reports
+    
+    Most often critical component types, mean api_compatibility_score per
+    technology and the most frequent single points of failure. Only new or
+    changed report files are re-read between calls.
+    """
+    if top < 1 or min_reports < 1:
+        raise HTTPException(status_code=400, detail="top and min_reports must be positive")
+    columns = await asyncio.to_thread(report_directory.columns)
+    summary = report_analytics.summarize(columns, top, min_reports)
+    summary["directory"] = str(report_directory.directory)
+    summary["skipped_files"] = report_directory.skipped
+    summary["timestamp"] = datetime.now().isoformat()
+    return summary
+
 @app.get("/api/analysis-types")
 async def get_analysis_types():
     """Get available analysis types"""
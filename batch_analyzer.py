@@ -0,0 +1,175 @@
+"""
+واجهة التحليل الدفعي (Batch Analysis CLI)
+تحليل شامل لمجموعة مستندات دفعة واحدة وحفظ تقرير Markdown و JSON لكل مستند.
+
+الأوضاع:
+    batch-api    مهمة Batch لدى المزوّد (أرخص، بدون حدود المعدل التفاعلية، زمن غير تفاعلي)
+    interactive  استدعاءات عادية متزامنة تحت حد التزامن المشترك
+
+الاستخدام:
+    python batch_analyzer.py sessions/*.txt --output-dir reports
+    python batch_analyzer.py sessions/ --mode interactive
+    python batch_analyzer.py sessions/*.txt --standin      # بدون اتصال: خادم batch محلي بديل
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from rich.console import Console
+from rich.table import Table
+
+from enhanced_analyzer import (
+    AppConfig,
+    ComprehensiveArchitectureReport,
+    ConfigManager,
+    EnhancedArchitecturalAnalystAgent,
+    stage_models_for,
+)
+from mapped_document import MappedDocument
+from token_planner import TokenBudgetPlanner
+
+console = Console()
+
+Outcome = Union[ComprehensiveArchitectureReport, BaseException]
+
+
+def collect_documents(inputs: List[str]) -> Dict[str, Path]:
+    """الملفات المدخلة (أو ملفات .txt/.md داخل المجلدات) بمعرّف هو اسم الملف؛ لا تُقرأ هنا"""
+    documents: Dict[str, Path] = {}
+    for item in inputs:
+        path = Path(item)
+        paths = sorted(p for p in path.iterdir() if p.suffix in (".txt", ".md")) if path.is_dir() else [path]
+        for p in paths:
+            documents[p.stem] = p
+    return documents
+
+
+def load_prompt_text(path: Path, input_budget: int, model: str) -> str:
+    """بداية المستند ضمن ميزانية الإدخال فقط (المراحل لا ترى أكثر منها)، من ملف مُعيَّن في الذاكرة"""
+    with MappedDocument(str(path)) as document:
+        return document.prefix(input_budget, model)
+
+
+def load_documents(
+    config: AppConfig, documents: Dict[str, Path]
+) -> Tuple[Dict[str, str], Dict[str, BaseException]]:
+    """نصوص المستندات التي أمكن قراءتها، وخطأ كل مستند تعذّرت قراءته (ملف مفقود أو ترميز غير UTF-8)"""
+    input_budget = TokenBudgetPlanner(config, stage_models_for(config)).input_budget()
+    texts: Dict[str, str] = {}
+    failures: Dict[str, BaseException] = {}
+    for doc_id, path in documents.items():
+        try:
+            texts[doc_id] = load_prompt_text(path, input_budget, config.model_name)
+        except Exception as e:
+            failures[doc_id] = e
+    return texts, failures
+
+
+async def run_interactive(config: AppConfig, documents: Dict[str, Path]) -> Dict[str, Outcome]:
+    async def one(path: Path) -> ComprehensiveArchitectureReport:
+        agent = EnhancedArchitecturalAnalystAgent(config)
+        return await agent.generate_comprehensive_report(load_prompt_text(path, agent.input_budget, agent.model))
+
+    results = await asyncio.gather(*(one(path) for path in documents.values()), return_exceptions=True)
+    return dict(zip(documents, results))
+
+
+def save_outcomes(config: AppConfig, outcomes: Dict[str, Outcome], output_dir: Path) -> None:
+    output_dir.mkdir(parents=True, exist_ok=True)
+    formatter = EnhancedArchitecturalAnalystAgent(config)
+
+    table = Table(title=f"📦 Batch results — {len(outcomes)} documents")
+    table.add_column("Document", style="cyan")
+    table.add_column("Status")
+    table.add_column("Components", justify="right")
+    table.add_column("Vulnerabilities", justify="right")
+    table.add_column("Output")
+
+    for doc_id, outcome in outcomes.items():
+        if isinstance(outcome, BaseException):
+            table.add_row(doc_id, "[red]failed[/red]", "", "", str(outcome)[:80])
+            continue
+        (output_dir / f"{doc_id}.json").write_text(outcome.model_dump_json(indent=2), encoding="utf-8")
+        (output_dir / f"{doc_id}.md").write_text(formatter.format_comprehensive_report(outcome), encoding="utf-8")
+        table.add_row(
+            doc_id,
+            "[green]ok[/green]",
+            str(len(outcome.basic_analysis.core_components)),
+            str(len(outcome.failure_analysis.critical_vulnerabilities)),
+            str(output_dir / f"{doc_id}.md"),
+        )
+    console.print(table)
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Outcome]:
+    standin = None
+    if args.standin:
+        from batch_standin import build_standin
+        from traffic_replay import start_mock_llm
+
+        standin = await start_mock_llm(build_standin(args.standin_delay), 0)
+        port = standin.servers[0].sockets[0].getsockname()[1]
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{port}/v1"
+        os.environ.setdefault("OPENAI_API_KEY", "standin")
+
+    try:
+        config = ConfigManager.load_config()
+        if args.model:
+            config.model_name = args.model
+        documents = collect_documents(args.inputs)
+        console.print(f"Loaded {len(documents)} documents ({args.mode} mode)")
+
+        if args.mode == "batch-api":
+            from provider_batch import run_batch_reports
+            # مستند لا يُقرأ يفشل وحده كما في الوضع التفاعلي، ولا يُرسل في الدفعة
+            texts, failures = load_documents(config, documents)
+            reports = await run_batch_reports(
+                config,
+                texts,
+                poll_interval=args.poll_interval if args.poll_interval is not None else config.batch_poll_interval,
+                completion_window=config.batch_completion_window
+            ) if texts else {}
+            outcomes = {
+                doc_id: failures[doc_id] if doc_id in failures else reports[doc_id]
+                for doc_id in documents
+            }
+        else:
+            outcomes = await run_interactive(config, documents)
+
+        save_outcomes(config, outcomes, Path(args.output_dir))
+        return outcomes
+    finally:
+        if standin is not None:
+            standin.should_exit = True
+            await standin.task
+
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run comprehensive analyses for many documents")
+    parser.add_argument("inputs", nargs="+", help="Text files, or directories of .txt/.md files")
+    parser.add_argument("--output-dir", default="reports", help="Where to write <doc>.md and <doc>.json")
+    parser.add_argument("--mode", choices=["batch-api", "interactive"], default="batch-api",
+                        help="Provider Batch API job (default) or concurrent interactive calls")
+    parser.add_argument("--model", help="Override the model name")
+    parser.add_argument("--poll-interval", type=float, help="Seconds between batch status polls")
+    parser.add_argument("--standin", action="store_true",
+                        help="Run against an in-process stand-in batch server (offline)")
+    parser.add_argument("--standin-delay", type=float, default=0.5,
+                        help="Simulated batch processing time for --standin (default: 0.5)")
+    args = parser.parse_args(argv)
+    if args.standin and args.poll_interval is None:
+        args.poll_interval = 0.2
+    return args
+
+
+if __name__ == "__main__":
+    try:
+        results = asyncio.run(run(parse_arguments()))
+    except KeyboardInterrupt:
+        print("\nBatch interrupted by user")
+        sys.exit(0)
+    sys.exit(1 if any(isinstance(r, BaseException) for r in results.values()) else 0)
@@ -0,0 +1,222 @@
+"""
+خادم Batch API محلي بديل (Local Stand-in Batch Server)
+ينفّذ في الذاكرة الجزء المستخدم من واجهات OpenAI للملفات والدفعات (/v1/files، /v1/batches)
+ولـ /v1/chat/completions، ويولّد لكل طلب استجابة أداة صالحة مشتقة من مخطط JSON الخاص بها.
+يتيح اختبار وضع الـ batch دون اتصال ودون تكلفة.
+
+الاستخدام:
+    uvicorn batch_standin:app --port 8100
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 python batch_analyzer.py docs/*.txt
+"""
+
+import asyncio
+import itertools
+import json
+import time
+from typing import Any, Dict, Optional
+
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.responses import Response, StreamingResponse
+
+from token_planner import estimate_tokens
+
+_PLACEHOLDER = "stand-in"
+
+
+# =================================================================================================
+# توليد استجابات من المخطط (Schema-driven Responses)
+# =================================================================================================
+
+def synthesize(schema: Dict[str, Any], defs: Optional[Dict[str, Any]] = None) -> Any:
+    """أصغر قيمة صالحة لمخطط JSON (يدعم $ref و anyOf و enum وحدود الأرقام)"""
+    defs = defs if defs is not None else schema.get("$defs", {})
+    if "$ref" in schema:
+        return synthesize(defs[schema["$ref"].split("/")[-1]], defs)
+    if "anyOf" in schema:
+        options = [s for s in schema["anyOf"] if s.get("type") != "null"]
+        return synthesize(options[0], defs) if options else None
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "const" in schema:
+        return schema["const"]
+
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: synthesize(prop, defs) for name, prop in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [synthesize(schema.get("items", {}), defs)]
+    if kind in ("number", "integer"):
+        low = schema.get("minimum", schema.get("exclusiveMinimum"))
+        high = schema.get("maximum", schema.get("exclusiveMaximum"))
+        value = low if low is not None else (min(1, high) if high is not None else 1)
+        if high is not None and low is not None:
+            value = (low + high) / 2
+        return int(value) if kind == "integer" else float(value)
+    if kind == "boolean":
+        return False
+    return _PLACEHOLDER
+
+
+def reply_text(body: dict) -> str:
+    """إجابة نصية ثابتة لطلبات بلا أدوات (أسئلة المتابعة)"""
+    question = next((m.get("content") for m in reversed(body.get("messages", [])) if m.get("role") == "user"), "")
+    return f"إجابة بديلة عن: {str(question)[:80]}"
+
+
+def stream_chunks(body: dict, n: int):
+    """نفس الإجابة النصية كأحداث SSE من نوع chat.completion.chunk (كلمة لكل حدث)"""
+    base = {"id": f"standin-{n}", "object": "chat.completion.chunk", "created": int(time.time()), "model": body.get("model", "standin")}
+    words = reply_text(body).split(" ")
+    for i, word in enumerate(words):
+        delta = {"role": "assistant", "content": word} if i == 0 else {"content": f" {word}"}
+        yield f"data: {json.dumps({**base, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]}, ensure_ascii=False)}\n\n"
+    yield f"data: {json.dumps({**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+def complete(body: dict, n: int) -> dict:
+    """استجابة chat.completion بأداة مطلوبة واحدة، أو نصية إن لم تُطلب أداة"""
+    if not body.get("tools"):
+        content = reply_text(body)
+        prompt_tokens = sum(estimate_tokens(str(m.get("content") or "")) for m in body.get("messages", []))
+        return {
+            "id": f"standin-{n}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "standin"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": estimate_tokens(content),
+                "total_tokens": prompt_tokens + estimate_tokens(content),
+            },
+        }
+    function = body["tools"][0]["function"]
+    arguments = json.dumps(synthesize(function["parameters"]), ensure_ascii=False)
+    prompt_tokens = sum(estimate_tokens(str(m.get("content") or "")) for m in body.get("messages", []))
+    completion_tokens = estimate_tokens(arguments)
+    return {
+        "id": f"standin-{n}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "standin"),
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": f"call_{n}",
+                    "type": "function",
+                    "function": {"name": function["name"], "arguments": arguments},
+                }],
+            },
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+# =================================================================================================
+# الخادم (Server)
+# =================================================================================================
+
+def build_standin(processing_seconds: float = 0.5) -> FastAPI:
+    standin = FastAPI(title="Stand-in Batch API")
+    files: Dict[str, dict] = {}
+    batches: Dict[str, dict] = {}
+    ids = itertools.count(1)
+
+    def store(content: bytes, filename: str, purpose: str) -> dict:
+        file_id = f"file-{next(ids)}"
+        files[file_id] = {
+            "meta": {
+                "id": file_id,
+                "object": "file",
+                "bytes": len(content),
+                "created_at": int(time.time()),
+                "filename": filename,
+                "purpose": purpose,
+                "status": "processed",
+            },
+            "content": content,
+        }
+        return files[file_id]["meta"]
+
+    async def process(batch: dict) -> None:
+        batch["status"] = "in_progress"
+        batch["in_progress_at"] = int(time.time())
+        lines = [json.loads(l) for l in files[batch["input_file_id"]]["content"].decode("utf-8").splitlines() if l.strip()]
+        batch["request_counts"] = {"total": len(lines), "completed": 0, "failed": 0}
+        await asyncio.sleep(processing_seconds)
+
+        outputs = []
+        for line in lines:
+            outputs.append({
+                "id": f"batch_req_{next(ids)}",
+                "custom_id": line["custom_id"],
+                "response": {"status_code": 200, "request_id": line["custom_id"], "body": complete(line["body"], next(ids))},
+                "error": None,
+            })
+            batch["request_counts"]["completed"] += 1
+        payload = "\n".join(json.dumps(o, ensure_ascii=False) for o in outputs).encode("utf-8")
+        batch["output_file_id"] = store(payload, f"{batch['id']}_output.jsonl", "batch_output")["id"]
+        batch["status"] = "completed"
+        batch["completed_at"] = int(time.time())
+
+    @standin.post("/v1/chat/completions")
+    async def chat_completions(body: dict):
+        """الوضع التفاعلي أيضاً، ليعمل --mode interactive دون اتصال"""
+        if body.get("stream"):
+            return StreamingResponse(stream_chunks(body, next(ids)), media_type="text/event-stream")
+        return complete(body, next(ids))
+
+    @standin.get("/v1/models")
+    async def list_models():
+        """فحص الجاهزية والتسخين في الخادم (/ready)"""
+        return {"object": "list", "data": [{"id": "standin", "object": "model", "created": 0, "owned_by": "standin"}]}
+
+    @standin.post("/v1/files")
+    async def upload_file(file: UploadFile = File(...), purpose: str = Form(...)):
+        return store(await file.read(), file.filename or "upload.jsonl", purpose)
+
+    @standin.get("/v1/files/{file_id}/content")
+    async def file_content(file_id: str):
+        if file_id not in files:
+            raise HTTPException(status_code=404, detail=f"No such file '{file_id}'")
+        return Response(content=files[file_id]["content"], media_type="application/jsonl")
+
+    @standin.post("/v1/batches")
+    async def create_batch(body: dict):
+        if body.get("input_file_id") not in files:
+            raise HTTPException(status_code=400, detail="Unknown input_file_id")
+        batch_id = f"batch_{next(ids)}"
+        batches[batch_id] = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": body.get("endpoint", "/v1/chat/completions"),
+            "input_file_id": body["input_file_id"],
+            "completion_window": body.get("completion_window", "24h"),
+            "status": "validating",
+            "created_at": int(time.time()),
+            "output_file_id": None,
+            "error_file_id": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        batches[batch_id]["task"] = asyncio.create_task(process(batches[batch_id]))
+        return {k: v for k, v in batches[batch_id].items() if k != "task"}
+
+    @standin.get("/v1/batches/{batch_id}")
+    async def retrieve_batch(batch_id: str):
+        if batch_id not in batches:
+            raise HTTPException(status_code=404, detail=f"No such batch '{batch_id}'")
+        return {k: v for k, v in batches[batch_id].items() if k != "task"}
+
+    return standin
+
+
+app = build_standin()
@@ -0,0 +1,110 @@
+"""
+المخططات المضغوطة لنماذج الاستجابة (Compact Response Schemas)
+instructor يرسل مخطط JSON الكامل لنموذج الاستجابة مع كل استدعاء، بما فيه الأوصاف
+العربية الطويلة وعناوين الحقول. هنا تُبنى مرة واحدة نسخة مضغوطة من كل نموذج
+(صنف فرعي بنفس الاسم والقيود) بأوصاف مقتضبة وبدون عناوين، وتبقى الأوصاف الكاملة
+في النماذج الأصلية للتوثيق.
+"""
+
+import json
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple, Type, Union, get_args, get_origin
+
+from pydantic import BaseModel, ConfigDict
+from pydantic.fields import FieldInfo
+
+from token_planner import schema_tokens
+
+# أوصاف مقتضبة للحقول التي لا يكفي اسمها وحده؛ باقي الحقول تُرسل بلا وصف
+TERSE_DESCRIPTIONS: Dict[Tuple[str, str], str] = {
+    ("SystemComponent", "name"): "e.g. 'Orchestrator Agent'",
+    ("SystemComponent", "technologies"): "e.g. Neo4j, FastAPI",
+    ("DataFlow", "protocol"): "gRPC|REST|Pub/Sub|WebSocket",
+    ("DecisionEngineSpec", "negotiation_protocol"): "e.g. Contract Net Protocol",
+    ("ScalabilityMetric", "bottleneck"): "likely bottleneck",
+    ("PerformanceAnalysis", "latency_profile"): "latency profile",
+    ("PerformanceAnalysis", "expected_tps"): "transactions per second",
+}
+
+
+def _strip_titles(schema: Dict[str, Any], cls: Any = None) -> None:
+    """عناوين الحقول تكرار لأسمائها ولا يحتاجها النموذج اللغوي"""
+    for prop in schema.get("properties", {}).values():
+        prop.pop("title", None)
+
+
+def _compact_annotation(annotation: Any) -> Any:
+    """استبدال النماذج المتداخلة بنسخها المضغوطة داخل List/Optional"""
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return compact_model(annotation)
+    origin = get_origin(annotation)
+    args = get_args(annotation)
+    if origin is None or not args:
+        return annotation
+    compacted = tuple(_compact_annotation(a) for a in args)
+    if compacted == args:
+        return annotation
+    if origin is Union:
+        return Union[compacted]
+    if origin is list:
+        return List[compacted[0]]
+    return annotation
+
+
+@lru_cache(maxsize=None)
+def compact_model(model: Type[BaseModel]) -> Type[BaseModel]:
+    """
+    نسخة مضغوطة من النموذج: صنف فرعي بنفس الاسم (اسم الأداة لا يتغير)
+    ونفس الأنواع والقيود، فالنتيجة تبقى isinstance من النموذج الأصلي.
+    """
+    annotations: Dict[str, Any] = {}
+    namespace: Dict[str, Any] = {
+        "__module__": model.__module__,
+        "__qualname__": model.__qualname__,
+        "__doc__": model.__doc__,
+        "model_config": ConfigDict(json_schema_extra=_strip_titles),
+    }
+    for name, info in model.model_fields.items():
+        annotation = _compact_annotation(info.annotation)
+        annotations[name] = annotation
+        field = FieldInfo.merge_field_infos(info, description=TERSE_DESCRIPTIONS.get((model.__name__, name)))
+        field.annotation = annotation
+        namespace[name] = field
+    namespace["__annotations__"] = annotations
+    return type(model.__name__, (model,), namespace)
+
+
+@lru_cache(maxsize=None)
+def full_schema(model: Type[BaseModel]) -> str:
+    """المخطط الكامل بالأوصاف العربية (للتوثيق)"""
+    return json.dumps(model.model_json_schema(), ensure_ascii=False, indent=2)
+
+
+@lru_cache(maxsize=None)
+def compact_schema(model: Type[BaseModel]) -> str:
+    """المخطط المضغوط كما يصل إلى المزوّد"""
+    return json.dumps(compact_model(model).model_json_schema(), ensure_ascii=False, separators=(",", ":"))
+
+
+def schema_savings(stage_models: Dict[str, Type[BaseModel]], model: str = "") -> Dict[str, Dict[str, float]]:
+    """قياس رموز المخطط لكل مرحلة قبل الضغط وبعده"""
+    report = {}
+    for stage, response_model in stage_models.items():
+        full = schema_tokens(response_model, model)
+        compact = schema_tokens(compact_model(response_model), model)
+        report[stage] = {
+            "full_tokens": full,
+            "compact_tokens": compact,
+            "saved_tokens": full - compact,
+            "saved_ratio": round((full - compact) / full, 3) if full else 0.0,
+        }
+    return report
+
+
+def precompute(stage_models: Dict[str, Type[BaseModel]], model: str = "") -> Dict[str, Type[BaseModel]]:
+    """بناء النسخ المضغوطة وعدّ رموز مخططاتها مسبقاً (تُحفظ في الذاكرة المؤقتة)"""
+    compacted = {}
+    for stage, response_model in stage_models.items():
+        compacted[stage] = compact_model(response_model)
+        schema_tokens(compacted[stage], model)
+    return compacted
@@ -0,0 +1,198 @@
+"""
+متحكم التزامن التكيفي للاستدعاءات الصادرة (Adaptive AIMD Concurrency Limiter)
+يزيد حد التزامن جمعياً ما دام زمن الاستجابة ومعدل الأخطاء سليمين،
+ويخفضه ضربياً عند 429 أو انتهاء المهلة أو قفزات زمن الاستجابة.
+حالته مشتركة بين كل الطلبات في العملية.
+"""
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+from runtime_metrics import metrics
+
+# نتائج الاستدعاء كما يراها المتحكم
+OK = "ok"
+RATE_LIMITED = "rate_limited"
+TIMEOUT = "timeout"
+ERROR = "error"
+
+# عدد العينات قبل اعتماد خط الأساس لزمن المرحلة
+_BASELINE_WARMUP = 10
+_EWMA_ALPHA = 0.1
+# نافذة صحة المزوّد: آخر النتائج خلال هذه المدة فقط
+_HEALTH_WINDOW_SECONDS = 60.0
+_HEALTH_MIN_SAMPLES = 5
+
+
+def classify_error(exc: BaseException) -> str:
+    """تصنيف الخطأ بتتبع سلسلة الأسباب (instructor يغلّف أخطاء openai أحياناً)"""
+    seen = set()
+    validation_only = False
+    current: Optional[BaseException] = exc
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        name = type(current).__name__
+        if name == "RateLimitError" or getattr(current, "status_code", None) == 429:
+            return RATE_LIMITED
+        if name in ("APITimeoutError", "TimeoutError", "ReadTimeout", "ConnectTimeout"):
+            return TIMEOUT
+        if name in ("InstructorRetryException", "ValidationError"):
+            validation_only = True
+        current = current.__cause__ or current.__context__
+    # النموذج استجاب؛ فشل التحقق ليس مؤشراً على ضغط المزوّد
+    return OK if validation_only else ERROR
+
+
+class AdaptiveConcurrencyLimiter:
+    def __init__(
+        self,
+        initial_limit: float = 8,
+        min_limit: float = 1,
+        max_limit: float = 64,
+        decrease_factor: float = 0.5,
+        latency_spike_factor: float = 3.0,
+        cooldown_seconds: float = 2.0
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.decrease_factor = decrease_factor
+        self.latency_spike_factor = latency_spike_factor
+        self.cooldown_seconds = cooldown_seconds
+        self.inflight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._baseline: Dict[str, float] = {}
+        self._samples: Dict[str, int] = {}
+        self._last_decrease = 0.0
+        self.history: Deque[dict] = deque(maxlen=200)
+        self._outcomes: Deque[tuple] = deque(maxlen=200)
+        self._record("init")
+
+    # =============================================================================
+    # الواجهة العامة
+    # =============================================================================
+
+    @asynccontextmanager
+    async def slot(self, key: str = "default"):
+        """حجز مقعد ضمن الحد الحالي ثم تعديل الحد حسب نتيجة الاستدعاء"""
+        await self._acquire()
+        started = time.perf_counter()
+        outcome = OK
+        try:
+            yield
+        except asyncio.CancelledError:
+            outcome = None
+            raise
+        except Exception as e:
+            outcome = classify_error(e)
+            raise
+        finally:
+            self.inflight -= 1
+            if outcome is not None:
+                self._on_result(key, outcome, time.perf_counter() - started)
+            self._publish()
+            self._wake()
+
+    def health(self) -> float:
+        """نسبة الاستدعاءات السليمة مؤخراً (1.0 عند قلة العينات)"""
+        horizon = time.monotonic() - _HEALTH_WINDOW_SECONDS
+        recent = [ok for at, ok in self._outcomes if at >= horizon]
+        if len(recent) < _HEALTH_MIN_SAMPLES:
+            return 1.0
+        return sum(recent) / len(recent)
+
+    def state(self) -> dict:
+        return {
+            "limit": round(self.limit, 3),
+            "health": round(self.health(), 3),
+            "effective_limit": int(self.limit),
+            "inflight": self.inflight,
+            "waiting": len(self._waiters),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "latency_baselines": {k: round(v, 4) for k, v in self._baseline.items()},
+            "history": list(self.history),
+        }
+
+    # =============================================================================
+    # التنفيذ الداخلي
+    # =============================================================================
+
+    async def _acquire(self) -> None:
+        while self.inflight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            metrics.set("llm.concurrency.waiting", len(self._waiters))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                elif waiter.done() and not waiter.cancelled():
+                    # أُوقظ لحظة الإلغاء: نمرر الدور لمنتظر آخر
+                    self._wake()
+                raise
+        self.inflight += 1
+        self._publish()
+
+    def _wake(self) -> None:
+        free = int(self.limit) - self.inflight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def _on_result(self, key: str, outcome: str, latency: float) -> None:
+        self._outcomes.append((time.monotonic(), outcome == OK))
+        if outcome in (RATE_LIMITED, TIMEOUT):
+            metrics.incr(f"llm.concurrency.{outcome}")
+            self._decrease(outcome)
+            return
+        if outcome == ERROR:
+            metrics.incr("llm.concurrency.error")
+            return
+
+        baseline = self._baseline.get(key)
+        samples = self._samples.get(key, 0) + 1
+        self._samples[key] = samples
+        if baseline is not None and samples > _BASELINE_WARMUP and latency > baseline * self.latency_spike_factor:
+            metrics.incr("llm.concurrency.latency_spike")
+            self._decrease("latency_spike")
+            # لا ندمج القفزة في خط الأساس حتى لا يتكيف معها
+            return
+        self._baseline[key] = latency if baseline is None else (1 - _EWMA_ALPHA) * baseline + _EWMA_ALPHA * latency
+
+        # زيادة جمعية: +1 تقريباً لكل نافذة كاملة من الاستدعاءات الناجحة
+        previous = int(self.limit)
+        self.limit = min(self.max_limit, self.limit + 1.0 / max(self.limit, 1.0))
+        if int(self.limit) != previous:
+            self._record("increase")
+
+    def _decrease(self, reason: str) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown_seconds:
+            # استجابات نفس الموجة لا تخفّض الحد مرة أخرى
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+        self._record(reason)
+
+    def _record(self, reason: str) -> None:
+        self.history.append({
+            "at": round(time.time(), 3),
+            "limit": round(self.limit, 3),
+            "reason": reason,
+        })
+
+    def _publish(self) -> None:
+        metrics.set("llm.concurrency.limit", round(self.limit, 3))
+        metrics.set("llm.concurrency.inflight", self.inflight)
+        metrics.set("llm.concurrency.waiting", len(self._waiters))
+
+
+# مثيل مشترك لكل العملية
+llm_limiter = AdaptiveConcurrencyLimiter()
@@ -1,16 +1,18 @@
 import os
 import sys
+import time
 import logging
 import asyncio
 import json
 from datetime import datetime
-from typing import List, Optional, Literal
+from typing import Callable, Dict, List, Optional, Literal, Type, TypeVar
 from dataclasses import dataclass
 from enum import Enum
 
 import aiofiles
 from pydantic import BaseModel, Field
 import instructor
+from instructor.core import InstructorRetryException
 from openai import AsyncOpenAI
 from dotenv import load_dotenv
 from rich.console import Console
@@ -19,6 +21,19 @@ from rich.table import Table
 from rich.panel import Panel
 from rich.syntax import Syntax
 
+import compact_schemas
+import output_repair
+import request_profiler
+import summary_tree
+import token_planner
+from concurrency_limiter import llm_limiter
+from llm_hedging import hedger
+from mapped_document import Document, MappedDocument
+from result_cache import stage_cache, cache_key
+from runtime_metrics import metrics
+from stage_engine import StageEngine, StageRegistry, StageRunResult
+from summary_tree import SummaryResult, summary_store
+
 # =================================================================================================
 # إعدادات السجلات والعرض (Logging & Display Configuration)
 # =================================================================================================
@@ -169,6 +184,62 @@ class ComprehensiveArchitectureReport(BaseModel):
     confidence_level: float = Field(ge=0, le=1)
     analyst_notes: Optional[str] = None
 
+# =================================================================================================
+# مراحل التحليل (Analysis Stages)
+# =================================================================================================
+
+STAGE_MODELS = {
+    "basic": ArchitectureResult,
+    "failure": FailureAnalysisResult,
+    "integration": IntegrationReport,
+    "performance": PerformanceAnalysis,
+    "comparative": SystemComparison,
+}
+
+# النسخ المضغوطة تُبنى مرة واحدة عند التحميل
+COMPACT_STAGE_MODELS = compact_schemas.precompute(STAGE_MODELS)
+
+ANALYSIS_STAGES = {
+    AnalysisType.BASIC: ["basic"],
+    AnalysisType.FAILURE: ["failure"],
+    AnalysisType.PERFORMANCE: ["performance"],
+    AnalysisType.INTEGRATION: ["integration"],
+    AnalysisType.COMPARATIVE: ["comparative"],
+    AnalysisType.COMPREHENSIVE: ["basic", "failure", "integration", "performance"],
+}
+
+# =================================================================================================
+# سجل مراحل التقرير الشامل (Comprehensive Report Stage Registry)
+# =================================================================================================
+# كل مرحلة تعلن مدخلاتها؛ المراحل المستقلة تعمل بالتوازي. مراحل الفشل والأداء
+# تستهلك التحليل الأساسي المنظم المضغوط بدلاً من إعادة قراءة النص الخام كاملاً.
+
+REPORT_STAGES = StageRegistry(sources=["raw_text", "comparison_text"])
+
+def architecture_context(basic: ArchitectureResult) -> str:
+    """تمثيل JSON مضغوط للتحليل الأساسي يُمرَّر للمراحل اللاحقة"""
+    return basic.model_dump_json(exclude_none=True)
+
+@REPORT_STAGES.register("basic", inputs=["raw_text"])
+async def _basic_stage(agent, inputs):
+    return await agent.analyze(inputs["raw_text"])
+
+@REPORT_STAGES.register("integration", inputs=["raw_text"])
+async def _integration_stage(agent, inputs):
+    return await agent.analyze_integration(inputs["raw_text"])
+
+@REPORT_STAGES.register("failure", inputs=["basic"])
+async def _failure_stage(agent, inputs):
+    return await agent.analyze_failure_points(architecture_context(inputs["basic"]))
+
+@REPORT_STAGES.register("performance", inputs=["basic"])
+async def _performance_stage(agent, inputs):
+    return await agent.analyze_performance(architecture_context(inputs["basic"]))
+
+@REPORT_STAGES.register("comparative", inputs=["raw_text", "comparison_text"], optional=True)
+async def _comparative_stage(agent, inputs):
+    return await agent.compare_architectures(inputs["raw_text"], inputs["comparison_text"])
+
 # =================================================================================================
 # مدير التكوين (Configuration Manager)
 # =================================================================================================
@@ -181,10 +252,37 @@ class AppConfig:
     model_name: str = "gpt-5.2-2025-12-11"
     analysis_type: AnalysisType = AnalysisType.COMPREHENSIVE
     temperature: float = 0.2
+    # عدد مرات إعادة السؤال القصيرة بعد فشل الإصلاح المحلي
+    max_reasks: int = 2
+    # حفظ نتيجة كل استدعاء فور اكتماله في ذاكرة العملية المشتركة
+    enable_cache: bool = True
+    # التحوّط: استدعاء مكرر إذا تجاوز الاستدعاء مئين الأزمنة الأخيرة
+    hedge_enabled: bool = False
+    hedge_percentile: float = 0.95
+    hedge_budget_ratio: float = 0.1
+    hedge_min_delay: float = 1.0
+    # إرسال مخططات استجابة مضغوطة (أوصاف مقتضبة) بدلاً من الأوصاف الكاملة
+    compact_schemas: bool = True
+    # وضع Batch API لدى المزوّد (batch_analyzer.py)
+    batch_poll_interval: float = 30.0
+    batch_completion_window: str = "24h"
+    # شجرة الملخصات الهرمية: المستندات الطويلة تُحلل من ملخص محفوظ لكل مستند بدلاً من النص الخام
+    summary_tree: bool = False
+    summary_tree_min_tokens: int = 4000
+    summary_chunk_tokens: int = 3000
+    summary_tree_max_tokens: int = 8000
+    # ميزانية الرموز والتكلفة (Token & Cost Budget)
+    max_input_tokens_per_stage: int = 30000
+    max_cost_usd: Optional[float] = None
+    budget_policy: Literal["reject", "downgrade"] = "downgrade"
+    input_cost_per_1k: float = 0.00125
+    output_cost_per_1k: float = 0.01
+    output_tokens_per_second: float = 60.0
+    request_overhead_seconds: float = 1.5
 
 class ConfigManager:
     @staticmethod
-    def load_config() -> AppConfig:
+    def load_config(require_api_key: bool = True) -> AppConfig:
         try:
             load_dotenv()
             api_key = os.getenv("OPENAI_API_KEY")
@@ -195,11 +293,14 @@ class ConfigManager:
                     load_dotenv(env_local_path)
                 api_key = os.getenv("OPENAI_API_KEY")
             
-            if not api_key:
+            if not api_key and require_api_key:
                 raise ValueError("❌ Environment variable 'OPENAI_API_KEY' is missing.")
             
+            max_cost = os.getenv("ANALYZER_MAX_COST_USD")
             return AppConfig(
-                api_key=api_key,
+                api_key=api_key or "",
+                max_cost_usd=float(max_cost) if max_cost else None,
+                summary_tree=os.getenv("ANALYZER_SUMMARY_TREE", "").lower() in ("1", "true", "yes"),
                 input_file="Session_details.txt",
                 output_file="System_Architecture_Analysis.md",
                 analysis_type=AnalysisType.COMPREHENSIVE
@@ -209,6 +310,112 @@ class ConfigManager:
             logger.critical(f"[red]Configuration Error:[/red] {str(e)}")
             sys.exit(1)
 
+# =================================================================================================
+# التخطيط المسبق للميزانية (Pre-flight Budget Planning)
+# =================================================================================================
+
+def stage_models_for(config: AppConfig) -> dict:
+    """نماذج المراحل كما تُرسل فعلاً (مضغوطة أو كاملة) لحساب رموز المخطط"""
+    return COMPACT_STAGE_MODELS if config.compact_schemas else STAGE_MODELS
+
+def plan_analysis(
+    config: AppConfig,
+    text: Document,
+    analysis_type: AnalysisType,
+    comparison_text: Optional[str] = None,
+    document_keys: Optional[Dict[str, str]] = None
+) -> token_planner.AnalysisPlan:
+    """
+    حساب خطة الرموز والتكلفة والزمن قبل أي استدعاء؛ يرفع BudgetExceededError عند التجاوز.
+    مع شجرة الملخصات تدخل تكلفة بناء الأشجار غير المحفوظة في الخطة، وتُعاد بصمات
+    المستندات في plan.document_keys لتمريرها إلى condense (أو لإعادة التخطيط دون إعادة حسابها).
+    """
+    stages = list(ANALYSIS_STAGES[analysis_type])
+    if analysis_type == AnalysisType.COMPREHENSIVE:
+        if comparison_text:
+            stages.append("comparative")
+        stage_inputs = REPORT_STAGES.stage_inputs(stages)
+    elif analysis_type == AnalysisType.COMPARATIVE:
+        stage_inputs = {"comparative": ["raw_text", "comparison_text"]}
+    else:
+        # التحليلات المفردة تقرأ النص الخام مباشرة
+        stage_inputs = {stage: ["raw_text"] for stage in stages}
+    keys = dict(document_keys or {})
+    summary_trees: Dict[str, bool] = {}
+    if config.summary_tree:
+        for source, value in (("raw_text", text), ("comparison_text", comparison_text)):
+            if not value:
+                continue
+            if source not in keys:
+                if token_planner.count_tokens(value, config.model_name) < config.summary_tree_min_tokens:
+                    continue
+                keys[source] = summary_tree.document_key(value, config.model_name)
+            summary_trees[source] = not summary_store.contains(keys[source])
+    planner = token_planner.TokenBudgetPlanner(config, stage_models_for(config), SummaryResult)
+    plan = planner.plan(text, stage_inputs, analysis_type.value, comparison_text, summary_trees)
+    plan.document_keys = keys
+    if plan.downgraded:
+        metrics.incr("budget.downgraded")
+        logger.warning(
+            f"💸 Plan downgraded to {plan.input_budget} input tokens/stage "
+            f"(${plan.expected_cost_usd:.4f} ≤ ${plan.max_cost_usd:.4f})"
+        )
+    return plan
+
+def print_plan(plan: token_planner.AnalysisPlan) -> None:
+    """عرض خطة الميزانية كجدول rich"""
+    table = Table(title=f"📐 Pre-flight Plan — {plan.analysis_type} @ {plan.model}")
+    table.add_column("Stage", style="cyan")
+    table.add_column("Doc tokens", justify="right")
+    table.add_column("Input tokens", justify="right")
+    table.add_column("Output tokens", justify="right")
+    table.add_column("Chunks", justify="right")
+    table.add_column("Cost ($)", justify="right")
+    table.add_column("Latency (s)", justify="right")
+    
+    for stage in plan.stages:
+        chunks = f"{stage.chunks}" + (" ✂️" if stage.truncated else "")
+        table.add_row(
+            stage.stage,
+            str(stage.document_tokens),
+            str(stage.input_tokens),
+            str(stage.output_tokens),
+            chunks,
+            f"{stage.cost_usd:.4f}",
+            f"{stage.latency_seconds:.1f}"
+        )
+    
+    table.add_row(
+        "[bold]Total[/bold]", "", str(plan.total_input_tokens), str(plan.total_output_tokens), "",
+        f"[bold]{plan.expected_cost_usd:.4f}[/bold]", f"[bold]{plan.expected_latency_seconds:.1f}[/bold]"
+    )
+    console.print(table)
+    
+    budget = f"${plan.max_cost_usd:.4f}" if plan.max_cost_usd is not None else "unlimited"
+    console.print(
+        f"Input budget/stage: [bold]{plan.input_budget}[/bold] tokens | "
+        f"Context window: {plan.context_window} | Cost budget: {budget} | Estimator: {plan.estimator}"
+        + (" | [yellow]downgraded[/yellow]" if plan.downgraded else "")
+    )
+
+def print_schema_savings(model: str = "") -> None:
+    """عرض رموز مخطط كل مرحلة قبل الضغط وبعده"""
+    table = Table(title="🗜️ Response schema tokens per stage")
+    table.add_column("Stage", style="cyan")
+    table.add_column("Full", justify="right")
+    table.add_column("Compact", justify="right")
+    table.add_column("Saved", justify="right")
+    
+    savings = compact_schemas.schema_savings(STAGE_MODELS, model)
+    for stage, row in savings.items():
+        table.add_row(
+            stage,
+            str(row["full_tokens"]),
+            str(row["compact_tokens"]),
+            f"{row['saved_tokens']} ({row['saved_ratio']:.0%})"
+        )
+    console.print(table)
+
 # =================================================================================================
 # معالج الملفات غير المتزامن (Async File Handler)
 # =================================================================================================
@@ -230,6 +437,21 @@ class AsyncFileHandler:
             logger.error(f"[red]Read Error:[/red] {str(e)}")
             raise
     
+    @staticmethod
+    def open_document(file_path: str) -> MappedDocument:
+        """المستند مُعيَّناً في الذاكرة دون قراءته: يُفك ترميزه كتلة كتلة عند الحاجة"""
+        try:
+            if not os.path.exists(file_path):
+                raise FileNotFoundError(f"File '{file_path}' not found.")
+            
+            document = MappedDocument(file_path)
+            logger.info(f"✓ Mapped file '[bold cyan]{file_path}[/bold cyan]' | Size: {document.size} bytes")
+            return document
+        
+        except Exception as e:
+            logger.error(f"[red]Read Error:[/red] {str(e)}")
+            raise
+    
     @staticmethod
     async def save_report(file_path: str, content: str) -> None:
         try:
@@ -246,11 +468,235 @@ class AsyncFileHandler:
 # وكيل التحليل المحسّن (Enhanced Analysis Agent)
 # =================================================================================================
 
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
 class EnhancedArchitecturalAnalystAgent:
-    def __init__(self, config: AppConfig):
-        self.client = instructor.patch(AsyncOpenAI(api_key=config.api_key))
+    def __init__(self, config: AppConfig, client: Optional[AsyncOpenAI] = None):
+        # عميل مشترك مُسخَّن (الخادم) يعيد استخدام الاتصالات المفتوحة بدلاً من عميل جديد لكل طلب
+        self.client = client if client is not None else instructor.patch(AsyncOpenAI(api_key=config.api_key))
         self.model = config.model_name
         self.temperature = config.temperature
+        self.max_reasks = config.max_reasks
+        self.compact_schemas = config.compact_schemas
+        self.cache = stage_cache if config.enable_cache else None
+        # عزل مدخلات الذاكرة المؤقتة بين المستأجرين (الخادم يضبطه للمستأجر)
+        self.cache_namespace = ""
+        self.hedge_enabled = config.hedge_enabled
+        self.hedge_percentile = config.hedge_percentile
+        self.hedge_budget_ratio = config.hedge_budget_ratio
+        self.hedge_min_delay = config.hedge_min_delay
+        self.summary_tree = config.summary_tree
+        self.summary_tree_min_tokens = config.summary_tree_min_tokens
+        self.summary_chunk_tokens = config.summary_chunk_tokens
+        self.summary_tree_max_tokens = config.summary_tree_max_tokens
+        self.input_budget = token_planner.TokenBudgetPlanner(config, stage_models_for(config)).input_budget()
+        self.last_run: Optional[StageRunResult] = None
+        self.last_report: Optional[ComprehensiveArchitectureReport] = None
+        # مهلة العميل (time.monotonic) والزمن المقدّر لكل مرحلة من خطة الميزانية
+        self.deadline: Optional[float] = None
+        self.stage_estimates: Dict[str, float] = {}
+        # مراقب اختياري لكل استدعاء مكتمل: (المرحلة، النتيجة، الزمن بالثواني)
+        self.call_observer: Optional[Callable[[str, BaseModel, float], None]] = None
+    
+    def _fits_deadline(self, stage: str) -> bool:
+        """هل يتسع ما تبقى من المهلة لبدء مرحلة اختيارية؟"""
+        if self.deadline is None:
+            return True
+        return self.deadline - time.monotonic() >= self.stage_estimates.get(stage, 0.0)
+    
+    def _fit(self, text: str, share: float = 1.0) -> str:
+        """قص النص إلى ميزانية الرموز لكل مرحلة (بدلاً من عدد أحرف ثابت)"""
+        return token_planner.truncate_to_tokens(text, int(self.input_budget * share), self.model)
+    
+    # =============================================================================
+    # شجرة الملخصات (Summary Tree Pre-stage)
+    # =============================================================================
+    async def condense(self, text: Document, key: Optional[str] = None) -> str:
+        """
+        النص كما تراه المراحل: النص نفسه (أو من المستند المُعيَّن بدايتُه ضمن ميزانية الإدخال)،
+        أو للمستندات الطويلة عند التفعيل عرضُ شجرة ملخصاته المحفوظة ضمن ميزانية رموز
+        (تُبنى مرة واحدة لكل مستند). key: بصمة المستند من plan.document_keys إن خُطط لها.
+        """
+        if key is None and self.summary_tree:
+            # العد والبصمة يمران على المستند كاملاً: خارج حلقة الأحداث
+            key = await asyncio.to_thread(self._summary_tree_key, text)
+        if key is None:
+            return text if isinstance(text, str) else text.prefix(self.input_budget, self.model)
+        tree = await summary_store.get_or_build(
+            key,
+            lambda: summary_tree.build_tree(text, self._summarize, self.model, self.summary_chunk_tokens, key=key)
+        )
+        condensed = summary_tree.render(tree, min(self.input_budget, self.summary_tree_max_tokens), self.model)
+        logger.info(
+            f"🌳 Using summary tree: {token_planner.estimate_tokens(condensed, self.model)} "
+            f"of {tree.source_tokens} tokens"
+        )
+        return condensed
+    
+    def _summary_tree_key(self, text: Document) -> Optional[str]:
+        """بصمة المستند إن كان طويلاً بما يكفي لشجرة الملخصات"""
+        if token_planner.count_tokens(text, self.model) < self.summary_tree_min_tokens:
+            return None
+        return summary_tree.document_key(text, self.model)
+
+    async def _summarize(self, level: str, text: str) -> SummaryResult:
+        scope = {
+            "chunk": "جزء من سجل جلسة تصميم معماري",
+            "section": "ملخصات أجزاء متتالية من السجل؛ ادمجها في ملخص قسم واحد",
+            "document": "ملخصات أقسام السجل؛ ادمجها في ملخص للمستند كاملاً",
+        }[level]
+        return await self._call_llm(
+            f"summary_{level}",
+            SummaryResult,
+            [
+                {
+                    "role": "system",
+                    "content": """أنت مهندس برمجيات يلخص سجلات جلسات التصميم المعماري لتحليلها لاحقاً.
+احتفظ بكل المكونات والتقنيات والقرارات وأسبابها والأرقام (زمن، حمل، تكلفة) والمخاطر المذكورة.
+احذف التكرار والحوار الجانبي. اكتب بالعربية الفصحى مع إبقاء أسماء التقنيات كما هي."""
+                },
+                {
+                    "role": "user",
+                    "content": f"""لخص النص التالي ({scope}):
+
+{self._fit(text)}"""
+                }
+            ]
+        )
+    
+    # =============================================================================
+    # استدعاء النموذج مع الإصلاح المحلي (LLM Call with Local Repair)
+    # =============================================================================
+    async def _call_llm(
+        self,
+        stage: str,
+        response_model: Type[ModelT],
+        messages: List[dict]
+    ) -> ModelT:
+        """
+        استدعاء مرحلة مع الذاكرة المؤقتة ومحاسبة الإلغاء.
+        النتيجة تُحفظ فور اكتمالها، لذا تبقى المراحل المكتملة متاحة
+        حتى لو أُلغي باقي التشغيل (مثال: انقطاع اتصال العميل).
+        """
+        key = cache_key(self.model, stage, messages, self.temperature, self.compact_schemas, self.cache_namespace)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                logger.info(f"♻️ Reusing cached {stage} result")
+                return cached
+        
+        started = time.perf_counter()
+        try:
+            with request_profiler.segment(stage):
+                result = await self._request_structured(stage, response_model, messages)
+        except asyncio.CancelledError:
+            metrics.incr("llm.calls.cancelled")
+            metrics.incr(f"llm.calls.cancelled.{stage}")
+            logger.warning(f"🛑 {stage} call cancelled")
+            raise
+        
+        metrics.incr("llm.calls.completed")
+        if self.cache is not None:
+            self.cache.put(key, result)
+        if self.call_observer is not None:
+            self.call_observer(stage, result, time.perf_counter() - started)
+        return result
+    
+    async def _create(self, key: str, response_model: Type[ModelT], messages: List[dict]) -> ModelT:
+        """الاستدعاء الفعلي للمزوّد ضمن حد التزامن التكيفي المشترك"""
+        if self.compact_schemas:
+            response_model = compact_schemas.compact_model(response_model)
+        stage = key.partition(".")[0]
+        queued = time.perf_counter()
+        async with llm_limiter.slot(key):
+            request_profiler.queue_wait(stage, time.perf_counter() - queued)
+            try:
+                # التنميط يفصل زمن طلب HTTP عن تحقق instructor من الاستجابة
+                with request_profiler.completion(stage) as hooks:
+                    return await self.client.chat.completions.create(
+                        model=self.model,
+                        response_model=response_model,
+                        messages=messages,
+                        temperature=self.temperature,
+                        max_retries=1,
+                        hooks=hooks
+                    )
+            except InstructorRetryException as e:
+                # instructor يغلّف أخطاء المزوّد (429، المهلة...) أيضاً؛ بدون استجابة لا يوجد ما يُصلح
+                if e.last_completion is None and e.__cause__ is not None:
+                    raise e.__cause__ from e
+                raise
+    
+    async def _request_structured(
+        self,
+        stage: str,
+        response_model: Type[ModelT],
+        messages: List[dict]
+    ) -> ModelT:
+        """
+        استدعاء واحد للنموذج بدون إعادة محاولات instructor.
+        عند فشل التحقق: إصلاح محلي حتمي أولاً، ثم إعادة سؤال قصيرة
+        تحتوي الأخطاء فقط (بدون النص الكامل) إذا تعذر الإصلاح.
+        """
+        def create():
+            return self._create(stage, response_model, messages)
+        
+        try:
+            if self.hedge_enabled:
+                result = await hedger.run(
+                    stage,
+                    create,
+                    percentile=self.hedge_percentile,
+                    budget_ratio=self.hedge_budget_ratio,
+                    min_delay=self.hedge_min_delay
+                )
+            else:
+                result = await create()
+            metrics.incr("structured_output.valid")
+            return result
+        except InstructorRetryException as e:
+            raw = output_repair.extract_raw_payload(e.last_completion)
+        
+        # نحتفظ بتعليمات النظام فقط؛ النص الخام لا يُعاد إرساله
+        system_messages = [m for m in messages if m.get("role") == "system"]
+        
+        for attempt in range(self.max_reasks + 1):
+            outcome = output_repair.repair(response_model, raw)
+            if outcome.ok:
+                if outcome.fixes:
+                    metrics.incr("structured_output.repaired")
+                    for fix in outcome.fixes:
+                        metrics.incr(f"structured_output.fix.{fix}")
+                    logger.info(f"🩹 Repaired {stage} output locally ({len(outcome.fixes)} fixes)")
+                else:
+                    metrics.incr("structured_output.valid")
+                return outcome.instance
+            
+            if attempt == self.max_reasks:
+                break
+            
+            metrics.incr("structured_output.reask")
+            logger.warning(f"↩️ Re-asking {stage} with {len(outcome.errors)} validation errors")
+            followup = system_messages + [
+                {"role": "assistant", "content": raw or ""},
+                {
+                    "role": "user",
+                    "content": f"""الاستجابة السابقة لم تجتز التحقق بسبب الأخطاء التالية:
+{output_repair.format_errors(outcome.errors)}
+
+أعد الكائن نفسه كاملاً بعد تصحيح هذه الحقول فقط."""
+                }
+            ]
+            try:
+                return await self._create(f"{stage}.reask", response_model, followup)
+            except InstructorRetryException as e:
+                raw = output_repair.extract_raw_payload(e.last_completion)
+        
+        metrics.incr("structured_output.failed")
+        raise ValueError(
+            f"{stage} output failed validation after {self.max_reasks} re-asks:\n"
+            f"{output_repair.format_errors(outcome.errors)}"
+        )
     
     # =============================================================================
     # 1️⃣ التحليل الأساسي
@@ -259,10 +705,10 @@ class EnhancedArchitecturalAnalystAgent:
         logger.info("🔍 Starting [bold magenta]Basic Architecture Analysis[/bold magenta]...")
         
         try:
-            result = await self.client.chat.completions.create(
-                model=self.model,
-                response_model=ArchitectureResult,
-                messages=[
+            result = await self._call_llm(
+                "basic",
+                ArchitectureResult,
+                [
                     {
                         "role": "system",
                         "content": """أنت مهندس برمجيات محترف متخصص في تحليل المعماريات.
@@ -279,11 +725,9 @@ class EnhancedArchitecturalAnalystAgent:
 5. التحديات المتوقعة
 
 السجل:
-{raw_text[:90000]}"""
+{self._fit(raw_text)}"""
                     }
-                ],
-                temperature=self.temperature,
-                max_retries=3
+                ]
             )
             
             logger.info("✓ Basic analysis complete")
@@ -300,10 +744,10 @@ class EnhancedArchitecturalAnalystAgent:
         logger.info("⚠️ Starting [bold red]Failure Point Analysis[/bold red]...")
         
         try:
-            result = await self.client.chat.completions.create(
-                model=self.model,
-                response_model=FailureAnalysisResult,
-                messages=[
+            result = await self._call_llm(
+                "failure",
+                FailureAnalysisResult,
+                [
                     {
                         "role": "system",
                         "content": """أنت خبير موثوقية الأنظمة والهندسة المختصة بالمرونة.
@@ -319,11 +763,9 @@ class EnhancedArchitecturalAnalystAgent:
 4. متطلبات التكرار والتكرار
 
 المعمارية:
-{arch_text[:90000]}"""
+{self._fit(arch_text)}"""
                     }
-                ],
-                temperature=self.temperature,
-                max_retries=3
+                ]
             )
             
             logger.info("✓ Failure analysis complete")
@@ -340,10 +782,10 @@ class EnhancedArchitecturalAnalystAgent:
         logger.info("🔗 Starting [bold blue]Integration & Compatibility Analysis[/bold blue]...")
         
         try:
-            result = await self.client.chat.completions.create(
-                model=self.model,
-                response_model=IntegrationReport,
-                messages=[
+            result = await self._call_llm(
+                "integration",
+                IntegrationReport,
+                [
                     {
                         "role": "system",
                         "content": """أنت خبير التكامل والتوافقية التقنية.
@@ -361,11 +803,9 @@ class EnhancedArchitecturalAnalystAgent:
 6. التقنيات المتقادمة
 
 المعمارية:
-{arch_text[:90000]}"""
+{self._fit(arch_text)}"""
                     }
-                ],
-                temperature=self.temperature,
-                max_retries=3
+                ]
             )
             
             logger.info("✓ Integration analysis complete")
@@ -382,10 +822,10 @@ class EnhancedArchitecturalAnalystAgent:
         logger.info("⚡ Starting [bold yellow]Performance & Scalability Analysis[/bold yellow]...")
         
         try:
-            result = await self.client.chat.completions.create(
-                model=self.model,
-                response_model=PerformanceAnalysis,
-                messages=[
+            result = await self._call_llm(
+                "performance",
+                PerformanceAnalysis,
+                [
                     {
                         "role": "system",
                         "content": """أنت خبير الأداء والبنية القابلة للتوسع.
@@ -404,11 +844,9 @@ class EnhancedArchitecturalAnalystAgent:
 7. فرص التحسين
 
 المعمارية:
-{arch_text[:90000]}"""
+{self._fit(arch_text)}"""
                     }
-                ],
-                temperature=self.temperature,
-                max_retries=3
+                ]
             )
             
             logger.info("✓ Performance analysis complete")
@@ -429,10 +867,10 @@ class EnhancedArchitecturalAnalystAgent:
         logger.info("⚖️ Starting [bold cyan]Comparative Analysis[/bold cyan]...")
         
         try:
-            result = await self.client.chat.completions.create(
-                model=self.model,
-                response_model=SystemComparison,
-                messages=[
+            result = await self._call_llm(
+                "comparative",
+                SystemComparison,
+                [
                     {
                         "role": "system",
                         "content": """أنت محلل معماريات متخصص في المقارنة والتحليل النسبي.
@@ -443,10 +881,10 @@ class EnhancedArchitecturalAnalystAgent:
                         "content": f"""قارن بين النظامين التاليين بشكل شامل:
 
 النظام الأول:
-{system_a_text[:45000]}
+{self._fit(system_a_text, 0.5)}
 
 النظام الثاني:
-{system_b_text[:45000]}
+{self._fit(system_b_text, 0.5)}
 
 قدم:
 1. مقارنة الأداء
@@ -456,9 +894,7 @@ class EnhancedArchitecturalAnalystAgent:
 5. العوامل المؤثرة في القرار
 6. المقايضات والخيارات"""
                     }
-                ],
-                temperature=self.temperature,
-                max_retries=3
+                ]
             )
             
             logger.info("✓ Comparative analysis complete")
@@ -484,34 +920,40 @@ class EnhancedArchitecturalAnalystAgent:
         ))
         
         try:
-            # 1. التحليل الأساسي
-            basic = await self.analyze(arch_text)
-            
-            # 2. تحليل نقاط الفشل
-            failure = await self.analyze_failure_points(arch_text)
-            
-            # 3. تحليل التكامل
-            integration = await self.analyze_integration(arch_text)
+            # المراحل وتبعياتها معرّفة في REPORT_STAGES؛ المحرك يشغّل المستقل منها بالتوازي
+            targets = list(ANALYSIS_STAGES[AnalysisType.COMPREHENSIVE])
+            sources = {"raw_text": arch_text}
+            if comparison_text:
+                targets.append("comparative")
+                sources["comparison_text"] = comparison_text
             
-            # 4. تحليل الأداء
-            performance = await self.analyze_performance(arch_text)
+            # المراحل الاختيارية لا تبدأ إذا لم تتسع لها مهلة العميل
+            for stage in [t for t in targets if REPORT_STAGES.get(t).optional]:
+                if not self._fits_deadline(stage):
+                    targets.remove(stage)
+                    metrics.incr(f"deadline.skipped.{stage}")
+                    logger.warning(f"⏳ Skipping optional {stage} stage: not enough time before the deadline")
             
-            # 5. التحليل المقارن (اختياري)
-            comparison = None
-            if comparison_text:
-                comparison = await self.compare_architectures(arch_text, comparison_text)
+            run = await StageEngine(REPORT_STAGES).run(targets, sources, context=self)
+            self.last_run = run
+            results = run.results
             
             report = ComprehensiveArchitectureReport(
-                basic_analysis=basic,
-                failure_analysis=failure,
-                integration_analysis=integration,
-                performance_analysis=performance,
-                comparative_analysis=comparison,
+                basic_analysis=results["basic"],
+                failure_analysis=results["failure"],
+                integration_analysis=results["integration"],
+                performance_analysis=results["performance"],
+                comparative_analysis=results.get("comparative"),
                 generated_at=datetime.now().isoformat(),
                 confidence_level=0.94
             )
             
+            logger.info(
+                f"⏱️ Critical path: {' → '.join(run.critical_path)} "
+                f"({run.critical_path_seconds:.1f}s of {run.wall_seconds:.1f}s wall)"
+            )
             logger.info("[bold green]✓ Comprehensive report generation complete[/bold green]")
+            self.last_report = report
             return report
         
         except Exception as e:
@@ -743,7 +1185,16 @@ class EnhancedSystemAnalyzerApp:
         ))
         
         try:
-            raw_data = await AsyncFileHandler.read_file(self.config.input_file)
+            # المستند لا يُقرأ كاملاً: التخطيط والتجزئة والتقسيم تمر عليه كتلة كتلة،
+            # والمراحل تستلم فقط ما يتسع لميزانيتها
+            with request_profiler.segment("read_input"):
+                document = AsyncFileHandler.open_document(self.config.input_file)
+            
+            with document:
+                # التخطيط قبل إنفاق أي رموز
+                plan = plan_analysis(self.config, document, analysis_type)
+                self.agent.input_budget = plan.input_budget
+                raw_data = await self.agent.condense(document, plan.document_keys.get("raw_text"))
             
             if analysis_type == AnalysisType.COMPREHENSIVE:
                 report = await self.agent.generate_comprehensive_report(raw_data)
@@ -0,0 +1,139 @@
+"""
+الطلبات المتحوّطة لتقليص ذيل زمن الاستجابة (Hedged LLM Requests)
+إذا لم يعد الاستدعاء خلال مئين محدد من الأزمنة المرصودة مؤخراً لنفس المرحلة،
+يُطلق استدعاء مكرر؛ أول استجابة صالحة تفوز ويُلغى الآخر.
+الإنفاق الإضافي محدود بميزانية: كل استدعاء أساسي يضيف hedge_budget_ratio من رصيد التحوّط.
+"""
+
+import asyncio
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+from runtime_metrics import metrics
+
+T = TypeVar("T")
+
+# عدد العينات المحفوظة لكل مرحلة
+_WINDOW = 200
+# أقل عدد عينات قبل تفعيل التحوّط (لا نتحوّط على تقدير غير مستقر)
+MIN_SAMPLES = 20
+# أقصى رصيد متراكم للتحوّط حتى لا تنفجر التكلفة بعد فترة هادئة
+_MAX_CREDITS = 10.0
+
+
+class LatencyTracker:
+    """نافذة متحركة لأزمنة الاستجابة لكل مفتاح (مرحلة)"""
+
+    def __init__(self, window: int = _WINDOW):
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+
+    def observe(self, key: str, latency: float) -> None:
+        with self._lock:
+            self._samples[key].append(latency)
+
+    def percentile(self, key: str, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples[key])
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class RequestHedger:
+    """حالة التحوّط المشتركة على مستوى العملية (الأزمنة ورصيد الميزانية)"""
+
+    def __init__(self):
+        self.latencies = LatencyTracker()
+        self._lock = threading.Lock()
+        self._credits = 0.0
+
+    def _earn(self, ratio: float) -> None:
+        with self._lock:
+            self._credits = min(_MAX_CREDITS, self._credits + ratio)
+
+    def _spend(self) -> bool:
+        with self._lock:
+            if self._credits < 1.0:
+                return False
+            self._credits -= 1.0
+            return True
+
+    async def run(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[T]],
+        percentile: float = 0.95,
+        budget_ratio: float = 0.1,
+        min_delay: float = 1.0
+    ) -> T:
+        """تنفيذ factory مع تحوّط اختياري؛ factory تُستدعى مرة لكل محاولة"""
+        metrics.incr("hedge.calls")
+        self._earn(budget_ratio)
+
+        started = time.perf_counter()
+        primary = asyncio.ensure_future(factory())
+        threshold = self.latencies.percentile(key, percentile)
+
+        if threshold is not None:
+            try:
+                result = await asyncio.wait_for(asyncio.shield(primary), max(threshold, min_delay))
+            except asyncio.TimeoutError:
+                pass
+            except BaseException:
+                primary.cancel()
+                raise
+            else:
+                self.latencies.observe(key, time.perf_counter() - started)
+                return result
+        else:
+            result = await primary
+            self.latencies.observe(key, time.perf_counter() - started)
+            return result
+
+        if not self._spend():
+            metrics.incr("hedge.skipped_budget")
+            try:
+                result = await primary
+            finally:
+                primary.cancel()
+            self.latencies.observe(key, time.perf_counter() - started)
+            return result
+
+        metrics.incr("hedge.issued")
+        hedge = asyncio.ensure_future(factory())
+        return await self._race(key, started, primary, hedge)
+
+    async def _race(self, key: str, started: float, primary: asyncio.Future, hedge: asyncio.Future):
+        """أول استجابة صالحة تفوز؛ إن فشل الاثنان يُرفع خطأ الاستدعاء الأساسي"""
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = "hedge" if task is hedge else "primary"
+                        metrics.incr(f"hedge.won_by_{winner}")
+                        self.latencies.observe(key, time.perf_counter() - started)
+                        return task.result()
+            # فشل الاثنان: خطأ الأساسي يحمل آخر استجابة لطبقة الإصلاح المحلي
+            return primary.result()
+        finally:
+            for task in (primary, hedge):
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, float]:
+        issued = metrics.get("hedge.issued")
+        calls = metrics.get("hedge.calls")
+        return {
+            "hedge_rate": round(issued / calls, 4) if calls else 0.0,
+            "hedge_win_rate": round(metrics.get("hedge.won_by_hedge") / issued, 4) if issued else 0.0,
+            "credits": round(self._credits, 3),
+        }
+
+
+# مثيل مشترك لكل العملية
+hedger = RequestHedger()
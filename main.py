@@ -2,6 +2,7 @@ import asyncio
 import argparse
 import sys
 from enhanced_analyzer import main as enhanced_main, AnalysisType, EnhancedSystemAnalyzerApp
+from token_planner import BudgetExceededError
 
 
 def parse_arguments():
@@ -16,9 +17,84 @@ def parse_arguments():
         default='comprehensive',
         help='Type of analysis to perform (default: comprehensive)'
     )
+    parser.add_argument(
+        '--plan',
+        action='store_true',
+        help='Print the token/cost/latency plan and exit without calling the API'
+    )
+    parser.add_argument(
+        '--diff',
+        nargs=2,
+        metavar=('BEFORE_JSON', 'AFTER_JSON'),
+        help='Show added/removed/changed entities between two saved JSON reports and exit'
+    )
+    parser.add_argument(
+        '--diff-output',
+        help='Also write the --diff result as markdown to this file'
+    )
+    parser.add_argument(
+        '--schemas',
+        action='store_true',
+        help='Print full vs compact response-schema token counts per stage and exit'
+    )
+    parser.add_argument(
+        '--analytics',
+        nargs='?',
+        const='reports',
+        metavar='REPORT_DIR',
+        help='Print cross-report aggregates over saved JSON reports and exit (default: reports)'
+    )
+    parser.add_argument(
+        '--top',
+        type=int,
+        default=10,
+        help='Rows per --analytics table (default: 10)'
+    )
+    parser.add_argument(
+        '--profile',
+        nargs='?',
+        const='profile.folded',
+        metavar='FOLDED_PATH',
+        help='Profile the run (CPU samples, allocations, LLM wait vs local time per stage) '
+             'and write folded stacks for flamegraph.pl/speedscope (default: profile.folded)'
+    )
     return parser.parse_args()
 
 
+async def run_plan(analysis_type: AnalysisType):
+    """Estimate tokens, cost and latency offline without calling the API"""
+    from enhanced_analyzer import ConfigManager, AsyncFileHandler, plan_analysis, print_plan
+    
+    config = ConfigManager.load_config(require_api_key=False)
+    with AsyncFileHandler.open_document(config.input_file) as document:
+        print_plan(plan_analysis(config, document, analysis_type))
+
+
+def run_diff(before_path: str, after_path: str, output: str = None):
+    """Diff two ComprehensiveArchitectureReport JSON files (e.g. from batch_analyzer.py)"""
+    from pathlib import Path
+    from enhanced_analyzer import ComprehensiveArchitectureReport
+    from report_diff import diff_reports, format_diff_markdown, print_diff
+    
+    before = ComprehensiveArchitectureReport.model_validate_json(Path(before_path).read_text(encoding="utf-8"))
+    after = ComprehensiveArchitectureReport.model_validate_json(Path(after_path).read_text(encoding="utf-8"))
+    diff = diff_reports(before, after)
+    print_diff(diff)
+    if output:
+        Path(output).write_text(format_diff_markdown(diff), encoding="utf-8")
+        print(f"Diff saved to {output}")
+
+
+def run_analytics(directory: str, top: int = 10):
+    """Aggregate saved ComprehensiveArchitectureReport JSON files (e.g. from batch_analyzer.py)"""
+    from report_analytics import ReportDirectory, print_analytics, summarize
+    
+    reports = ReportDirectory(directory)
+    print_analytics(summarize(reports.columns(), top))
+    if reports.skipped:
+        print(f"Skipped {reports.skipped} files that are not comprehensive reports")
+
+
 async def run_custom_analysis(analysis_type: AnalysisType):
     """Run analysis with specified type"""
     from enhanced_analyzer import EnhancedSystemAnalyzerApp
@@ -27,6 +103,21 @@ async def run_custom_analysis(analysis_type: AnalysisType):
     await app.run(analysis_type)
 
 
+async def run_profiled(analysis_type: AnalysisType, output: str):
+    """Run the analysis under the request profiler and save a flamegraph-compatible artifact"""
+    from pathlib import Path
+    from request_profiler import RequestProfile, print_profile
+    
+    profile = RequestProfile()
+    try:
+        with profile.capture():
+            await run_custom_analysis(analysis_type)
+    finally:
+        Path(output).write_text(profile.folded(), encoding="utf-8")
+        print_profile(profile)
+        print(f"Folded stacks saved to {output}")
+
+
 def main():
     """Entry point for the application"""
     args = parse_arguments()
@@ -45,7 +136,18 @@ def main():
     
     # Run the appropriate analysis
     try:
-        if analysis_type == AnalysisType.COMPREHENSIVE:
+        if args.diff:
+            run_diff(*args.diff, output=args.diff_output)
+        elif args.analytics:
+            run_analytics(args.analytics, args.top)
+        elif args.schemas:
+            from enhanced_analyzer import print_schema_savings
+            print_schema_savings()
+        elif args.plan:
+            asyncio.run(run_plan(analysis_type))
+        elif args.profile:
+            asyncio.run(run_profiled(analysis_type, args.profile))
+        elif analysis_type == AnalysisType.COMPREHENSIVE:
             # Use the default main function from enhanced_analyzer
             asyncio.run(enhanced_main())
         else:
@@ -54,6 +156,9 @@ def main():
     except KeyboardInterrupt:
         print("\nProcess interrupted by user")
         sys.exit(0)
+    except BudgetExceededError as e:
+        print(f"Budget exceeded: {e}")
+        sys.exit(2)
     except Exception as e:
         print(f"Error: {e}")
         sys.exit(1)
@@ -0,0 +1,94 @@
+"""
+المستند المُعيَّن في الذاكرة (Memory-mapped Document)
+يفتح ملف الإدخال بـ mmap بدلاً من قراءته كاملاً في str: الصفحات تُحمَّل من ذاكرة
+التخزين المؤقت للنظام عند الحاجة، وفك الترميز يتم كتلة كتلة.
+العد والتجزئة والتقسيم تمر على الكتل دون نسخة كاملة من النص، والمطالبات لا تفك
+إلا البادئة التي تتسع لميزانية الرموز، فتبقى ذاكرة العملية ثابتة تقريباً مع السجلات الضخمة.
+
+فك الترميز مطابق لـ AsyncFileHandler.read_file (UTF-8 مع توحيد نهايات الأسطر).
+"""
+
+import codecs
+import io
+import mmap
+import os
+from typing import Dict, Iterator, Optional, Union
+
+from token_planner import estimate_tokens, truncate_to_tokens
+
+# حجم كتلة فك الترميز بالبايت
+BLOCK_BYTES = 1 << 16
+
+
+class MappedDocument:
+    """ملف نصي UTF-8 للقراءة فقط مُعيَّن في الذاكرة"""
+
+    def __init__(self, path: str, block_bytes: int = BLOCK_BYTES):
+        self.path = path
+        self.block_bytes = block_bytes
+        self._tokens: Dict[str, int] = {}
+        with open(path, "rb") as f:
+            self.size = os.fstat(f.fileno()).st_size
+            # الملف الفارغ لا يُعيَّن؛ mmap يحتفظ بنسخته من الواصف بعد إغلاق الملف
+            self._map: Optional[mmap.mmap] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        if self._map is not None and hasattr(mmap, "MADV_SEQUENTIAL"):
+            # قراءة متتابعة: يمكن للنظام التخلص من الصفحات المقروءة مبكراً
+            self._map.madvise(mmap.MADV_SEQUENTIAL)
+
+    def __enter__(self) -> "MappedDocument":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def blocks(self) -> Iterator[str]:
+        """النص مفكوك الترميز كتلةً كتلة (الحرف متعدد البايتات و \\r\\n لا ينقسمان بين كتلتين)"""
+        if self._map is None:
+            return
+        decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder("utf-8")(), translate=True)
+        for start in range(0, self.size, self.block_bytes):
+            end = start + self.block_bytes
+            text = decoder.decode(self._map[start:end], final=end >= self.size)
+            if text:
+                yield text
+
+    def estimate_tokens(self, model: str = "") -> int:
+        """مجموع رموز الكتل (يُحسب مرة واحدة لكل نموذج)"""
+        if model not in self._tokens:
+            self._tokens[model] = sum(estimate_tokens(block, model) for block in self.blocks())
+        return self._tokens[model]
+
+    def update_hash(self, digest) -> None:
+        """تحديث بصمة بنفس بايتات text.encode('utf-8') للنص المقروء كاملاً"""
+        for block in self.blocks():
+            digest.update(block.encode("utf-8"))
+
+    def prefix(self, max_tokens: int, model: str = "") -> str:
+        """بداية المستند ضمن ميزانية رموز: تُفك فقط الكتل اللازمة"""
+        parts = []
+        tokens = 0
+        for block in self.blocks():
+            parts.append(block)
+            tokens += estimate_tokens(block, model)
+            if tokens > max_tokens:
+                break
+        return truncate_to_tokens("".join(parts), max_tokens, model)
+
+    def __repr__(self) -> str:
+        return f"MappedDocument({self.path!r}, {self.size} bytes)"
+
+
+# نص في الذاكرة أو مستند مُعيَّن؛ الدوال التي تقبل أياً منهما
+Document = Union[str, MappedDocument]
+
+
+def document_blocks(source: Document) -> Iterator[str]:
+    if isinstance(source, str):
+        yield source
+    else:
+        yield from source.blocks()
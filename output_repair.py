@@ -0,0 +1,319 @@
+"""
+الإصلاح المحلي للمخرجات المنظمة (Local Structured-Output Repair)
+يحاول إصلاح استجابة النموذج حتمياً قبل اللجوء إلى إعادة السؤال:
+- قصّ القيم الرقمية إلى حدودها (clamping)
+- مطابقة تقريبية لقيم Literal
+- تعبئة القيم الافتراضية للحقول الناقصة
+- تحويل الأنواع (نص → رقم، نص → قائمة، ...)
+"""
+
+import difflib
+import json
+import re
+import types
+from dataclasses import dataclass, field
+from typing import Any, List, Literal, Optional, Tuple, Type, Union, get_args, get_origin
+
+from pydantic import BaseModel, ValidationError
+from pydantic.fields import FieldInfo
+
+_NUMBER_RE = re.compile(r"-?\d+(?:[.,]\d+)?")
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+_MISSING = object()
+
+
+@dataclass
+class RepairOutcome:
+    """نتيجة محاولة الإصلاح المحلي"""
+    instance: Optional[BaseModel] = None
+    fixes: List[str] = field(default_factory=list)
+    errors: List[dict] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return self.instance is not None
+
+
+# =================================================================================================
+# استخراج الحمولة الخام (Raw Payload Extraction)
+# =================================================================================================
+
+def extract_raw_payload(completion: Any) -> Optional[str]:
+    """استخراج نص JSON الخام من استجابة ChatCompletion (وضع الأدوات أو وضع JSON)"""
+    try:
+        message = completion.choices[0].message
+    except (AttributeError, IndexError, TypeError):
+        return None
+
+    tool_calls = getattr(message, "tool_calls", None) or []
+    if tool_calls:
+        return tool_calls[0].function.arguments
+    return getattr(message, "content", None)
+
+
+def parse_payload(raw: Any) -> Any:
+    """تحويل النص الخام إلى كائن Python مع إزالة أسوار ```json إن وجدت"""
+    if not isinstance(raw, str):
+        return raw
+    text = _FENCE_RE.sub("", raw.strip())
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return _MISSING
+
+
+def format_errors(errors: List[dict]) -> str:
+    """تنسيق أخطاء التحقق كسطور قصيرة تصلح لرسالة المتابعة"""
+    lines = []
+    for err in errors:
+        loc = ".".join(str(part) for part in err.get("loc", ())) or "<root>"
+        lines.append(f"- {loc}: {err.get('msg', '')}")
+    return "\n".join(lines)
+
+
+# =================================================================================================
+# أدوات الأنواع (Annotation Helpers)
+# =================================================================================================
+
+def _unwrap_optional(annotation: Any) -> Tuple[Any, bool]:
+    origin = get_origin(annotation)
+    if origin is Union or origin is types.UnionType:
+        args = [a for a in get_args(annotation) if a is not type(None)]
+        if len(args) == 1:
+            return args[0], True
+    return annotation, False
+
+
+def _resolve_field(model: Type[BaseModel], loc: Tuple) -> Tuple[Any, Optional[FieldInfo]]:
+    """إرجاع نوع الحقل و FieldInfo الخاص به عند المسار loc"""
+    annotation: Any = model
+    info: Optional[FieldInfo] = None
+    for part in loc:
+        annotation, _ = _unwrap_optional(annotation)
+        if isinstance(part, int):
+            args = get_args(annotation)
+            if get_origin(annotation) not in (list, List) or not args:
+                return None, None
+            annotation, info = args[0], None
+        elif isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            info = annotation.model_fields.get(part)
+            if info is None:
+                return None, None
+            annotation = info.annotation
+        else:
+            return None, None
+    return annotation, info
+
+
+def _bounds(info: Optional[FieldInfo]) -> dict:
+    bounds = {}
+    if info is None:
+        return bounds
+    for meta in info.metadata:
+        for key in ("ge", "gt", "le", "lt"):
+            value = getattr(meta, key, None)
+            if value is not None:
+                bounds[key] = value
+    return bounds
+
+
+def _default_for(annotation: Any, info: Optional[FieldInfo]) -> Any:
+    """القيمة الافتراضية الآمنة لحقل ناقص، أو _MISSING إن لم توجد"""
+    if info is not None and not info.is_required():
+        return info.get_default(call_default_factory=True)
+    inner, optional = _unwrap_optional(annotation)
+    if optional:
+        return None
+    if get_origin(inner) in (list, List):
+        return []
+    return _MISSING
+
+
+# =================================================================================================
+# الوصول إلى المسارات (Path Access)
+# =================================================================================================
+
+def _parent_of(data: Any, loc: Tuple) -> Tuple[Any, Any]:
+    node = data
+    for part in loc[:-1]:
+        try:
+            node = node[part]
+        except (KeyError, IndexError, TypeError):
+            return _MISSING, None
+    return node, loc[-1]
+
+
+def _get(data: Any, loc: Tuple) -> Any:
+    parent, key = _parent_of(data, loc)
+    if parent is _MISSING:
+        return _MISSING
+    try:
+        return parent[key]
+    except (KeyError, IndexError, TypeError):
+        return _MISSING
+
+
+def _set(data: Any, loc: Tuple, value: Any) -> bool:
+    parent, key = _parent_of(data, loc)
+    if parent is _MISSING or not isinstance(parent, (dict, list)):
+        return False
+    if isinstance(parent, list) and not (isinstance(key, int) and key < len(parent)):
+        return False
+    parent[key] = value
+    return True
+
+
+# =================================================================================================
+# الإصلاحات الحتمية (Deterministic Fixes)
+# =================================================================================================
+
+def _to_number(value: Any, info: Optional[FieldInfo]) -> Any:
+    if isinstance(value, bool):
+        return _MISSING
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        return _MISSING
+    match = _NUMBER_RE.search(value)
+    if not match:
+        return _MISSING
+    number = float(match.group().replace(",", "."))
+    # "85%" لحقل حده الأعلى 1 تعني 0.85 (فقط مع علامة % صريحة)
+    bounds = _bounds(info)
+    if "%" in value and bounds.get("le", bounds.get("lt")) == 1:
+        number /= 100
+    return number
+
+
+def _clamp(value: Any, info: Optional[FieldInfo]) -> Any:
+    number = _to_number(value, info)
+    if number is _MISSING:
+        return _MISSING
+    bounds = _bounds(info)
+    # الحدود الحصرية (gt/lt) لا قيمة صالحة عندها: يبقى الخطأ لرسالة المتابعة
+    if "lt" in bounds and number >= bounds["lt"]:
+        return _MISSING
+    if "gt" in bounds and number <= bounds["gt"]:
+        return _MISSING
+    if "le" in bounds and number > bounds["le"]:
+        number = bounds["le"]
+    if "ge" in bounds and number < bounds["ge"]:
+        number = bounds["ge"]
+    return number
+
+
+def _match_literal(value: Any, annotation: Any, info: Optional[FieldInfo]) -> Any:
+    inner, _ = _unwrap_optional(annotation)
+    if get_origin(inner) is not Literal:
+        return _MISSING
+    choices = [c for c in get_args(inner) if isinstance(c, str)]
+    if not choices:
+        return _MISSING
+
+    text = str(value).strip().lower() if value is not None else ""
+    by_lower = {c.lower(): c for c in choices}
+    if text in by_lower:
+        return by_lower[text]
+
+    close = difflib.get_close_matches(text, list(by_lower), n=1, cutoff=0.6)
+    if close:
+        return by_lower[close[0]]
+
+    # احتواء جزئي (مثال: "Message Queue" → "Queue")
+    for lower, choice in by_lower.items():
+        if lower in text:
+            return choice
+
+    if info is not None and not info.is_required():
+        return info.get_default(call_default_factory=True)
+    return _MISSING
+
+
+def _to_list(value: Any) -> Any:
+    if isinstance(value, str):
+        parsed = parse_payload(value)
+        if isinstance(parsed, list):
+            return parsed
+        parts = [p.strip(" -•\t") for p in re.split(r"[\n,،;]", value)]
+        return [p for p in parts if p]
+    if isinstance(value, (dict, int, float)):
+        return [value]
+    return _MISSING
+
+
+def _to_string(value: Any) -> Any:
+    if isinstance(value, list):
+        return ", ".join(str(v) for v in value)
+    if isinstance(value, (int, float, bool)):
+        return str(value)
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False)
+    return _MISSING
+
+
+def _fix_error(model: Type[BaseModel], data: Any, error: dict) -> Optional[str]:
+    """تطبيق إصلاح واحد لخطأ تحقق؛ يعيد نوع الإصلاح أو None"""
+    loc = tuple(error.get("loc", ()))
+    kind = error.get("type", "")
+    if not loc:
+        return None
+
+    annotation, info = _resolve_field(model, loc)
+    current = _get(data, loc)
+
+    if kind == "missing":
+        value, fix = _default_for(annotation, info), "default"
+    elif kind in ("greater_than", "greater_than_equal", "less_than", "less_than_equal"):
+        value, fix = _clamp(current, info), "clamp"
+    elif kind == "literal_error":
+        value, fix = _match_literal(current, annotation, info), "literal"
+    elif kind in ("float_parsing", "float_type", "int_parsing", "int_type", "int_from_float"):
+        value, fix = _to_number(current, info), "coerce"
+        if value is not _MISSING and kind.startswith("int"):
+            value = int(round(value))
+        if value is not _MISSING:
+            value = _clamp(value, info)
+    elif kind == "list_type":
+        value, fix = _to_list(current), "coerce"
+    elif kind == "string_type":
+        value, fix = _to_string(current), "coerce"
+    elif kind in ("model_type", "model_attributes_type", "dict_type") and isinstance(current, str):
+        value, fix = parse_payload(current), "coerce"
+    else:
+        return None
+
+    if value is _MISSING or not _set(data, loc, value):
+        return None
+    return fix
+
+
+def repair(model: Type[BaseModel], raw: Any, max_passes: int = 4) -> RepairOutcome:
+    """
+    محاولة التحقق من الحمولة ثم إصلاحها محلياً على عدة تمريرات
+    (قد يكشف إصلاح خطأ عن أخطاء متداخلة أخرى)
+    """
+    outcome = RepairOutcome()
+    data = parse_payload(raw)
+    if data is _MISSING:
+        outcome.errors = [{"loc": (), "msg": "Response is not valid JSON", "type": "json_invalid"}]
+        return outcome
+
+    for attempt in range(max_passes + 1):
+        try:
+            outcome.instance = model.model_validate(data)
+            outcome.errors = []
+            return outcome
+        except ValidationError as e:
+            outcome.errors = e.errors(include_url=False)
+        if attempt == max_passes:
+            break
+
+        applied = [_fix_error(model, data, err) for err in outcome.errors]
+        outcome.fixes.extend(fix for fix in applied if fix)
+        if not all(applied):
+            # إبقاء الأخطاء التي تعذر إصلاحها فقط لرسالة المتابعة
+            outcome.errors = [err for err, fix in zip(outcome.errors, applied) if not fix]
+            break
+
+    return outcome
@@ -0,0 +1,300 @@
+"""
+وضع Batch API لدى المزوّد (Provider Batch Mode)
+للتحليلات الليلية غير التفاعلية: تُجمع استدعاءات كل المراحل لكل المستندات في ملف
+JSONL واحد يُرسل كمهمة batch، ثم تُستطلع حتى الاكتمال وتُتحقق النتائج وتُجمع في
+ComprehensiveArchitectureReport.
+
+المراحل التابعة (الفشل والأداء تحتاج التحليل الأساسي) لا يمكن أن تكون في نفس المهمة
+مع مدخلاتها، لذا تُرسل مهمة واحدة لكل مستوى من رسم المراحل: الوكيل يشغّل نفس
+الرسم البياني ونفس التعليمات، لكن كل استدعاء ينتظر في الطابور حتى تُرسل الدفعة.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple, Type, Union
+
+import instructor
+from openai import AsyncOpenAI
+from pydantic import BaseModel
+
+import compact_schemas
+import output_repair
+from enhanced_analyzer import (
+    ANALYSIS_STAGES,
+    REPORT_STAGES,
+    AnalysisType,
+    AppConfig,
+    ComprehensiveArchitectureReport,
+    EnhancedArchitecturalAnalystAgent,
+)
+from runtime_metrics import metrics
+
+logger = logging.getLogger("ArchitectureAnalyzerApp")
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+class BatchJobError(RuntimeError):
+    """فشل مهمة batch كاملة أو غياب نتيجة استدعاء منها"""
+
+
+# =================================================================================================
+# صيغة JSONL (Request / Result Lines)
+# =================================================================================================
+
+def tool_for(response_model: Type[BaseModel]) -> dict:
+    """نفس أداة الدالة التي يرسلها instructor في وضع TOOLS"""
+    return {"type": "function", "function": instructor.openai_schema(response_model).openai_schema}
+
+
+def request_line(custom_id: str, model: str, temperature: float,
+                 response_model: Type[BaseModel], messages: List[dict]) -> dict:
+    tool = tool_for(response_model)
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "tools": [tool],
+            "tool_choice": {"type": "function", "function": {"name": tool["function"]["name"]}},
+        },
+    }
+
+
+def parse_result_line(line: dict) -> Tuple[Optional[str], Optional[str]]:
+    """(النص الخام، الخطأ) من سطر نتيجة واحد"""
+    if line.get("error"):
+        return None, json.dumps(line["error"], ensure_ascii=False)
+    response = line.get("response") or {}
+    if response.get("status_code", 200) >= 400:
+        return None, json.dumps(response.get("body"), ensure_ascii=False)
+    try:
+        message = response["body"]["choices"][0]["message"]
+    except (KeyError, IndexError, TypeError):
+        return None, "Malformed batch result line"
+    tool_calls = message.get("tool_calls") or []
+    if tool_calls:
+        return tool_calls[0]["function"]["arguments"], None
+    return message.get("content"), None
+
+
+# =================================================================================================
+# مهمة الـ Batch لدى المزوّد (Provider Batch Job)
+# =================================================================================================
+
+class ProviderBatchClient:
+    """رفع JSONL، إنشاء المهمة، الاستطلاع حتى الاكتمال ثم تنزيل النتائج"""
+
+    def __init__(self, client: AsyncOpenAI, poll_interval: float = 30.0, completion_window: str = "24h"):
+        self.client = client
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+
+    async def run(self, lines: List[dict]) -> Dict[str, dict]:
+        payload = "\n".join(json.dumps(line, ensure_ascii=False) for line in lines).encode("utf-8")
+        uploaded = await self.client.files.create(file=("stages.jsonl", payload), purpose="batch")
+        batch = await self.client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=self.completion_window
+        )
+        metrics.incr("batch_api.jobs")
+        logger.info(f"📦 Submitted batch {batch.id} with {len(lines)} requests")
+
+        while batch.status not in TERMINAL_STATUSES:
+            await asyncio.sleep(self.poll_interval)
+            batch = await self.client.batches.retrieve(batch.id)
+            counts = batch.request_counts
+            if counts is not None:
+                logger.info(f"⏳ Batch {batch.id}: {batch.status} ({counts.completed}/{counts.total})")
+
+        if batch.status != "completed":
+            raise BatchJobError(f"Batch {batch.id} ended with status '{batch.status}'")
+
+        results: Dict[str, dict] = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            content = await self.client.files.content(file_id)
+            for raw in content.text.splitlines():
+                if raw.strip():
+                    line = json.loads(raw)
+                    results[line["custom_id"]] = line
+        return results
+
+
+# =================================================================================================
+# تجميع الاستدعاءات (Call Collection)
+# =================================================================================================
+
+@dataclass
+class PendingCall:
+    custom_id: str
+    stage: str
+    response_model: Type[BaseModel]
+    messages: List[dict]
+    future: asyncio.Future
+
+
+class BatchCollector:
+    """يجمع استدعاءات المراحل المعلقة ويرسلها معاً كمهمة batch واحدة"""
+
+    def __init__(self, jobs: ProviderBatchClient, config: AppConfig):
+        self.jobs = jobs
+        self.model = config.model_name
+        self.temperature = config.temperature
+        self.compact = config.compact_schemas
+        self.pending: List[PendingCall] = []
+        self._ids = itertools.count(1)
+        # يُضبط عند كل استدعاء جديد وعند انتهاء أي مستند
+        self._changed = asyncio.Event()
+
+    def notify(self, *_) -> None:
+        self._changed.set()
+
+    def enqueue(self, stage: str, response_model: Type[BaseModel], messages: List[dict]) -> asyncio.Future:
+        call = PendingCall(
+            custom_id=f"{stage}-{next(self._ids)}",
+            stage=stage,
+            response_model=response_model,
+            messages=messages,
+            future=asyncio.get_running_loop().create_future(),
+        )
+        self.pending.append(call)
+        self.notify()
+        return call.future
+
+    async def settle(self, documents: List[Tuple["BatchAnalystAgent", asyncio.Task]]) -> None:
+        """
+        انتظار توقف كل المستندات: إما انتهت أو كل مراحلها الجاهزة في الطابور
+        (يُعاد الفحص عند كل استدعاء جديد أو انتهاء مستند، دون عدّ دورات حلقة الأحداث)
+        """
+        while not all(task.done() or agent.blocked() for agent, task in documents):
+            self._changed.clear()
+            await self._changed.wait()
+
+    async def flush(self) -> None:
+        calls, self.pending = self.pending, []
+        lines = [
+            request_line(
+                call.custom_id,
+                self.model,
+                self.temperature,
+                compact_schemas.compact_model(call.response_model) if self.compact else call.response_model,
+                call.messages
+            )
+            for call in calls
+        ]
+        try:
+            results = await self.jobs.run(lines)
+        except Exception as e:
+            # فشل المهمة كاملة يُسجَّل على كل استدعاء فيها، فتفشل مستنداتها فقط
+            logger.error(f"Batch job failed: {e}")
+            for call in calls:
+                if not call.future.done():
+                    call.future.set_exception(e)
+            return
+
+        for call in calls:
+            self._resolve(call, results.get(call.custom_id))
+
+    def _resolve(self, call: PendingCall, line: Optional[dict]) -> None:
+        if call.future.done():
+            # المستند فشل في مرحلة أخرى وأُلغي انتظار هذه المرحلة
+            return
+        if line is None:
+            call.future.set_exception(BatchJobError(f"No result for {call.custom_id}"))
+            return
+        raw, error = parse_result_line(line)
+        if error is not None:
+            metrics.incr("batch_api.errors")
+            call.future.set_exception(BatchJobError(f"{call.stage}: {error}"))
+            return
+        # لا إعادة سؤال في وضع الـ batch: الإصلاح المحلي الحتمي فقط
+        outcome = output_repair.repair(call.response_model, raw)
+        if outcome.ok:
+            metrics.incr("structured_output.repaired" if outcome.fixes else "structured_output.valid")
+            call.future.set_result(outcome.instance)
+        else:
+            metrics.incr("structured_output.failed")
+            call.future.set_exception(ValueError(
+                f"{call.stage} output failed validation:\n{output_repair.format_errors(outcome.errors)}"
+            ))
+
+
+class BatchAnalystAgent(EnhancedArchitecturalAnalystAgent):
+    """نفس الوكيل والمراحل، لكن كل استدعاء للنموذج يمر عبر مهمة batch"""
+
+    def __init__(self, config: AppConfig, collector: BatchCollector, client: AsyncOpenAI):
+        # العميل المشترك للدفعة: لا يُنشأ عميل لكل مستند (الاستدعاءات تمر عبر المجمِّع)
+        super().__init__(config, client=client)
+        self.collector = collector
+        self.stages = REPORT_STAGES.closure(ANALYSIS_STAGES[AnalysisType.COMPREHENSIVE])
+        # المراحل المكتملة (من الذاكرة المؤقتة أو من دفعة) والمراحل المنتظرة في الطابور
+        self.completed: Set[str] = set()
+        self.parked: Dict[str, asyncio.Future] = {}
+
+    def blocked(self) -> bool:
+        """كل مرحلة جاهزة (مدخلاتها مكتملة) تنتظر نتيجتها في الطابور"""
+        ready = {
+            stage for stage in self.stages
+            if stage not in self.completed and all(
+                dep in self.completed or dep in REPORT_STAGES.sources for dep in REPORT_STAGES.get(stage).inputs
+            )
+        }
+        return ready == {stage for stage, future in self.parked.items() if not future.done()}
+
+    async def _call_llm(self, stage, response_model, messages):
+        result = await super()._call_llm(stage, response_model, messages)
+        self.completed.add(stage)
+        return result
+
+    async def _request_structured(self, stage, response_model, messages):
+        future = self.collector.enqueue(stage, response_model, messages)
+        self.parked[stage] = future
+        return await future
+
+
+# =================================================================================================
+# التشغيل (Runner)
+# =================================================================================================
+
+async def run_batch_reports(
+    config: AppConfig,
+    documents: Dict[str, str],
+    poll_interval: float = 30.0,
+    completion_window: str = "24h"
+) -> Dict[str, Union[ComprehensiveArchitectureReport, BaseException]]:
+    """تقرير شامل لكل مستند؛ الأخطاء تُعاد لكل مستند على حدة بدلاً من إسقاط الدفعة"""
+    async with AsyncOpenAI(api_key=config.api_key) as client:
+        collector = BatchCollector(ProviderBatchClient(client, poll_interval, completion_window), config)
+        agents = {doc_id: BatchAnalystAgent(config, collector, client) for doc_id in documents}
+        tasks = {
+            doc_id: asyncio.create_task(agents[doc_id].generate_comprehensive_report(text))
+            for doc_id, text in documents.items()
+        }
+        for task in tasks.values():
+            task.add_done_callback(collector.notify)
+        try:
+            while True:
+                await collector.settle([(agents[doc_id], task) for doc_id, task in tasks.items()])
+                if not collector.pending:
+                    break
+                await collector.flush()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+        finally:
+            for task in tasks.values():
+                if not task.done():
+                    task.cancel()
+
+    return {
+        doc_id: task.exception() if task.exception() is not None else task.result()
+        for doc_id, task in tasks.items()
+    }
@@ -0,0 +1,310 @@
+"""
+جلسات الأسئلة التالية (Follow-up Q&A Sessions)
+بعد التقرير الشامل يبقى في الخادم، لكل جلسة: النتائج المنظمة وفهرس استرجاع
+(BM25 معجمي) فوق كيانات التقرير وأجزاء النص الأصلي. كل سؤال يُجاب من سياق مضغوط:
+نظرة عامة + المقاطع الأقرب + آخر الأسئلة، دون إعادة رفع النص أو إعادة التحليل.
+
+الجلسات في ذاكرة العملية مع إخلاء LRU وانتهاء صلاحية بعد مدة خمول (TTL).
+"""
+
+import asyncio
+import math
+import secrets
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from concurrency_limiter import llm_limiter
+from report_diff import normalize_key
+from runtime_metrics import metrics
+from summary_tree import chunk_text
+from token_planner import estimate_tokens
+
+# أجزاء النص الأصلي في الفهرس (أصغر من أجزاء شجرة الملخصات لاسترجاع أدق)
+SOURCE_CHUNK_TOKENS = 300
+# عدد الأسئلة السابقة المرسلة مع كل سؤال
+HISTORY_TURNS = 3
+
+_BM25_K1 = 1.5
+_BM25_B = 0.75
+
+# نهاية بث المزوّد في طابور الإجابة
+_STREAM_END = object()
+
+
+# =================================================================================================
+# فهرس الاسترجاع (Retrieval Index)
+# =================================================================================================
+
+@dataclass
+class Passage:
+    id: str
+    kind: str
+    text: str
+
+
+def _terms(text: str) -> List[str]:
+    return [t for t in normalize_key(text).split() if len(t) > 1]
+
+
+class RetrievalIndex:
+    """BM25 بفهرس مقلوب: الاستعلام يمر فقط على المقاطع التي تحتوي كلماته"""
+
+    def __init__(self, passages: List[Passage]):
+        self.passages = passages
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._lengths: List[int] = []
+        for i, passage in enumerate(passages):
+            counts = Counter(_terms(passage.text))
+            self._lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self._postings.setdefault(term, []).append((i, tf))
+        self._average = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+
+    def search(self, query: str, k: int = 8) -> List[Tuple[Passage, float]]:
+        n = len(self.passages)
+        scores: Dict[int, float] = {}
+        for term in set(_terms(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for i, tf in postings:
+                norm = tf + _BM25_K1 * (1 - _BM25_B + _BM25_B * self._lengths[i] / (self._average or 1))
+                scores[i] = scores.get(i, 0.0) + idf * tf * (_BM25_K1 + 1) / norm
+        best = sorted(scores.items(), key=lambda item: -item[1])[:k]
+        return [(self.passages[i], round(score, 3)) for i, score in best]
+
+
+def report_passages(report: BaseModel) -> List[Passage]:
+    """مقطع لكل كيان في ComprehensiveArchitectureReport (بالاسم لتجنب الاستيراد الدائري)"""
+    basic = report.basic_analysis
+    failure = report.failure_analysis
+    integration = report.integration_analysis
+    performance = report.performance_analysis
+    passages: List[Passage] = []
+
+    def add(kind: str, text: str) -> None:
+        passages.append(Passage(f"{kind}-{len(passages) + 1}", kind, text))
+
+    for c in basic.core_components:
+        add("component", f"المكون {c.name} ({c.type}، أهمية {c.criticality}): {c.responsibility}. التقنيات: {', '.join(c.technologies)}")
+    for f in basic.data_flows:
+        add("data_flow", f"تدفق {f.source} → {f.target} عبر {f.protocol}: {f.data_type}" + (f" ({f.throughput})" if f.throughput else ""))
+    engine = basic.decision_engine
+    add("decision_engine", f"محرك القرار: {engine.negotiation_protocol}، مقياس التحسين {engine.optimization_metric}")
+    for item in basic.key_innovations:
+        add("innovation", item)
+    for item in basic.implementation_challenges:
+        add("challenge", item)
+    for v in failure.critical_vulnerabilities:
+        add("risk", f"نقطة فشل: {v.failure_point} (احتمال {v.probability}، خطورة {v.severity}). التخفيف: {v.mitigation_strategy}"
+            + (f". البديل: {v.fallback_option}" if v.fallback_option else ""))
+    for item in failure.single_points_of_failure:
+        add("single_point_of_failure", f"نقطة فشل وحيدة: {item}")
+    for item in failure.redundancy_requirements:
+        add("redundancy", item)
+    add("recovery", f"هدف زمن التعافي: {failure.recovery_time_objective}. {failure.disaster_recovery_plan or ''}")
+    for t in integration.tech_stack_analysis:
+        add("technology", f"التقنية {t.technology} ({t.version_range}، خطر الإهمال {t.deprecation_risk}). "
+            f"مشاكل التوافق: {', '.join(t.compatibility_issues) or 'لا يوجد'}. نقاط التكامل: {', '.join(t.integration_points)}")
+    add("integration", f"أنماط التكامل: {', '.join(integration.integration_patterns_used)}. "
+        f"توافق API: {integration.api_compatibility_score}. الامتثال: {', '.join(integration.security_compliance)}")
+    for m in performance.scalability_metrics:
+        add("scalability", f"المقياس {m.metric_name}: السعة {m.current_capacity}، عامل التوسع {m.scalability_factor}"
+            + (f"، عنق الزجاجة {m.bottleneck}" if m.bottleneck else ""))
+    add("performance", f"الإنتاجية {performance.throughput_estimate}؛ الزمن {performance.latency_profile}؛ "
+        f"التوسع {performance.recommended_scaling_strategy}؛ التوزيع {performance.load_balancing_approach}؛ "
+        f"التخزين المؤقت {performance.caching_strategy}")
+    for item in performance.optimization_opportunities:
+        add("optimization", item)
+    if report.comparative_analysis is not None:
+        comparison = report.comparative_analysis
+        add("comparison", f"{comparison.system_a} مقابل {comparison.system_b}: {comparison.recommendation}. "
+            f"المقايضات: {', '.join(comparison.trade_offs)}")
+    return passages
+
+
+def source_passages(text: str, model: str = "") -> List[Passage]:
+    return [
+        Passage(f"source-{i}", "source", chunk)
+        for i, chunk in enumerate(chunk_text(text, SOURCE_CHUNK_TOKENS, model), 1)
+    ]
+
+
+# =================================================================================================
+# الجلسات (Sessions)
+# =================================================================================================
+
+@dataclass
+class QASession:
+    id: str
+    report: BaseModel
+    index: RetrievalIndex
+    model: str
+    overview: str
+    history: List[Tuple[str, str]] = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.monotonic)
+
+    def info(self) -> Dict:
+        return {
+            "session_id": self.id,
+            "model": self.model,
+            "passages": len(self.index.passages),
+            "questions": len(self.history),
+            "created_at": self.created_at,
+        }
+
+
+def build_overview(report: BaseModel) -> str:
+    """ملخص ثابت قصير يُرسل مع كل سؤال"""
+    basic = report.basic_analysis
+    components = "، ".join(f"{c.name} ({c.type})" for c in basic.core_components)
+    return (
+        f"النظام: {basic.winning_system_name}\n"
+        f"المكونات: {components}\n"
+        f"نقاط الفشل الوحيدة: {'، '.join(report.failure_analysis.single_points_of_failure)}\n"
+        f"استراتيجية التوسع: {report.performance_analysis.recommended_scaling_strategy}"
+    )
+
+
+def build_messages(session: QASession, question: str, context_tokens: int = 3000, k: int = 12) -> Tuple[List[dict], List[Passage]]:
+    """رسائل السؤال: النظرة العامة + أقرب المقاطع ضمن ميزانية الرموز + آخر الأسئلة"""
+    selected: List[Passage] = []
+    used = estimate_tokens(session.overview, session.model)
+    for passage, _ in session.index.search(question, k):
+        cost = estimate_tokens(passage.text, session.model)
+        if used + cost > context_tokens:
+            break
+        selected.append(passage)
+        used += cost
+
+    context = "\n".join(f"[{p.id}] {p.text}" for p in selected)
+    messages = [
+        {
+            "role": "system",
+            "content": f"""أنت مهندس معماري تجيب عن أسئلة متابعة حول نظام سبق تحليله.
+أجب من السياق التالي فقط، واذكر معرّفات المقاطع التي اعتمدت عليها بين قوسين مربعين.
+إذا لم يكفِ السياق للإجابة فقل ذلك صراحة. اكتب بالعربية الفصحى بإيجاز.
+
+نظرة عامة:
+{session.overview}
+
+المقاطع ذات الصلة:
+{context or "لا توجد مقاطع مطابقة."}"""
+        }
+    ]
+    for previous_question, previous_answer in session.history[-HISTORY_TURNS:]:
+        messages.append({"role": "user", "content": previous_question})
+        messages.append({"role": "assistant", "content": previous_answer})
+    messages.append({"role": "user", "content": question})
+    return messages, selected
+
+
+async def answer_stream(session: QASession, messages: List[dict], question: str, client, temperature: float = 0.2) -> AsyncIterator[str]:
+    """
+    بث الإجابة جزءاً جزءاً؛ تُضاف إلى سجل الجلسة فقط عند اكتمالها.
+    بث المزوّد يُقرأ إلى طابور داخل مقعد llm_limiter والعميل يقرأ الطابور خارجه: العميل البطيء
+    لا يحجز مقعداً، وانقطاعه يلغي القراءة فيُحتسب الاستدعاء ملغى لا ناجحاً.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def read_provider() -> None:
+        async with llm_limiter.slot("followup"):
+            stream = await client.chat.completions.create(
+                model=session.model,
+                messages=messages,
+                temperature=temperature,
+                stream=True,
+                response_model=None
+            )
+            try:
+                async for chunk in stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        queue.put_nowait(delta)
+            finally:
+                await stream.close()
+
+    reader = asyncio.create_task(read_provider())
+    reader.add_done_callback(lambda _: queue.put_nowait(_STREAM_END))
+    parts: List[str] = []
+    try:
+        while (delta := await queue.get()) is not _STREAM_END:
+            parts.append(delta)
+            yield delta
+        # خطأ المزوّد (إن وُجد) يظهر هنا بعد بث ما وصل قبله
+        await reader
+    finally:
+        if not reader.done():
+            reader.cancel()
+    session.history.append((question, "".join(parts)))
+    metrics.incr("sessions.questions")
+
+
+class SessionStore:
+    """جلسات بإخلاء LRU عند امتلاء السعة وحذف ما تجاوز ttl_seconds دون استخدام"""
+
+    def __init__(self, max_sessions: int = 256, ttl_seconds: float = 3600.0):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, QASession]" = OrderedDict()
+
+    def _expire(self) -> None:
+        cutoff = time.monotonic() - self.ttl_seconds
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.last_used >= cutoff:
+                break
+            self._sessions.popitem(last=False)
+            metrics.incr("sessions.expired")
+
+    def create(self, report: BaseModel, text: Optional[str] = None, model: str = "") -> QASession:
+        passages = report_passages(report) + (source_passages(text, model) if text else [])
+        session = QASession(
+            id=secrets.token_urlsafe(16),
+            report=report,
+            index=RetrievalIndex(passages),
+            model=model,
+            overview=build_overview(report),
+        )
+        with self._lock:
+            self._expire()
+            self._sessions[session.id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                metrics.incr("sessions.evicted")
+            metrics.set("sessions.active", len(self._sessions))
+        metrics.incr("sessions.created")
+        return session
+
+    def get(self, session_id: str) -> Optional[QASession]:
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_used = time.monotonic()
+                self._sessions.move_to_end(session_id)
+            metrics.set("sessions.active", len(self._sessions))
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            removed = self._sessions.pop(session_id, None) is not None
+            metrics.set("sessions.active", len(self._sessions))
+            return removed
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._expire()
+            return {"active": len(self._sessions), "max_sessions": self.max_sessions, "ttl_seconds": self.ttl_seconds}
+
+
+# مثيل مشترك لكل العملية
+qa_sessions = SessionStore()
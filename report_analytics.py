@@ -0,0 +1,268 @@
+"""
+تحليلات عبر التقارير المخزنة (Cross-report Analytics)
+تُحمَّل تقارير JSON الشاملة (مخرجات batch_analyzer.py أو ANALYZER_REPORT_DIR) في أعمدة
+مرمّزة بالقاموس (dictionary-encoded) مثل Arrow: كل قيمة نصية تصبح رقماً صحيحاً،
+والتجميعات تُحسب دفعة واحدة بـ bincount بدلاً من المرور على التقارير واحداً واحداً.
+
+NumPy من متطلبات المشروع (pyproject.toml / requirements.txt)؛ إن غاب عن البيئة
+تُستخدم نفس الأعمدة مع تجميع بايثون عادي (أبطأ، نفس النتائج) ويظهر ذلك في حقل engine.
+"""
+
+import json
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from rich.console import Console
+from rich.table import Table
+
+from report_diff import normalize_key
+
+try:
+    import numpy as np
+except ImportError:  # بيئة بدون المتطلبات الكاملة؛ نعود إلى التجميع العادي
+    np = None
+
+
+# =================================================================================================
+# الأعمدة (Columns)
+# =================================================================================================
+
+class Vocabulary:
+    """ترميز قاموسي: مفتاح مطبَّع ← رمز، مع أول تهجئة كاسم للعرض"""
+
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+        self.labels: List[str] = []
+
+    def encode(self, value: str) -> int:
+        key = normalize_key(value)
+        code = self.codes.get(key)
+        if code is None:
+            code = self.codes[key] = len(self.labels)
+            self.labels.append(str(value).strip())
+        return code
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+
+@dataclass
+class ReportRecord:
+    """ما يلزم التحليلات من تقرير واحد (بدون التحقق الكامل بـ pydantic)"""
+    components: List[Tuple[str, str]]
+    technologies: List[str]
+    api_compatibility_score: Optional[float]
+    single_points_of_failure: List[str]
+
+
+def extract_record(data: dict) -> ReportRecord:
+    basic = data["basic_analysis"]
+    integration = data["integration_analysis"]
+    failure = data["failure_analysis"]
+    score = integration.get("api_compatibility_score")
+    return ReportRecord(
+        components=[(c.get("type", ""), c.get("criticality", "medium")) for c in basic.get("core_components", [])],
+        technologies=[t["technology"] for t in integration.get("tech_stack_analysis", []) if t.get("technology")],
+        api_compatibility_score=float(score) if score is not None else None,
+        single_points_of_failure=[s for s in failure.get("single_points_of_failure", []) if s],
+    )
+
+
+def _array(values: List, dtype: str):
+    if np is None:
+        return values
+    return np.asarray(values, dtype=dtype)
+
+
+@dataclass
+class ReportColumns:
+    """جداول مسطحة: صف لكل مكون، لكل تقنية في تقرير، لكل نقطة فشل وحيدة في تقرير"""
+    reports: int = 0
+    component_type: Vocabulary = field(default_factory=Vocabulary)
+    criticality: Vocabulary = field(default_factory=Vocabulary)
+    technology: Vocabulary = field(default_factory=Vocabulary)
+    spof: Vocabulary = field(default_factory=Vocabulary)
+    component_type_codes: Sequence[int] = ()
+    criticality_codes: Sequence[int] = ()
+    tech_codes: Sequence[int] = ()
+    tech_scores: Sequence[float] = ()
+    spof_codes: Sequence[int] = ()
+
+    @classmethod
+    def from_records(cls, records: List[ReportRecord]) -> "ReportColumns":
+        columns = cls(reports=len(records))
+        types, crits, techs, scores, spofs = [], [], [], [], []
+        for record in records:
+            for component_type, criticality in record.components:
+                types.append(columns.component_type.encode(component_type))
+                crits.append(columns.criticality.encode(criticality))
+            if record.api_compatibility_score is not None:
+                # كل تقنية تُحسب مرة واحدة لكل تقرير
+                for code in {columns.technology.encode(t) for t in record.technologies}:
+                    techs.append(code)
+                    scores.append(record.api_compatibility_score)
+            spofs.extend({columns.spof.encode(s) for s in record.single_points_of_failure})
+
+        columns.component_type_codes = _array(types, "int32")
+        columns.criticality_codes = _array(crits, "int32")
+        columns.tech_codes = _array(techs, "int32")
+        columns.tech_scores = _array(scores, "float64")
+        columns.spof_codes = _array(spofs, "int32")
+        return columns
+
+
+# =================================================================================================
+# التجميعات (Aggregations)
+# =================================================================================================
+
+def _bincount(codes: Sequence[int], length: int, weights: Optional[Sequence[float]] = None) -> List[float]:
+    if np is not None:
+        return np.bincount(codes, weights=weights, minlength=length).tolist()
+    counts = [0.0] * length
+    if weights is None:
+        for code in codes:
+            counts[code] += 1
+    else:
+        for code, weight in zip(codes, weights):
+            counts[code] += weight
+    return counts
+
+
+def critical_component_types(columns: ReportColumns, top: int = 10) -> List[dict]:
+    """أنواع المكونات الأكثر تصنيفاً كحرجة (العدد والنسبة من مكونات النوع)"""
+    n = len(columns.component_type)
+    totals = _bincount(columns.component_type_codes, n)
+    critical = columns.criticality.codes.get("critical")
+    if critical is None:
+        hits = [0.0] * n
+    elif np is not None:
+        hits = _bincount(columns.component_type_codes[columns.criticality_codes == critical], n)
+    else:
+        hits = _bincount([t for t, c in zip(columns.component_type_codes, columns.criticality_codes) if c == critical], n)
+    rows = [
+        {"type": columns.component_type.labels[i], "critical": int(hits[i]), "total": int(totals[i]),
+         "critical_ratio": round(hits[i] / totals[i], 4)}
+        for i in range(n) if totals[i]
+    ]
+    rows.sort(key=lambda r: (-r["critical"], -r["critical_ratio"], r["type"]))
+    return rows[:top]
+
+
+def compatibility_by_technology(columns: ReportColumns, top: int = 10, min_reports: int = 1) -> List[dict]:
+    """متوسط api_compatibility_score للتقارير التي تستخدم كل تقنية"""
+    n = len(columns.technology)
+    counts = _bincount(columns.tech_codes, n)
+    sums = _bincount(columns.tech_codes, n, columns.tech_scores)
+    rows = [
+        {"technology": columns.technology.labels[i], "reports": int(counts[i]),
+         "mean_api_compatibility_score": round(sums[i] / counts[i], 4)}
+        for i in range(n) if counts[i] >= min_reports
+    ]
+    rows.sort(key=lambda r: (-r["reports"], r["technology"]))
+    return rows[:top]
+
+
+def frequent_single_points_of_failure(columns: ReportColumns, top: int = 10) -> List[dict]:
+    """نقاط الفشل الوحيدة الأكثر تكراراً (عدد التقارير التي ذكرتها)"""
+    n = len(columns.spof)
+    counts = _bincount(columns.spof_codes, n)
+    if np is not None:
+        order = np.argsort(-np.asarray(counts), kind="stable")[:top].tolist()
+    else:
+        order = sorted(range(n), key=lambda i: -counts[i])[:top]
+    return [
+        {"single_point_of_failure": columns.spof.labels[i], "reports": int(counts[i]),
+         "share": round(counts[i] / columns.reports, 4)}
+        for i in order if counts[i]
+    ]
+
+
+def summarize(columns: ReportColumns, top: int = 10, min_reports: int = 1) -> dict:
+    return {
+        "reports": columns.reports,
+        "engine": "numpy" if np is not None else "python",
+        "critical_component_types": critical_component_types(columns, top),
+        "compatibility_by_technology": compatibility_by_technology(columns, top, min_reports),
+        "single_points_of_failure": frequent_single_points_of_failure(columns, top),
+    }
+
+
+# =================================================================================================
+# التحميل من القرص (Loading)
+# =================================================================================================
+
+class ReportDirectory:
+    """
+    تقارير JSON في مجلد، مع إعادة قراءة الملفات الجديدة أو المعدلة فقط
+    (توقيع كل ملف: وقت التعديل والحجم) وإعادة بناء الأعمدة عند التغيير.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.skipped = 0
+        self._lock = threading.Lock()
+        self._records: Dict[str, Tuple[Tuple[int, int], Optional[ReportRecord]]] = {}
+        self._columns: Optional[ReportColumns] = None
+
+    def columns(self) -> ReportColumns:
+        with self._lock:
+            files = {}
+            if self.directory.exists():
+                for path in self.directory.glob("*.json"):
+                    stat = path.stat()
+                    files[path.name] = (path, (stat.st_mtime_ns, stat.st_size))
+
+            changed = files.keys() != self._records.keys()
+            for name, (path, signature) in files.items():
+                cached = self._records.get(name)
+                if cached is not None and cached[0] == signature:
+                    continue
+                changed = True
+                try:
+                    record = extract_record(json.loads(path.read_text(encoding="utf-8")))
+                except (OSError, ValueError, KeyError, TypeError, AttributeError):
+                    # ملفات JSON أخرى في المجلد (ليست تقارير شاملة) تُتجاهل
+                    record = None
+                self._records[name] = (signature, record)
+            for name in self._records.keys() - files.keys():
+                del self._records[name]
+
+            if changed or self._columns is None:
+                records = [record for _, record in self._records.values() if record is not None]
+                self.skipped = len(self._records) - len(records)
+                self._columns = ReportColumns.from_records(records)
+            return self._columns
+
+
+def print_analytics(summary: dict, title: str = "📊 Cross-report analytics") -> None:
+    """عرض التجميعات كجداول rich"""
+    console = Console()
+    console.print(f"[bold]{title}[/bold] — {summary['reports']} reports ({summary['engine']})")
+
+    table = Table(title="Most often critical component types")
+    table.add_column("Type", style="cyan")
+    table.add_column("Critical", justify="right")
+    table.add_column("Total", justify="right")
+    table.add_column("Ratio", justify="right")
+    for row in summary["critical_component_types"]:
+        table.add_row(row["type"], str(row["critical"]), str(row["total"]), f"{row['critical_ratio']:.0%}")
+    console.print(table)
+
+    table = Table(title="Average api_compatibility_score by technology")
+    table.add_column("Technology", style="cyan")
+    table.add_column("Reports", justify="right")
+    table.add_column("Mean score", justify="right")
+    for row in summary["compatibility_by_technology"]:
+        table.add_row(row["technology"], str(row["reports"]), f"{row['mean_api_compatibility_score']:.3f}")
+    console.print(table)
+
+    table = Table(title="Most frequent single points of failure")
+    table.add_column("Single point of failure", style="cyan")
+    table.add_column("Reports", justify="right")
+    table.add_column("Share", justify="right")
+    for row in summary["single_points_of_failure"]:
+        table.add_row(row["single_point_of_failure"], str(row["reports"]), f"{row['share']:.0%}")
+    console.print(table)
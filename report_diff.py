@@ -0,0 +1,214 @@
+"""
+الفرق المنظم بين تقريرين لنفس النظام (Structured Report Diff)
+يطابق الكيانات (المكونات، التدفقات، الثغرات، التقنيات، المقاييس...) بمفتاح مطبَّع
+عبر جداول تجزئة بدلاً من المقارنة الزوجية، فيبقى الزمن خطياً في عدد الكيانات.
+المخرجات: عناصر مضافة ومحذوفة ومتغيرة مع مسار كل تغيير.
+"""
+
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterable, List, Literal, Optional, Tuple
+
+from pydantic import BaseModel
+from rich.console import Console
+from rich.table import Table
+
+# حقول مفتاح المطابقة لكل نوع كيان (بالاسم لتجنب الاستيراد الدائري مع enhanced_analyzer)
+ENTITY_KEYS: Dict[str, Tuple[str, ...]] = {
+    "SystemComponent": ("name",),
+    "DataFlow": ("source", "target"),
+    "RiskAssessment": ("failure_point",),
+    "TechStackAnalysis": ("technology",),
+    "ScalabilityMetric": ("metric_name",),
+}
+
+# فروق الأرقام الأصغر من هذا تعد ضجيجاً (مثل 0.8 مقابل 0.80000001)
+_FLOAT_TOLERANCE = 1e-6
+
+_DIACRITICS = re.compile("[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]")
+# + و # و . تميّز أسماء التقنيات (C++ و C# و C، Node.js) فلا تُحذف
+_PUNCTUATION = re.compile(r"[^\w\s+#.]")
+# نقطة لا يليها حرف: نهاية جملة وليست جزءاً من الاسم
+_TRAILING_DOT = re.compile(r"\.(?!\w)")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_key(value: Any) -> str:
+    """مفتاح مطابقة: NFKC، بدون تشكيل أو تطويل أو ترقيم (عدا + و # و . داخل الأسماء)، بحالة أحرف موحدة"""
+    text = unicodedata.normalize("NFKC", str(value))
+    text = _DIACRITICS.sub("", text)
+    text = _PUNCTUATION.sub(" ", text)
+    text = _TRAILING_DOT.sub(" ", text)
+    return _SPACES.sub(" ", text).strip().casefold()
+
+
+@dataclass
+class Change:
+    kind: Literal["added", "removed", "changed"]
+    path: str
+    section: str
+    before: Any = None
+    after: Any = None
+
+
+@dataclass
+class ReportDiff:
+    changes: List[Change] = field(default_factory=list)
+
+    @property
+    def empty(self) -> bool:
+        return not self.changes
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        """عدد التغييرات لكل قسم ونوع"""
+        counts: Dict[str, Counter] = {}
+        for change in self.changes:
+            counts.setdefault(change.section, Counter())[change.kind] += 1
+        return {section: dict(counter) for section, counter in counts.items()}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "summary": self.summary(),
+            "total": len(self.changes),
+            "changes": [asdict(c) for c in self.changes],
+        }
+
+
+# =================================================================================================
+# المقارنة (Comparison)
+# =================================================================================================
+
+def _plain(value: Any) -> Any:
+    return value.model_dump() if isinstance(value, BaseModel) else value
+
+
+def _entity_key(item: BaseModel) -> str:
+    fields = ENTITY_KEYS.get(type(item).__name__)
+    if fields is None:
+        return normalize_key(item.model_dump_json())
+    return " → ".join(normalize_key(getattr(item, name)) for name in fields)
+
+
+def _label(item: BaseModel) -> str:
+    fields = ENTITY_KEYS.get(type(item).__name__, ())
+    return " → ".join(str(getattr(item, name)) for name in fields) or type(item).__name__
+
+
+def _index(items: Iterable[Any], key) -> Dict[str, Any]:
+    """جدول تجزئة بالمفتاح المطبَّع؛ المفاتيح المكررة تأخذ لاحقة #2، #3..."""
+    table: Dict[str, Any] = {}
+    seen: Counter = Counter()
+    for item in items:
+        k = key(item)
+        seen[k] += 1
+        table[k if seen[k] == 1 else f"{k}#{seen[k]}"] = item
+    return table
+
+
+class _Differ:
+    def __init__(self):
+        self.changes: List[Change] = []
+
+    def emit(self, kind: str, path: str, before: Any = None, after: Any = None) -> None:
+        self.changes.append(Change(kind, path, path.split(".")[0].split("[")[0], _plain(before), _plain(after)))
+
+    def value(self, path: str, before: Any, after: Any) -> None:
+        if isinstance(before, BaseModel) and isinstance(after, BaseModel) and type(before).__name__ == type(after).__name__:
+            self.model(path, before, after)
+        elif isinstance(before, list) and isinstance(after, list):
+            self.sequence(path, before, after)
+        elif before is None and after is not None:
+            self.emit("added", path, after=after)
+        elif before is not None and after is None:
+            self.emit("removed", path, before=before)
+        elif isinstance(before, (int, float)) and isinstance(after, (int, float)):
+            if abs(before - after) > _FLOAT_TOLERANCE:
+                self.emit("changed", path, before, after)
+        elif isinstance(before, str) and isinstance(after, str):
+            if normalize_key(before) != normalize_key(after):
+                self.emit("changed", path, before, after)
+        elif before != after:
+            self.emit("changed", path, before, after)
+
+    def model(self, path: str, before: BaseModel, after: BaseModel) -> None:
+        for name in type(before).model_fields:
+            child = f"{path}.{name}" if path else name
+            self.value(child, getattr(before, name), getattr(after, name, None))
+
+    def sequence(self, path: str, before: List[Any], after: List[Any]) -> None:
+        sample = before[0] if before else (after[0] if after else None)
+        if isinstance(sample, BaseModel):
+            old = _index(before, _entity_key)
+            new = _index(after, _entity_key)
+            for k, item in old.items():
+                if k not in new:
+                    self.emit("removed", f"{path}[{_label(item)}]", before=item)
+            for k, item in new.items():
+                if k not in old:
+                    self.emit("added", f"{path}[{_label(item)}]", after=item)
+                else:
+                    self.model(f"{path}[{_label(item)}]", old[k], item)
+        else:
+            # قوائم نصية: مجموعات بالمفتاح المطبَّع
+            old = _index(before, normalize_key)
+            new = _index(after, normalize_key)
+            for k in old.keys() - new.keys():
+                self.emit("removed", f"{path}[]", before=old[k])
+            for k in new.keys() - old.keys():
+                self.emit("added", f"{path}[]", after=new[k])
+
+
+def diff_reports(before: BaseModel, after: BaseModel, ignore: Iterable[str] = ("generated_at",)) -> ReportDiff:
+    """مقارنة تقريرين (عادة ComprehensiveArchitectureReport) وإرجاع التغييرات"""
+    differ = _Differ()
+    skipped = set(ignore)
+    for name in type(before).model_fields:
+        if name not in skipped:
+            differ.value(name, getattr(before, name), getattr(after, name, None))
+    # ترتيب ثابت: حسب القسم ثم المسار
+    differ.changes.sort(key=lambda c: (c.section, c.path, c.kind))
+    return ReportDiff(differ.changes)
+
+
+def format_diff_markdown(diff: ReportDiff, title: Optional[str] = None) -> str:
+    """تمثيل Markdown للفرق (للحفظ أو العرض)"""
+    md = f"# {title or 'فرق التقريرين'}\n\n"
+    if diff.empty:
+        return md + "لا توجد تغييرات.\n"
+    icons = {"added": "➕", "removed": "➖", "changed": "✏️"}
+    current = None
+    for change in diff.changes:
+        if change.section != current:
+            current = change.section
+            md += f"\n## {current}\n"
+        if change.kind == "changed":
+            md += f"- {icons['changed']} `{change.path}`: {change.before} → {change.after}\n"
+        else:
+            value = change.after if change.kind == "added" else change.before
+            shown = value if not isinstance(value, dict) else ", ".join(f"{k}={v}" for k, v in value.items() if v)
+            md += f"- {icons[change.kind]} `{change.path}`: {shown}\n"
+    return md
+
+
+def print_diff(diff: ReportDiff, title: str = "🔀 Report diff") -> None:
+    """عرض الفرق كجدول rich"""
+    console = Console()
+    if diff.empty:
+        console.print("[green]No changes[/green]")
+        return
+    table = Table(title=f"{title} — {len(diff.changes)} changes")
+    table.add_column("", width=2)
+    table.add_column("Path", style="cyan")
+    table.add_column("Before")
+    table.add_column("After")
+    styles = {"added": "[green]+[/green]", "removed": "[red]-[/red]", "changed": "[yellow]~[/yellow]"}
+    for change in diff.changes:
+        table.add_row(
+            styles[change.kind],
+            change.path,
+            "" if change.before is None else str(change.before)[:60],
+            "" if change.after is None else str(change.after)[:60]
+        )
+    console.print(table)
@@ -0,0 +1,327 @@
+"""
+تنميط الطلب الواحد (Per-request Profiling & Memory Tracing)
+وضع اختياري يلتقط حول خط التحليل:
+- ملفاً تعيينياً لوحدة المعالجة (sampling) بصيغة المكدسات المطوية (folded stacks)
+  المتوافقة مع flamegraph.pl و speedscope
+- لقطة tracemalloc قبل/بعد مع أكبر مواقع التخصيص
+- لكل مرحلة: الزمن الكلي، انتظار حد التزامن، زمن طلب HTTP للنموذج فقط،
+  التحقق من الاستجابة، والزمن المحلي (تحقق، إصلاح، تنسيق)
+
+النطاق: زمن المعالج والعينات تخص خيط حلقة الأحداث كاملاً، والذاكرة تخص العملية كلها،
+فالطلبات المتزامنة الأخرى تدخل فيها (الحقل overlapped يبيّن تداخل تنميطين).
+
+عند التعطيل لا يعمل أي خيط أو تتبع؛ الخطافات تقرأ ContextVar فارغاً فقط.
+"""
+
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import ContextManager, Dict, Iterator, List, Optional, Set
+
+from instructor.core.hooks import Hooks
+from rich.console import Console
+from rich.table import Table
+
+_current: ContextVar[Optional["RequestProfile"]] = ContextVar("request_profile", default=None)
+
+# دوال الانتظار في حلقة الأحداث: العيّنة فيها تعني أن الخيط خامل (ينتظر الشبكة)
+_IDLE_FUNCTIONS = {"select", "poll", "epoll", "kqueue", "_run_once"}
+
+# tracemalloc مشترك بين التنميطات المتداخلة: يتوقف مع آخرها فقط إن كنا من بدأه
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_tracing_started = False
+_capturing: Set["RequestProfile"] = set()
+
+
+def active() -> Optional["RequestProfile"]:
+    """التنميط الجاري في السياق الحالي (None عند التعطيل)"""
+    return _current.get()
+
+
+def segment(name: str) -> ContextManager:
+    """قياس مقطع محلي (مثل فك ترميز الملف أو التنسيق) ضمن التنميط الجاري إن وجد"""
+    profile = _current.get()
+    return profile.stage(name) if profile is not None else nullcontext()
+
+
+def queue_wait(name: str, seconds: float) -> None:
+    """تسجيل زمن انتظار مكان في حد التزامن لمرحلة ضمن التنميط الجاري إن وجد"""
+    profile = _current.get()
+    if profile is not None:
+        profile.stages.setdefault(name, StageProfile()).queue_seconds += seconds
+
+
+def completion(name: str) -> ContextManager[Optional[Hooks]]:
+    """
+    خطافات instructor لاستدعاء واحد (None عند التعطيل): زمن طلب HTTP فقط يُحسب
+    انتظاراً للنموذج، وباقي زمن الاستدعاء (التحليل والتحقق) يُحسب تحققاً.
+    """
+    profile = _current.get()
+    return profile.completion(name) if profile is not None else nullcontext()
+
+
+@dataclass
+class StageProfile:
+    wall_seconds: float = 0.0
+    queue_seconds: float = 0.0
+    llm_wait_seconds: float = 0.0
+    validation_seconds: float = 0.0
+    calls: int = 0
+
+    @property
+    def local_seconds(self) -> float:
+        return max(0.0, self.wall_seconds - self.llm_wait_seconds - self.queue_seconds)
+
+
+# =================================================================================================
+# أخذ عينات المكدس (Stack Sampling)
+# =================================================================================================
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler(threading.Thread):
+    """خيط يلتقط مكدس خيط الهدف كل interval ثانية ويعدّ المكدسات المطوية"""
+
+    def __init__(self, target_thread_id: int, interval: float = 0.005):
+        super().__init__(name="request-profiler", daemon=True)
+        self.target = target_thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            if frame is None:
+                continue
+            leaf = frame.f_code.co_name
+            labels: List[str] = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(labels))] += 1
+            self.samples += 1
+            if leaf in _IDLE_FUNCTIONS:
+                self.idle_samples += 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+
+# =================================================================================================
+# التنميط (Request Profile)
+# =================================================================================================
+
+def _start_tracing() -> None:
+    global _tracing_users, _tracing_started
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_started = True
+        _tracing_users += 1
+
+
+def _stop_tracing() -> None:
+    global _tracing_users, _tracing_started
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and _tracing_started:
+            tracemalloc.stop()
+            _tracing_started = False
+
+
+class RequestProfile:
+    def __init__(self, interval: float = 0.005, trace_memory: bool = True, top_allocations: int = 15):
+        self.interval = interval
+        self.trace_memory = trace_memory
+        self.top_allocations = top_allocations
+        self.stages: Dict[str, StageProfile] = {}
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self._sampler: Optional[StackSampler] = None
+        self._allocations: List[dict] = []
+        self._peak_bytes = 0
+        self.overlapped = False
+
+    @contextmanager
+    def capture(self) -> Iterator["RequestProfile"]:
+        """تفعيل التنميط حول كتلة واحدة (الخيط الحالي هو خيط حلقة الأحداث)"""
+        token = _current.set(self)
+        tracing = False
+        try:
+            with _tracing_lock:
+                if _capturing:
+                    self.overlapped = True
+                    for other in _capturing:
+                        other.overlapped = True
+                _capturing.add(self)
+            before = None
+            if self.trace_memory:
+                _start_tracing()
+                tracing = True
+                if not self.overlapped:
+                    # الذروة مشتركة: لا نصفّرها أثناء تنميط آخر
+                    tracemalloc.reset_peak()
+                before = self._snapshot()
+
+            self._sampler = StackSampler(threading.get_ident(), self.interval)
+            self._sampler.start()
+            wall, cpu = time.perf_counter(), time.thread_time()
+            try:
+                yield self
+            finally:
+                self.wall_seconds = time.perf_counter() - wall
+                self.cpu_seconds = time.thread_time() - cpu
+                self._sampler.stop()
+                if before is not None:
+                    after = self._snapshot()
+                    self._peak_bytes = tracemalloc.get_traced_memory()[1]
+                    self._allocations = [
+                        {
+                            "location": str(stat.traceback[0]),
+                            "size_diff_kb": round(stat.size_diff / 1024, 1),
+                            "count_diff": stat.count_diff,
+                        }
+                        for stat in after.compare_to(before, "lineno")[:self.top_allocations]
+                    ]
+        finally:
+            if tracing:
+                _stop_tracing()
+            with _tracing_lock:
+                _capturing.discard(self)
+            _current.reset(token)
+
+    @staticmethod
+    def _snapshot() -> tracemalloc.Snapshot:
+        # تخصيصات المنمِّط نفسه (المكدسات المطوية) و tracemalloc لا تخص الطلب
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ))
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        record = self.stages.setdefault(name, StageProfile())
+        record.calls += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            record.wall_seconds += time.perf_counter() - started
+
+    @contextmanager
+    def completion(self, name: str) -> Iterator[Hooks]:
+        record = self.stages.setdefault(name, StageProfile())
+        http = 0.0
+        sent: Optional[float] = None
+
+        def on_request(*args, **kwargs) -> None:
+            nonlocal sent
+            sent = time.perf_counter()
+
+        def on_finished(*args, **kwargs) -> None:
+            nonlocal http, sent
+            if sent is not None:
+                http += time.perf_counter() - sent
+                sent = None
+
+        hooks = Hooks()
+        hooks.on("completion:kwargs", on_request)
+        hooks.on("completion:response", on_finished)
+        hooks.on("completion:error", on_finished)
+        started = time.perf_counter()
+        try:
+            yield hooks
+        finally:
+            on_finished()  # إلغاء أثناء الطلب
+            record.llm_wait_seconds += http
+            record.validation_seconds += max(0.0, time.perf_counter() - started - http)
+
+    def folded(self) -> str:
+        """مكدسات مطوية: سطر لكل مكدس «a;b;c العدد» (flamegraph.pl / speedscope)"""
+        if self._sampler is None:
+            return ""
+        return "\n".join(f"{stack} {count}" for stack, count in self._sampler.stacks.most_common())
+
+    def to_dict(self, include_folded: bool = True) -> Dict:
+        samples = self._sampler.samples if self._sampler else 0
+        idle = self._sampler.idle_samples if self._sampler else 0
+        data = {
+            "wall_seconds": round(self.wall_seconds, 4),
+            "cpu_seconds": round(self.cpu_seconds, 4),
+            "samples": samples,
+            "sample_interval_seconds": self.interval,
+            "idle_ratio": round(idle / samples, 3) if samples else 0.0,
+            "scope": {
+                "cpu_and_samples": "event-loop thread (includes concurrent requests)",
+                "memory": "process-wide",
+                "overlapped": self.overlapped,
+            },
+            "stages": {
+                name: {
+                    "wall_seconds": round(s.wall_seconds, 4),
+                    "queue_seconds": round(s.queue_seconds, 4),
+                    "llm_wait_seconds": round(s.llm_wait_seconds, 4),
+                    "validation_seconds": round(s.validation_seconds, 4),
+                    "local_seconds": round(s.local_seconds, 4),
+                    "calls": s.calls,
+                }
+                for name, s in self.stages.items()
+            },
+            "memory": {
+                "peak_kb": round(self._peak_bytes / 1024, 1),
+                "top_allocations": self._allocations,
+            },
+        }
+        if include_folded:
+            data["folded_stacks"] = self.folded()
+        return data
+
+
+def print_profile(profile: RequestProfile, title: str = "🔬 Request profile") -> None:
+    """عرض ملخص التنميط: المراحل (انتظار النموذج مقابل المحلي) وأكبر التخصيصات"""
+    console = Console()
+    data = profile.to_dict(include_folded=False)
+    table = Table(title=f"{title} — {data['wall_seconds']:.2f}s wall, {data['cpu_seconds']:.2f}s CPU")
+    table.add_column("Stage", style="cyan")
+    table.add_column("Wall (s)", justify="right")
+    table.add_column("Queued (s)", justify="right")
+    table.add_column("Awaiting LLM (s)", justify="right")
+    table.add_column("Validation (s)", justify="right")
+    table.add_column("Local (s)", justify="right")
+    for name, stage in data["stages"].items():
+        table.add_row(
+            name,
+            f"{stage['wall_seconds']:.3f}",
+            f"{stage['queue_seconds']:.3f}",
+            f"{stage['llm_wait_seconds']:.3f}",
+            f"{stage['validation_seconds']:.3f}",
+            f"{stage['local_seconds']:.3f}"
+        )
+    console.print(table)
+
+    memory = Table(title=f"🧠 Allocations (peak {data['memory']['peak_kb']:.0f} KB)")
+    memory.add_column("Location", style="cyan")
+    memory.add_column("Δ KB", justify="right")
+    memory.add_column("Δ blocks", justify="right")
+    for alloc in data["memory"]["top_allocations"]:
+        memory.add_row(alloc["location"], f"{alloc['size_diff_kb']:.1f}", str(alloc["count_diff"]))
+    console.print(memory)
+    console.print(f"{data['samples']} samples, {data['idle_ratio']:.0%} idle in the event loop")
+    console.print(
+        "CPU time and samples cover the whole event-loop thread; allocations are process-wide"
+        + (" [yellow](another profile overlapped this one)[/yellow]" if profile.overlapped else "")
+    )
@@ -0,0 +1,228 @@
+"""
+جدولة الطلبات بالعدالة الموزونة (Weighted Fair Request Scheduling)
+فئات أولوية (interactive / batch / background) مع طوابير عادلة موزونة لكل
+مستأجر أو مفتاح API. تكلفة كل طلب تُحسب بالرموز، فالتقرير الشامل بأربع
+مراحل يستهلك من حصة مستأجره أكثر من مرحلة واحدة.
+"""
+
+import asyncio
+import heapq
+import itertools
+import statistics
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Deque, Dict, List, Optional, Tuple
+
+from runtime_metrics import metrics
+
+
+class PriorityClass(str, Enum):
+    INTERACTIVE = "interactive"
+    BATCH = "batch"
+    BACKGROUND = "background"
+
+
+# حصة كل فئة من السعة عند التنافس
+DEFAULT_CLASS_WEIGHTS = {
+    PriorityClass.INTERACTIVE: 8.0,
+    PriorityClass.BATCH: 2.0,
+    PriorityClass.BACKGROUND: 1.0,
+}
+
+# عدد أزمنة الانتظار المحفوظة لكل فئة لحساب المئينات
+_WAIT_WINDOW = 500
+
+
+@dataclass(order=True)
+class _Waiter:
+    finish_tag: float
+    seq: int
+    start_tag: float = field(compare=False)
+    priority: PriorityClass = field(compare=False)
+    tenant: str = field(compare=False)
+    cost: float = field(compare=False)
+    enqueued_at: float = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    removed: bool = field(default=False, compare=False)
+
+
+class FairScheduler:
+    """
+    جدولة WFQ: لكل تدفق (فئة، مستأجر) وسم انتهاء افتراضي
+    finish = max(V, آخر وسم للتدفق) + التكلفة / الوزن
+    ويُمنح المقعد التالي للطلب ذي الوسم الأصغر.
+    """
+
+    def __init__(self, max_concurrent: int = 4, weights: Optional[Dict[PriorityClass, float]] = None):
+        self.max_concurrent = max_concurrent
+        self.weights = dict(weights or DEFAULT_CLASS_WEIGHTS)
+        self._heap: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._flow_finish: Dict[Tuple[PriorityClass, str], float] = {}
+        # طلبات كل تدفق في الطابور، والتدفقات الخاملة مرتبة بوسم انتهائها لحذفها
+        # حين يتجاوزها الزمن الافتراضي (لا يبقى سجل لكل مستأجر مرّ بالخادم)
+        self._flow_queued: Dict[Tuple[PriorityClass, str], int] = defaultdict(int)
+        self._idle_flows: List[Tuple[float, PriorityClass, str]] = []
+        self._active = 0
+        self._depth: Dict[PriorityClass, int] = defaultdict(int)
+        self._waits: Dict[PriorityClass, Deque[float]] = defaultdict(lambda: deque(maxlen=_WAIT_WINDOW))
+
+    # =============================================================================
+    # الواجهة العامة
+    # =============================================================================
+
+    @asynccontextmanager
+    async def slot(self, tenant: str, priority: PriorityClass = PriorityClass.INTERACTIVE, cost: float = 1.0):
+        """انتظار مقعد تنفيذ حسب الأولوية والعدالة ثم تحريره عند الخروج"""
+        waiter = self._enqueue(tenant, priority, max(cost, 1e-6))
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # مُنح المقعد لحظة الإلغاء
+                self._release()
+            else:
+                self._discard(waiter)
+            raise
+
+        try:
+            yield
+        finally:
+            self._release()
+
+    @property
+    def queue_depth(self) -> int:
+        """عدد الطلبات المنتظرة في كل الفئات"""
+        return sum(self._depth.values())
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def stats(self) -> Dict:
+        classes = {}
+        for priority in PriorityClass:
+            waits = sorted(self._waits[priority])
+            classes[priority.value] = {
+                "weight": self.weights[priority],
+                "queue_depth": self._depth[priority],
+                "dispatched": metrics.get(f"scheduler.dispatched.{priority.value}"),
+                "wait_p50_seconds": round(statistics.median(waits), 4) if waits else 0.0,
+                "wait_p95_seconds": round(waits[int(0.95 * (len(waits) - 1))], 4) if waits else 0.0,
+                "wait_max_seconds": round(waits[-1], 4) if waits else 0.0,
+            }
+        return {
+            "max_concurrent": self.max_concurrent,
+            "active": self._active,
+            "virtual_time": round(self._virtual_time, 4),
+            "flows": len(self._flow_finish),
+            "classes": classes,
+        }
+
+    # =============================================================================
+    # التنفيذ الداخلي
+    # =============================================================================
+
+    def _enqueue(self, tenant: str, priority: PriorityClass, cost: float) -> _Waiter:
+        flow = (priority, tenant)
+        start = max(self._virtual_time, self._flow_finish.get(flow, 0.0))
+        finish = start + cost / self.weights[priority]
+        self._flow_finish[flow] = finish
+        self._flow_queued[flow] += 1
+        waiter = _Waiter(
+            finish_tag=finish,
+            seq=next(self._seq),
+            start_tag=start,
+            priority=priority,
+            tenant=tenant,
+            cost=cost,
+            enqueued_at=time.monotonic(),
+            future=asyncio.get_running_loop().create_future(),
+        )
+        heapq.heappush(self._heap, waiter)
+        self._depth[priority] += 1
+        self._publish(priority)
+        return waiter
+
+    def _dispatch(self) -> None:
+        while self._active < self.max_concurrent and self._heap:
+            waiter = heapq.heappop(self._heap)
+            if waiter.removed:
+                continue
+            if waiter.future.cancelled():
+                self._discard(waiter)
+                continue
+            self._active += 1
+            self._virtual_time = max(self._virtual_time, waiter.start_tag)
+            self._depth[waiter.priority] -= 1
+            self._leave_queue(waiter)
+            self._prune_flows()
+
+            waited = time.monotonic() - waiter.enqueued_at
+            self._waits[waiter.priority].append(waited)
+            metrics.incr(f"scheduler.dispatched.{waiter.priority.value}")
+            metrics.incr(f"scheduler.wait_seconds.{waiter.priority.value}", waited)
+            metrics.incr(f"scheduler.cost.{waiter.priority.value}", waiter.cost)
+            self._publish(waiter.priority)
+            waiter.future.set_result(None)
+
+    def _discard(self, waiter: _Waiter) -> None:
+        """
+        إزالة طلب ملغى من الطابور (حذف كسول من الكومة) مع التراجع عن تكلفته في وسوم
+        تدفقه: الطلبات اللاحقة في التدفق نفسه تتقدم بقدرها، فلا يُحاسَب المستأجر على ما لم يُنفَّذ.
+        """
+        if waiter.removed:
+            return
+        waiter.removed = True
+        self._depth[waiter.priority] -= 1
+
+        flow = (waiter.priority, waiter.tenant)
+        shift = waiter.finish_tag - waiter.start_tag
+        later = [w for w in self._heap if not w.removed and (w.priority, w.tenant) == flow and w.seq > waiter.seq]
+        for w in later:
+            w.start_tag -= shift
+            w.finish_tag -= shift
+        if later:
+            heapq.heapify(self._heap)
+        self._flow_finish[flow] -= shift
+        self._leave_queue(waiter)
+        self._prune_flows()
+        self._publish(waiter.priority)
+
+    def _leave_queue(self, waiter: _Waiter) -> None:
+        """خروج طلب من الطابور؛ التدفق الذي فرغ طابوره يُرشَّح للحذف"""
+        flow = (waiter.priority, waiter.tenant)
+        self._flow_queued[flow] -= 1
+        if self._flow_queued[flow] == 0:
+            del self._flow_queued[flow]
+            heapq.heappush(self._idle_flows, (self._flow_finish[flow], *flow))
+
+    def _prune_flows(self) -> None:
+        """
+        حذف وسوم التدفقات الخاملة التي لا يتجاوز انتهاؤها الزمن الافتراضي:
+        max(V, وسمها) = V فغيابها مكافئ لوجودها
+        """
+        if not self._flow_queued and self._flow_finish:
+            # طابور فارغ: انتهت فترة الانشغال فيتقدم V إلى أكبر وسم انتهاء (SFQ)
+            self._virtual_time = max(self._virtual_time, max(self._flow_finish.values()))
+        while self._idle_flows and self._idle_flows[0][0] <= self._virtual_time:
+            finish, priority, tenant = heapq.heappop(self._idle_flows)
+            flow = (priority, tenant)
+            # مدخل قديم: عاد التدفق إلى الطابور أو تغيّر وسمه بعد ترشيحه
+            if flow in self._flow_queued or self._flow_finish.get(flow) != finish:
+                continue
+            del self._flow_finish[flow]
+
+    def _release(self) -> None:
+        self._active -= 1
+        metrics.set("scheduler.active", self._active)
+        self._dispatch()
+
+    def _publish(self, priority: PriorityClass) -> None:
+        metrics.set(f"scheduler.queue_depth.{priority.value}", self._depth[priority])
+        metrics.set("scheduler.active", self._active)
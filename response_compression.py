@@ -0,0 +1,213 @@
+"""
+ضغط الاستجابات والطلبات الشرطية (Response Compression & Conditional GETs)
+وسيط ASGI يختار الترميز من Accept-Encoding (zstd ثم br ثم gzip) حسب المتاح،
+ويضغط الاستجابات النصية الكبيرة، بما فيها المتدفقة (NDJSON) مع تفريغ كل جزء فوراً.
+التقارير العربية المتكررة تنضغط عادة إلى جزء صغير من حجمها.
+
+ومعها وسوم ETag من بصمة المحتوى و If-None-Match للتقارير المخزنة (304 بدون جسم).
+
+brotli و zstandard اختياريان؛ gzip متاح دائماً.
+"""
+
+import hashlib
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from runtime_metrics import metrics
+
+try:
+    import brotli
+except ImportError:  # الاعتماد اختياري؛ يبقى gzip
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # الاعتماد اختياري؛ يبقى gzip
+    zstandard = None
+
+# تفضيل الخادم عند تساوي قبول العميل: الأفضل نسبة وسرعة أولاً
+_PREFERENCE = ("zstd", "br", "gzip")
+
+_COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson", "application/jsonl", "application/javascript")
+
+# استجابات بلا جسم أو لا يجوز تغيير جسمها
+_SKIP_STATUSES = {204, 206, 304}
+
+
+def available_encodings() -> List[str]:
+    return [e for e in _PREFERENCE if e == "gzip" or (e == "br" and brotli) or (e == "zstd" and zstandard)]
+
+
+def negotiate(accept_encoding: str, available: Optional[List[str]] = None) -> Optional[str]:
+    """أفضل ترميز مقبول (q > 0) من Accept-Encoding، أو None للإرسال بدون ضغط"""
+    available = available if available is not None else available_encodings()
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name:
+            weights[name.strip().lower()] = q
+    candidates = [
+        (weights.get(e, weights.get("*", 0.0)), -_PREFERENCE.index(e), e)
+        for e in available
+    ]
+    best = max(candidates, default=None)
+    return best[2] if best is not None and best[0] > 0 else None
+
+
+class _Encoder:
+    """ضاغط تدفقي: كل جزء يُفرَّغ فوراً (final يغلق التدفق)"""
+
+    def __init__(self, encoding: str, level: Optional[int] = None):
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._z = zlib.compressobj(level if level is not None else 6, zlib.DEFLATED, 31)
+        elif encoding == "br":
+            self._z = brotli.Compressor(quality=level if level is not None else 5)
+        else:
+            self._z = zstandard.ZstdCompressor(level=level if level is not None else 3).compressobj()
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "gzip":
+            return self._z.compress(data) + self._z.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+        if self.encoding == "br":
+            return self._z.process(data) + (self._z.finish() if final else self._z.flush())
+        flag = zstandard.COMPRESSOBJ_FLUSH_FINISH if final else zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        return self._z.compress(data) + self._z.flush(flag)
+
+
+def _header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[bytes]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _without(headers: List[Tuple[bytes, bytes]], *names: bytes) -> List[Tuple[bytes, bytes]]:
+    return [(k, v) for k, v in headers if k.lower() not in names]
+
+
+def _add_vary(headers: List[Tuple[bytes, bytes]]) -> List[Tuple[bytes, bytes]]:
+    vary = _header(headers, b"vary")
+    if vary is None:
+        return headers + [(b"vary", b"Accept-Encoding")]
+    if b"accept-encoding" in vary.lower():
+        return headers
+    return _without(headers, b"vary") + [(b"vary", vary + b", Accept-Encoding")]
+
+
+# =================================================================================================
+# وسيط الضغط (Compression Middleware)
+# =================================================================================================
+
+class CompressionMiddleware:
+    """
+    يضغط الاستجابات النصية التي لا يقل جسمها عن minimum_size بايت.
+    الاستجابات المتدفقة تُضغط جزءاً جزءاً دون تأخير أي جزء.
+    """
+
+    def __init__(self, app, minimum_size: int = 512, levels: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = levels or {}
+        self.available = available_encodings()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = _header(scope.get("headers", []), b"accept-encoding")
+        encoding = negotiate(accept.decode("latin-1"), self.available) if accept else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSend(send, encoding, self.minimum_size, self.levels.get(encoding)))
+
+
+class _CompressingSend:
+    def __init__(self, send, encoding: str, minimum_size: int, level: Optional[int]):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.level = level
+        self.start: Optional[dict] = None
+        self.encoder: Optional[_Encoder] = None
+        self.passthrough = False
+
+    def _compressible(self, headers: List[Tuple[bytes, bytes]]) -> bool:
+        if self.start["status"] in _SKIP_STATUSES or _header(headers, b"content-encoding") is not None:
+            return False
+        content_type = (_header(headers, b"content-type") or b"").decode("latin-1").lower()
+        return content_type.startswith(_COMPRESSIBLE_TYPES)
+
+    async def __call__(self, message: dict) -> None:
+        if message["type"] == "http.response.start":
+            # ننتظر أول جزء من الجسم لمعرفة حجمه وهل الاستجابة متدفقة
+            self.start = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more = message.get("more_body", False)
+
+        if self.encoder is None:
+            headers = list(self.start.get("headers", []))
+            if not self._compressible(headers):
+                self.passthrough = True
+                await self.send(self.start)
+                await self.send(message)
+                return
+            headers = _add_vary(headers)
+            if not more and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self.send({**self.start, "headers": headers})
+                await self.send(message)
+                return
+
+            self.encoder = _Encoder(self.encoding, self.level)
+            headers = _without(headers, b"content-length") + [(b"content-encoding", self.encoding.encode("latin-1"))]
+            if not more:
+                compressed = self.encoder.compress(body, final=True)
+                metrics.incr(f"compression.{self.encoding}")
+                metrics.incr("compression.bytes_in", len(body))
+                metrics.incr("compression.bytes_out", len(compressed))
+                headers.append((b"content-length", str(len(compressed)).encode("latin-1")))
+                await self.send({**self.start, "headers": headers})
+                await self.send({"type": "http.response.body", "body": compressed})
+                return
+            metrics.incr(f"compression.{self.encoding}")
+            await self.send({**self.start, "headers": headers})
+
+        compressed = self.encoder.compress(body, final=not more)
+        await self.send({"type": "http.response.body", "body": compressed, "more_body": more})
+
+
+# =================================================================================================
+# وسوم ETag (Content-hash ETags)
+# =================================================================================================
+
+def content_etag(*parts: bytes) -> str:
+    """وسم ضعيف من بصمة المحتوى: يبقى صالحاً أياً كان ترميز الضغط المختار"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part)
+    return f'W/"{digest.hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """مقارنة ضعيفة لـ If-None-Match (قائمة وسوم أو *)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
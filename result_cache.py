@@ -0,0 +1,81 @@
+"""
+ذاكرة نتائج المراحل المؤقتة (Stage Result Cache)
+تُحفظ كل نتيجة فور اكتمال استدعائها، فتبقى المراحل المكتملة متاحة
+حتى لو أُلغي باقي التشغيل (مثال: انقطاع اتصال العميل).
+المدخلات تنتهي صلاحيتها بعد ANALYZER_CACHE_TTL ثانية (افتراضياً ساعة).
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from runtime_metrics import metrics
+
+
+def cache_key(
+    model: str,
+    stage: str,
+    messages: List[dict],
+    temperature: float,
+    compact_schemas: bool,
+    namespace: str = ""
+) -> str:
+    """
+    مفتاح حتمي من النموذج والمرحلة ونص الرسائل المرسلة، ومن كل ما يغيّر النتيجة لنفس
+    الرسائل (درجة الحرارة، المخطط المضغوط أو الكامل). namespace يعزل المستأجرين.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{namespace}\x00{model}\x00{stage}\x00{temperature!r}\x00{int(compact_schemas)}\x00".encode("utf-8"))
+    digest.update(json.dumps(messages, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class StageResultCache:
+    """ذاكرة LRU مشتركة على مستوى العملية، مع انتهاء صلاحية كل مدخل بعد ttl_seconds"""
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # المفتاح ← (وقت انتهاء الصلاحية بـ time.monotonic، النتيجة)
+        self._entries: "OrderedDict[str, Tuple[float, BaseModel]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[BaseModel]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                metrics.incr("cache.expired")
+                entry = None
+            if entry is None:
+                metrics.incr("cache.miss")
+                return None
+            self._entries.move_to_end(key)
+        metrics.incr("cache.hit")
+        return entry[1]
+
+    def put(self, key: str, value: BaseModel) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        metrics.incr("cache.store")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+# مثيل مشترك لكل العملية (ANALYZER_CACHE_TTL)
+stage_cache = StageResultCache(ttl_seconds=float(os.getenv("ANALYZER_CACHE_TTL", "3600")))
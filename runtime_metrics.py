@@ -0,0 +1,41 @@
+"""
+مقاييس التشغيل (Runtime Metrics)
+عدّادات مشتركة على مستوى العملية يقرأها الـ CLI والـ backend
+"""
+
+import threading
+from collections import defaultdict
+from typing import Dict
+
+
+class RuntimeMetrics:
+    """عدّادات ومقاييس لحظية بسيطة آمنة للخيوط مفهرسة بالاسم (مثال: 'structured_output.repaired')"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def set(self, name: str, value: float) -> None:
+        """ضبط قيمة مقياس لحظي (gauge) مثل عمق الطابور"""
+        with self._lock:
+            self._counters[name] = value
+
+    def get(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(sorted(self._counters.items()))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+
+
+# مثيل مشترك لكل العملية
+metrics = RuntimeMetrics()
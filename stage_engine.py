@@ -0,0 +1,180 @@
+"""
+محرك مراحل التحليل كرسم بياني موجّه (Declarative Stage DAG Engine)
+كل مرحلة تعلن مدخلاتها: مصادر خام (raw_text, comparison_text) أو مخرجات مراحل أخرى.
+المراحل المستقلة تعمل بالتوازي، ويُحسب المسار الحرج لكل تشغيل.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List
+
+# دالة المرحلة: (context, inputs) → نتيجة
+StageFn = Callable[[Any, Dict[str, Any]], Awaitable[Any]]
+
+
+class StageGraphError(ValueError):
+    """خطأ في تعريف الرسم البياني (مدخل مجهول أو دورة)"""
+
+
+@dataclass
+class StageSpec:
+    name: str
+    inputs: List[str]
+    run: StageFn
+    description: str = ""
+    # مرحلة اختيارية: يجوز للمنسّق تخطيها (مثال: عند ضيق المهلة)
+    optional: bool = False
+
+
+@dataclass
+class StageTiming:
+    stage: str
+    started_at: float
+    finished_at: float
+
+    @property
+    def duration(self) -> float:
+        return self.finished_at - self.started_at
+
+
+@dataclass
+class StageRunResult:
+    """نتائج تشغيل واحد للرسم البياني مع التوقيتات والمسار الحرج"""
+    results: Dict[str, Any] = field(default_factory=dict)
+    timings: Dict[str, StageTiming] = field(default_factory=dict)
+    critical_path: List[str] = field(default_factory=list)
+    critical_path_seconds: float = 0.0
+    wall_seconds: float = 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "stages": {name: round(t.duration, 3) for name, t in self.timings.items()},
+            "critical_path": self.critical_path,
+            "critical_path_seconds": round(self.critical_path_seconds, 3),
+            "wall_seconds": round(self.wall_seconds, 3),
+        }
+
+
+class StageRegistry:
+    """سجل المراحل؛ إضافة مرحلة جديدة لا تتطلب تعديل المنسّق"""
+
+    def __init__(self, sources: Iterable[str] = ()):
+        self.sources = set(sources)
+        self._stages: Dict[str, StageSpec] = {}
+
+    def register(self, name: str, inputs: List[str], description: str = "", optional: bool = False):
+        """مُزخرف لتسجيل دالة مرحلة"""
+        def decorator(fn: StageFn) -> StageFn:
+            self.add(StageSpec(name=name, inputs=list(inputs), run=fn, description=description, optional=optional))
+            return fn
+        return decorator
+
+    def add(self, spec: StageSpec) -> None:
+        if spec.name in self._stages or spec.name in self.sources:
+            raise StageGraphError(f"Stage '{spec.name}' is already registered")
+        self._stages[spec.name] = spec
+
+    def get(self, name: str) -> StageSpec:
+        try:
+            return self._stages[name]
+        except KeyError:
+            raise StageGraphError(f"Unknown stage '{name}'")
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._stages
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._stages)
+
+    def closure(self, targets: Iterable[str]) -> List[str]:
+        """كل المراحل اللازمة لإنتاج الأهداف بترتيب طوبولوجي (مع كشف الدورات)"""
+        order: List[str] = []
+        state: Dict[str, str] = {}
+
+        def visit(name: str, path: List[str]) -> None:
+            if name in self.sources:
+                return
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise StageGraphError(f"Cycle detected: {' → '.join(path + [name])}")
+            state[name] = "visiting"
+            for dep in self.get(name).inputs:
+                visit(dep, path + [name])
+            state[name] = "done"
+            order.append(name)
+
+        for target in targets:
+            visit(target, [])
+        return order
+
+    def stage_inputs(self, targets: Iterable[str]) -> Dict[str, List[str]]:
+        """مدخلات كل مرحلة ضمن إغلاق الأهداف (يستخدمها المخطط)"""
+        return {name: list(self.get(name).inputs) for name in self.closure(targets)}
+
+
+class StageEngine:
+    """مُجدول يشغّل إغلاق الأهداف بالتوازي حسب التبعيات"""
+
+    def __init__(self, registry: StageRegistry):
+        self.registry = registry
+
+    async def run(
+        self,
+        targets: Iterable[str],
+        sources: Dict[str, Any],
+        context: Any = None
+    ) -> StageRunResult:
+        order = self.registry.closure(targets)
+        missing = {
+            dep for name in order for dep in self.registry.get(name).inputs
+            if dep in self.registry.sources and dep not in sources
+        }
+        if missing:
+            raise StageGraphError(f"Missing source inputs: {sorted(missing)}")
+
+        run = StageRunResult()
+        tasks: Dict[str, asyncio.Task] = {}
+        origin = time.perf_counter()
+
+        async def execute(spec: StageSpec) -> Any:
+            inputs = {}
+            for dep in spec.inputs:
+                inputs[dep] = sources[dep] if dep in self.registry.sources else await tasks[dep]
+            started = time.perf_counter()
+            result = await spec.run(context, inputs)
+            run.timings[spec.name] = StageTiming(spec.name, started - origin, time.perf_counter() - origin)
+            run.results[spec.name] = result
+            return result
+
+        for name in order:
+            tasks[name] = asyncio.create_task(execute(self.registry.get(name)), name=f"stage:{name}")
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+
+        run.wall_seconds = time.perf_counter() - origin
+        run.critical_path, run.critical_path_seconds = self._critical_path(run)
+        return run
+
+    def _critical_path(self, run: StageRunResult):
+        """تتبع المسار الحرج رجوعاً من آخر مرحلة انتهت عبر التبعية الأبطأ"""
+        if not run.timings:
+            return [], 0.0
+        current = max(run.timings.values(), key=lambda t: t.finished_at).stage
+        path = [current]
+        while True:
+            deps = [d for d in self.registry.get(current).inputs if d in run.timings]
+            if not deps:
+                break
+            current = max(deps, key=lambda d: run.timings[d].finished_at)
+            path.append(current)
+        path.reverse()
+        return path, sum(run.timings[name].duration for name in path)
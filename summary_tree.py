@@ -0,0 +1,304 @@
+"""
+شجرة الملخصات الهرمية للمستند (Hierarchical Summary Tree)
+تُبنى مرة واحدة لكل مستند (حسب بصمة النص والنموذج): أجزاء ← أقسام ← مستند،
+وتُحفظ على القرص. التحليلات اللاحقة (بأي نوع ومن أي مستخدم) تعمل من عرض مضغوط
+للشجرة ضمن ميزانية رموز بدلاً من إعادة إرسال السجل الخام كاملاً.
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterable, Iterator, List, Literal, Optional
+
+from pydantic import BaseModel, Field
+
+from mapped_document import Document, document_blocks
+from runtime_metrics import metrics
+from token_planner import SUMMARY_PENDING_SECTIONS, SUMMARY_TREE_FANOUT, count_tokens, estimate_tokens, truncate_to_tokens
+
+# يتغير عند تغيير التعليمات أو البنية فتُهمل الأشجار القديمة
+TREE_VERSION = 1
+
+Level = Literal["chunk", "section", "document"]
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+# فقرة بلا أسطر فارغة (سجلات) تُقطع عند آخر سطر قبل هذا الطول
+_MAX_PARAGRAPH_CHARS = 1 << 16
+
+
+class SummaryResult(BaseModel):
+    """استجابة النموذج لتلخيص مستوى واحد"""
+    summary: str = Field(..., description="ملخص مكثف يحافظ على المكونات والتقنيات والقرارات والأرقام")
+    key_points: List[str] = Field(default_factory=list, description="نقاط معمارية أساسية لا يجوز فقدانها")
+
+
+class SummaryNode(BaseModel):
+    level: Level
+    summary: str
+    key_points: List[str] = Field(default_factory=list)
+    children: List["SummaryNode"] = Field(default_factory=list)
+
+    def render(self) -> str:
+        points = "".join(f"\n- {p}" for p in self.key_points)
+        return f"{self.summary}{points}"
+
+
+class SummaryTree(BaseModel):
+    document_hash: str
+    model: str
+    version: int = TREE_VERSION
+    source_tokens: int
+    created_at: str
+    root: SummaryNode
+
+    def level_nodes(self, level: Level) -> List[SummaryNode]:
+        nodes = [self.root]
+        while nodes and nodes[0].level != level:
+            nodes = [child for node in nodes for child in node.children]
+        return nodes
+
+
+def document_key(text: Document, model: str) -> str:
+    """بصمة المستند: النص والنموذج وإصدار الشجرة (نفسها للنص والمستند المُعيَّن)"""
+    digest = hashlib.sha256(f"{TREE_VERSION}\x00{model}\x00".encode("utf-8"))
+    for block in document_blocks(text):
+        digest.update(block.encode("utf-8"))
+    return digest.hexdigest()
+
+
+# =================================================================================================
+# التقسيم والبناء (Chunking & Building)
+# =================================================================================================
+
+def _bounded(paragraph: str, max_chars: int, end: Optional[int] = None) -> Iterator[str]:
+    """قطع الفقرة الطويلة عند آخر سطر قبل max_chars (آخر قطعة تُعاد كما هي)"""
+    start = 0
+    end = len(paragraph) if end is None else end
+    while end - start > max_chars:
+        cut = paragraph.rfind("\n", start, start + max_chars) + 1 or start + max_chars
+        yield paragraph[start:cut]
+        start = cut
+    yield paragraph[start:]
+
+
+def split_paragraphs(blocks: Iterable[str], max_chars: int = _MAX_PARAGRAPH_CHARS) -> Iterator[str]:
+    """فقرات من كتل نصية متتالية؛ لا يُحتفظ في الذاكرة إلا بالفقرة الجارية"""
+    pending = ""
+    for block in blocks:
+        text = pending + block
+        # المسافات في آخر النص قد تكون بداية فاصل لم يكتمل بعد (أو امتداداً لفاصل)
+        tail = len(text.rstrip())
+        start = 0
+        for match in _PARAGRAPH_RE.finditer(text):
+            if match.end() >= tail:
+                break
+            yield from _bounded(text[start:match.start()], max_chars)
+            start = match.end()
+        pending = text[start:]
+        *pieces, pending = _bounded(pending, max_chars, tail - start)
+        yield from pieces
+    yield pending
+
+
+def iter_chunks(text: Document, chunk_tokens: int, model: str = "") -> Iterator[str]:
+    """تقسيم على حدود الفقرات؛ الفقرة الأطول من الجزء تُقص إلى أجزاء متتالية"""
+    current: List[str] = []
+    current_tokens = 0
+    for paragraph in split_paragraphs(document_blocks(text)):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        tokens = estimate_tokens(paragraph, model)
+        while tokens > chunk_tokens:
+            head = truncate_to_tokens(paragraph, chunk_tokens, model)
+            if current:
+                yield "\n\n".join(current)
+                current, current_tokens = [], 0
+            yield head
+            paragraph = paragraph[len(head):].strip()
+            tokens = estimate_tokens(paragraph, model)
+        if current and current_tokens + tokens > chunk_tokens:
+            yield "\n\n".join(current)
+            current, current_tokens = [], 0
+        if paragraph:
+            current.append(paragraph)
+            current_tokens += tokens
+    if current:
+        yield "\n\n".join(current)
+
+
+def chunk_text(text: Document, chunk_tokens: int, model: str = "") -> List[str]:
+    return list(iter_chunks(text, chunk_tokens, model))
+
+
+Summarizer = Callable[[Level, str], Awaitable[SummaryResult]]
+
+
+async def build_tree(
+    text: Document,
+    summarize: Summarizer,
+    model: str,
+    chunk_tokens: int = 3000,
+    fanout: int = SUMMARY_TREE_FANOUT,
+    pending_sections: int = SUMMARY_PENDING_SECTIONS,
+    key: Optional[str] = None
+) -> SummaryTree:
+    """
+    تلخيص الأجزاء بالتوازي، ثم كل fanout جزءاً في قسم، ثم الأقسام في المستند.
+    المستوى الذي فيه عقدة واحدة لا يُلخص مرة أخرى.
+    الأجزاء تُقرأ من المستند عند الحاجة: pending_sections قسماً على الأكثر قيد التلخيص.
+    key: بصمة المستند إن حُسبت مسبقاً (document_key).
+    التكلفة المقابلة في الخطة: TokenBudgetPlanner._summary_tree_stage.
+    التقسيم والبصمة وعدّ الرموز تمر على المستند كاملاً فتعمل في خيط عامل لا في حلقة الأحداث.
+    """
+    async def node(level: Level, source: str, children: List[SummaryNode]) -> SummaryNode:
+        result = await summarize(level, source)
+        return SummaryNode(level=level, summary=result.summary, key_points=result.key_points, children=children)
+
+    async def parent(level: Level, children: List[SummaryNode]) -> SummaryNode:
+        if len(children) == 1:
+            only = children[0]
+            return SummaryNode(level=level, summary=only.summary, key_points=only.key_points, children=children)
+        merged = "\n\n".join(f"[{i}] {n.render()}" for i, n in enumerate(children, 1))
+        return await node(level, merged, children)
+
+    async def section(group: List[str]) -> SummaryNode:
+        chunks = await asyncio.gather(*(node("chunk", c, []) for c in group))
+        return await parent("section", list(chunks) or [SummaryNode(level="chunk", summary="")])
+
+    tasks: List[asyncio.Future] = []
+    group: List[str] = []
+    chunks = iter_chunks(text, chunk_tokens, model)
+    try:
+        while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+            group.append(chunk)
+            if len(group) < fanout:
+                continue
+            while sum(not t.done() for t in tasks) >= pending_sections:
+                await asyncio.wait([t for t in tasks if not t.done()], return_when=asyncio.FIRST_COMPLETED)
+            tasks.append(asyncio.ensure_future(section(group)))
+            group = []
+        if group or not tasks:
+            tasks.append(asyncio.ensure_future(section(group)))
+        sections = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    root = await parent("document", list(sections))
+
+    return SummaryTree(
+        document_hash=key or await asyncio.to_thread(document_key, text, model),
+        model=model,
+        source_tokens=await asyncio.to_thread(count_tokens, text, model),
+        created_at=datetime.now().isoformat(),
+        root=root
+    )
+
+
+def render(tree: SummaryTree, max_tokens: int, model: str = "") -> str:
+    """أكثر المستويات تفصيلاً الذي يتسع للميزانية (أجزاء ← أقسام ← مستند)"""
+    header = f"ملخص هرمي لسجل الجلسة (النص الأصلي ≈ {tree.source_tokens} رمز):\n\n"
+    for level in ("chunk", "section", "document"):
+        body = "\n\n".join(f"### {i}\n{n.render()}" for i, n in enumerate(tree.level_nodes(level), 1))
+        text = header + body
+        if estimate_tokens(text, model) <= max_tokens:
+            return text
+    return truncate_to_tokens(text, max_tokens, model)
+
+
+# =================================================================================================
+# التخزين الدائم (Persistent Store)
+# =================================================================================================
+
+class SummaryTreeStore:
+    """ملف JSON لكل مستند، مع بناء واحد فقط لكل بصمة داخل العملية"""
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self._lock = threading.Lock()
+        self._building: Dict[str, asyncio.Future] = {}
+        # عدد الطلبات المنتظرة لكل بناء جارٍ
+        self._waiters: Dict[str, int] = {}
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def contains(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def get(self, key: str) -> Optional[SummaryTree]:
+        path = self._path(key)
+        if not path.exists():
+            return None
+        try:
+            return SummaryTree.model_validate_json(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            # ملف تالف أو بصيغة قديمة: يُعاد البناء
+            return None
+
+    def put(self, tree: SummaryTree) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(tree.document_hash)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(tree.model_dump_json(), encoding="utf-8")
+        os.replace(tmp, path)
+
+    async def _build_and_store(self, key: str, build: Callable[[], Awaitable[SummaryTree]]) -> SummaryTree:
+        try:
+            tree = await build()
+            await asyncio.to_thread(self.put, tree)
+            return tree
+        finally:
+            with self._lock:
+                self._building.pop(key, None)
+
+    async def get_or_build(self, key: str, build: Callable[[], Awaitable[SummaryTree]]) -> SummaryTree:
+        """
+        الشجرة المحفوظة، أو بناؤها مرة واحدة: الطلبات المتزامنة لنفس المستند تنضم للبناء الجاري.
+        إلغاء أحدها لا يلغي البناء ما دام غيره ينتظره؛ إلغاء آخر المنتظرين (انقطاع العميل)
+        يلغي البناء فلا تستمر استدعاءات النموذج دون مستفيد.
+        القراءة من القرص والكتابة إليه في خيط عامل.
+        """
+        tree = await asyncio.to_thread(self.get, key)
+        if tree is not None:
+            metrics.incr("summary_tree.hit")
+            return tree
+
+        with self._lock:
+            pending = self._building.get(key)
+            if pending is None:
+                metrics.incr("summary_tree.miss")
+                pending = asyncio.ensure_future(self._build_and_store(key, build))
+                self._building[key] = pending
+            else:
+                metrics.incr("summary_tree.joined")
+            self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(pending)
+        finally:
+            with self._lock:
+                self._waiters[key] -= 1
+                orphaned = self._waiters[key] == 0
+                if orphaned:
+                    del self._waiters[key]
+            if orphaned and not pending.done():
+                pending.cancel()
+                metrics.incr("summary_tree.cancelled")
+
+    def stats(self) -> Dict:
+        files = list(self.directory.glob("*.json")) if self.directory.exists() else []
+        return {
+            "directory": str(self.directory),
+            "trees": len(files),
+            "bytes": sum(f.stat().st_size for f in files),
+            "building": len(self._building),
+        }
+
+
+# مثيل مشترك لكل العملية (ANALYZER_SUMMARY_DIR)
+summary_store = SummaryTreeStore(os.getenv("ANALYZER_SUMMARY_DIR", ".summary_trees"))
@@ -0,0 +1,21 @@
+from report_analytics import ReportColumns, ReportRecord, Vocabulary, compatibility_by_technology
+
+
+def record(score: float, *technologies: str) -> ReportRecord:
+    return ReportRecord(components=[], technologies=list(technologies), api_compatibility_score=score,
+                        single_points_of_failure=[])
+
+
+def test_vocabulary_keeps_cpp_csharp_and_c_apart():
+    vocabulary = Vocabulary()
+    codes = [vocabulary.encode(name) for name in ("C++", "C#", "C", "c++ ")]
+    assert codes == [0, 1, 2, 0]
+    assert vocabulary.labels == ["C++", "C#", "C"]
+
+
+def test_compatibility_by_technology_counts_each_language():
+    columns = ReportColumns.from_records([record(0.5, "C++"), record(1.0, "C#"), record(0.7, "C++", "c++")])
+    rows = {row["technology"]: row for row in compatibility_by_technology(columns)}
+    assert rows["C++"]["reports"] == 2
+    assert rows["C++"]["mean_api_compatibility_score"] == 0.6
+    assert rows["C#"]["reports"] == 1
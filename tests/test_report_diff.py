@@ -0,0 +1,33 @@
+from enhanced_analyzer import IntegrationReport, TechStackAnalysis
+from report_diff import diff_reports, normalize_key
+
+
+def integration_report(*technologies: str) -> IntegrationReport:
+    return IntegrationReport(
+        system_name="orders",
+        tech_stack_analysis=[TechStackAnalysis(technology=t, version_range="*") for t in technologies],
+        integration_patterns_used=[],
+        api_compatibility_score=0.8,
+        migration_path=None,
+        deprecated_technologies=[],
+        security_compliance=[],
+    )
+
+
+def test_normalize_key_keeps_technology_punctuation():
+    assert len({normalize_key(name) for name in ("C++", "C#", "C")}) == 3
+    assert normalize_key("Node.js") == "node.js"
+    assert normalize_key(" Redis. ") == normalize_key("redis")
+
+
+def test_diff_reports_detects_cpp_to_csharp():
+    diff = diff_reports(integration_report("C++"), integration_report("C#"))
+    assert diff.to_dict()["total"] == 2
+    assert {(c.kind, c.path) for c in diff.changes} == {
+        ("removed", "tech_stack_analysis[C++]"),
+        ("added", "tech_stack_analysis[C#]"),
+    }
+
+
+def test_diff_reports_ignores_case_and_spacing():
+    assert diff_reports(integration_report("PostgreSQL"), integration_report(" postgresql ")).empty
@@ -0,0 +1,373 @@
+"""
+تقدير الرموز وتخطيط الميزانية المسبق (Token Estimation & Pre-flight Budget Planning)
+يحسب قبل أي استدعاء للنموذج: ميزانية الرموز لكل مرحلة، عدد المقاطع،
+التكلفة المتوقعة وزمن الاستجابة المتوقع، ويرفض أو يخفّض الطلبات المتجاوزة للميزانية.
+"""
+
+import json
+import math
+import re
+from dataclasses import dataclass, field, asdict
+from functools import lru_cache
+from typing import Dict, List, Optional, Type
+
+from pydantic import BaseModel
+
+try:
+    import tiktoken
+except ImportError:  # الاعتماد اختياري؛ نعود إلى التقدير التقريبي
+    tiktoken = None
+
+# =================================================================================================
+# ثوابت التقدير (Estimation Constants)
+# =================================================================================================
+
+_ARABIC_RE = re.compile(r"[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF]")
+_WIDE_RE = re.compile(r"[\u3000-\u9FFF\uAC00-\uD7AF\U0001F000-\U0001FFFF]")
+
+# عدد الأحرف لكل رمز حسب عائلة المُرمِّز (قيم معايرة تقريبية)
+_CHARS_PER_TOKEN = {
+    "cl100k_base": {"arabic": 1.6, "latin": 4.0},
+    "o200k_base": {"arabic": 3.0, "latin": 4.2},
+}
+
+# نوافذ السياق المعروفة (أطول بادئة مطابقة تفوز)
+_CONTEXT_WINDOWS = {
+    "gpt-3.5": 16385,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4.1": 1047576,
+    "gpt-5": 272000,
+    "o1": 200000,
+    "o3": 200000,
+    "o4": 200000,
+}
+_DEFAULT_CONTEXT_WINDOW = 128000
+
+# الرموز المتوقعة في مخرجات كل مرحلة
+STAGE_OUTPUT_TOKENS = {
+    "basic": 2500,
+    "failure": 2000,
+    "integration": 2000,
+    "performance": 2000,
+    "comparative": 1500,
+}
+
+# شجرة الملخصات: عدد الأجزاء في كل قسم، والرموز المتوقعة لمخرجات كل استدعاء تلخيص
+SUMMARY_TREE_FANOUT = 6
+SUMMARY_OUTPUT_TOKENS = 600
+# الأقسام قيد التلخيص في الوقت نفسه أثناء بناء الشجرة
+SUMMARY_PENDING_SECTIONS = 4
+
+# رموز تعليمات النظام والمستخدم الثابتة لكل مرحلة (بدون النص الخام)
+_PROMPT_OVERHEAD_TOKENS = 350
+# أقل ميزانية إدخال مقبولة عند التخفيض قبل الرفض
+MIN_INPUT_TOKENS = 1000
+
+
+class BudgetExceededError(ValueError):
+    """الطلب يتجاوز الميزانية المكوّنة ولا يمكن تخفيضه"""
+
+
+# =================================================================================================
+# المقدّر (Estimator)
+# =================================================================================================
+
+def _encoding_name(model: str) -> str:
+    name = (model or "").lower()
+    if name.startswith(("gpt-4o", "gpt-4.1", "gpt-5", "o1", "o3", "o4")):
+        return "o200k_base"
+    return "cl100k_base"
+
+
+@lru_cache(maxsize=4)
+def _tiktoken_encoding(name: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception:  # ملفات BPE غير متاحة دون اتصال
+        return None
+
+
+def context_window(model: str) -> int:
+    name = (model or "").lower()
+    matches = [prefix for prefix in _CONTEXT_WINDOWS if name.startswith(prefix)]
+    if not matches:
+        return _DEFAULT_CONTEXT_WINDOW
+    return _CONTEXT_WINDOWS[max(matches, key=len)]
+
+
+def count_arabic(text: str) -> int:
+    """عدد الأحرف العربية في النص"""
+    return len(text) - len(_ARABIC_RE.sub("", text))
+
+
+def estimate_tokens(text: str, model: str = "") -> int:
+    """تقدير عدد الرموز دون اتصال (tiktoken إن توفر، وإلا تقدير حسب نوع الخط)"""
+    if not text:
+        return 0
+    name = _encoding_name(model)
+    encoding = _tiktoken_encoding(name)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+
+    rates = _CHARS_PER_TOKEN[name]
+    arabic = count_arabic(text)
+    wide = len(text) - len(_WIDE_RE.sub("", text))
+    latin = len(text) - arabic - wide
+    return math.ceil(arabic / rates["arabic"] + latin / rates["latin"] + wide)
+
+
+def estimator_name(model: str = "") -> str:
+    """المقدّر المستخدم فعلاً لهذا النموذج: tiktoken أو التقدير التقريبي"""
+    name = _encoding_name(model)
+    return f"tiktoken:{name}" if _tiktoken_encoding(name) is not None else f"heuristic:{name}"
+
+
+def count_tokens(source, model: str = "") -> int:
+    """رموز نص أو مستند مُعيَّن (MappedDocument يعدّها كتلة كتلة دون فك ترميزه كاملاً)"""
+    if isinstance(source, str):
+        return estimate_tokens(source, model)
+    return source.estimate_tokens(model)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = "") -> str:
+    """قص النص إلى ميزانية رموز بدلاً من عدد أحرف ثابت"""
+    total = estimate_tokens(text, model)
+    if total <= max_tokens:
+        return text
+    encoding = _tiktoken_encoding(_encoding_name(model))
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+    cut = int(len(text) * max_tokens / total)
+    while cut > 0 and estimate_tokens(text[:cut], model) > max_tokens:
+        cut = int(cut * 0.95)
+    return text[:cut]
+
+
+@lru_cache(maxsize=32)
+def schema_tokens(response_model: Type[BaseModel], model: str = "") -> int:
+    """رموز مخطط الاستجابة الذي يرسله instructor مع كل استدعاء"""
+    schema = json.dumps(response_model.model_json_schema(), ensure_ascii=False)
+    return estimate_tokens(schema, model)
+
+
+# =================================================================================================
+# المخطط (Planner)
+# =================================================================================================
+
+@dataclass
+class StagePlan:
+    stage: str
+    document_tokens: int
+    input_tokens: int
+    output_tokens: int
+    chunks: int
+    truncated: bool
+    cost_usd: float
+    latency_seconds: float
+
+
+@dataclass
+class AnalysisPlan:
+    model: str
+    analysis_type: str
+    document_tokens: int
+    input_budget: int
+    context_window: int
+    stages: List[StagePlan] = field(default_factory=list)
+    total_input_tokens: int = 0
+    total_output_tokens: int = 0
+    expected_cost_usd: float = 0.0
+    expected_latency_seconds: float = 0.0
+    max_cost_usd: Optional[float] = None
+    downgraded: bool = False
+    estimator: str = ""
+    # بصمات المستندات التي تُحلل من شجرة ملخصاتها (تُحسب مرة واحدة عند التخطيط)
+    document_keys: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def within_budget(self) -> bool:
+        return self.max_cost_usd is None or self.expected_cost_usd <= self.max_cost_usd
+
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        data["within_budget"] = self.within_budget
+        return data
+
+
+class TokenBudgetPlanner:
+    """
+    يبني خطة التحليل من إعدادات AppConfig:
+    max_input_tokens_per_stage, max_cost_usd, budget_policy,
+    input_cost_per_1k, output_cost_per_1k, output_tokens_per_second, request_overhead_seconds
+    """
+
+    def __init__(self, config, stage_models: Dict[str, Type[BaseModel]],
+                 summary_model: Optional[Type[BaseModel]] = None):
+        self.config = config
+        self.model = config.model_name
+        self.stage_models = stage_models
+        self.summary_model = summary_model
+
+    def input_budget(self, max_input_tokens: Optional[int] = None) -> int:
+        """ميزانية رموز المستند لكل مرحلة ضمن نافذة سياق النموذج"""
+        requested = max_input_tokens or self.config.max_input_tokens_per_stage
+        reserve = _PROMPT_OVERHEAD_TOKENS + max(STAGE_OUTPUT_TOKENS.values()) + max(
+            schema_tokens(m, self.model) for m in self.stage_models.values()
+        )
+        return max(0, min(requested, context_window(self.model) - reserve))
+
+    def _stage(self, stage: str, documents: List[int], budget: int) -> StagePlan:
+        # المقارنة تقسم الميزانية بين المستندين
+        share = budget // len(documents)
+        used = sum(min(tokens, share) for tokens in documents)
+        input_tokens = used + _PROMPT_OVERHEAD_TOKENS + schema_tokens(self.stage_models[stage], self.model)
+        output_tokens = STAGE_OUTPUT_TOKENS[stage]
+        cost = (
+            input_tokens / 1000 * self.config.input_cost_per_1k
+            + output_tokens / 1000 * self.config.output_cost_per_1k
+        )
+        latency = self.config.request_overhead_seconds + output_tokens / self.config.output_tokens_per_second
+        return StagePlan(
+            stage=stage,
+            document_tokens=sum(documents),
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            chunks=max(math.ceil(tokens / share) if share else 0 for tokens in documents),
+            truncated=any(tokens > share for tokens in documents),
+            cost_usd=round(cost, 6),
+            latency_seconds=round(latency, 2),
+        )
+
+    def _summary_tree_stage(self, source: str, document_tokens: int) -> StagePlan:
+        """
+        تكلفة بناء شجرة ملخصات لمستند (كما في summary_tree.build_tree):
+        استدعاء لكل جزء، ولكل قسم فيه أكثر من جزء، وللمستند إن تعدد الأقسام.
+        """
+        chunks = max(1, math.ceil(document_tokens / self.config.summary_chunk_tokens))
+        full, rest = divmod(chunks, SUMMARY_TREE_FANOUT)
+        sections = full + (1 if rest else 0)
+        section_calls = full + (1 if rest > 1 else 0) if chunks > 1 else 0
+        document_calls = 1 if sections > 1 else 0
+        calls = chunks + section_calls + document_calls
+
+        per_call = _PROMPT_OVERHEAD_TOKENS + (schema_tokens(self.summary_model, self.model) if self.summary_model else 0)
+        input_tokens = (
+            document_tokens
+            + section_calls * SUMMARY_TREE_FANOUT * SUMMARY_OUTPUT_TOKENS
+            + document_calls * sections * SUMMARY_OUTPUT_TOKENS
+            + calls * per_call
+        )
+        output_tokens = calls * SUMMARY_OUTPUT_TOKENS
+        cost = (
+            input_tokens / 1000 * self.config.input_cost_per_1k
+            + output_tokens / 1000 * self.config.output_cost_per_1k
+        )
+        # الأجزاء تُلخص على دفعات (أقسام محدودة قيد التنفيذ)، ثم مستوى الأقسام ثم المستند
+        call_latency = self.config.request_overhead_seconds + SUMMARY_OUTPUT_TOKENS / self.config.output_tokens_per_second
+        waves = math.ceil(chunks / (SUMMARY_TREE_FANOUT * SUMMARY_PENDING_SECTIONS))
+        latency = call_latency * (waves + (1 if section_calls else 0) + document_calls)
+        return StagePlan(
+            stage=f"summary_tree:{source}",
+            document_tokens=document_tokens,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            chunks=chunks,
+            truncated=False,
+            cost_usd=round(cost, 6),
+            latency_seconds=round(latency, 2),
+        )
+
+    def _build(self, stage_inputs: Dict[str, List[str]], text_tokens: int, comparison_tokens: int,
+               analysis_type: str, budget: int, summary_trees: Dict[str, bool]) -> AnalysisPlan:
+        plan = AnalysisPlan(
+            model=self.model,
+            analysis_type=analysis_type,
+            document_tokens=text_tokens,
+            input_budget=budget,
+            context_window=context_window(self.model),
+            max_cost_usd=self.config.max_cost_usd,
+            estimator=estimator_name(self.model),
+        )
+        sources = {"raw_text": text_tokens, "comparison_text": comparison_tokens}
+        tree_latency = 0.0
+        for source, needs_build in summary_trees.items():
+            if needs_build:
+                tree = self._summary_tree_stage(source, sources[source])
+                plan.stages.append(tree)
+                tree_latency += tree.latency_seconds
+            # المراحل ترى عرض الشجرة المضغوط بدلاً من المستند
+            sources[source] = min(sources[source], self.config.summary_tree_max_tokens)
+        for stage, inputs in stage_inputs.items():
+            # مدخلات المرحلة إما مصادر خام أو مخرجات مراحل سابقة (مخرجاتها المنظمة أصغر بكثير)
+            documents = [sources.get(name, STAGE_OUTPUT_TOKENS.get(name, 0)) for name in inputs]
+            plan.stages.append(self._stage(stage, documents, budget))
+        plan.total_input_tokens = sum(s.input_tokens for s in plan.stages)
+        plan.total_output_tokens = sum(s.output_tokens for s in plan.stages)
+        plan.expected_cost_usd = round(sum(s.cost_usd for s in plan.stages), 6)
+        # الأشجار تُبنى قبل أي مرحلة
+        plan.expected_latency_seconds = round(tree_latency + self._critical_latency(plan, stage_inputs), 2)
+        return plan
+
+    @staticmethod
+    def _critical_latency(plan: AnalysisPlan, stage_inputs: Dict[str, List[str]]) -> float:
+        """المراحل المستقلة تعمل بالتوازي: الزمن المتوقع هو أطول مسار في الرسم البياني"""
+        latency = {s.stage: s.latency_seconds for s in plan.stages}
+        finish: Dict[str, float] = {}
+        for stage, inputs in stage_inputs.items():
+            finish[stage] = latency[stage] + max((finish[d] for d in inputs if d in finish), default=0.0)
+        return max(finish.values(), default=0.0)
+
+    def plan(self, text, stage_inputs: Dict[str, List[str]], analysis_type: str,
+             comparison_text: Optional[str] = None,
+             summary_trees: Optional[Dict[str, bool]] = None) -> AnalysisPlan:
+        """
+        بناء الخطة وتطبيق سياسة الميزانية (reject / downgrade)
+        text: نص أو MappedDocument
+        summary_trees: المصادر التي تُحلل من شجرة ملخصاتها ← هل يجب بناؤها (غير محفوظة)
+        stage_inputs: مدخلات كل مرحلة بترتيب طوبولوجي (مثال: {"failure": ["basic"]})
+        """
+        text_tokens = count_tokens(text, self.model)
+        comparison_tokens = estimate_tokens(comparison_text or "", self.model)
+        summary_trees = summary_trees or {}
+        budget = self.input_budget()
+        plan = self._build(stage_inputs, text_tokens, comparison_tokens, analysis_type, budget, summary_trees)
+        if plan.within_budget:
+            return plan
+
+        if self.config.budget_policy != "downgrade":
+            raise BudgetExceededError(
+                f"Estimated cost ${plan.expected_cost_usd:.4f} exceeds budget ${plan.max_cost_usd:.4f}"
+            )
+
+        # تخفيض ميزانية الإدخال حتى تتسع التكلفة: كل مرحلة تستهلك من المستند ميزانيتها كحد أقصى
+        # (بناء الأشجار تكلفة ثابتة لا تخفّضها الميزانية)
+        stages = [s for s in plan.stages if s.stage in stage_inputs]
+        document_tokens = sum(
+            s.input_tokens - _PROMPT_OVERHEAD_TOKENS - schema_tokens(self.stage_models[s.stage], self.model)
+            for s in stages
+        )
+        fixed_cost = plan.expected_cost_usd - document_tokens / 1000 * self.config.input_cost_per_1k
+        affordable = (plan.max_cost_usd - fixed_cost) / self.config.input_cost_per_1k * 1000
+        reduced = int(affordable / len(stages))
+
+        if reduced < MIN_INPUT_TOKENS:
+            raise BudgetExceededError(
+                f"Estimated cost ${plan.expected_cost_usd:.4f} exceeds budget ${plan.max_cost_usd:.4f} "
+                f"and cannot be downgraded above {MIN_INPUT_TOKENS} input tokens per stage"
+            )
+
+        plan = self._build(stage_inputs, text_tokens, comparison_tokens, analysis_type, reduced, summary_trees)
+        plan.downgraded = True
+        if not plan.within_budget:
+            # التقريب أو مدخلات لا تخفّضها الميزانية (مخرجات المراحل) قد تُبقي التكلفة فوق الحد
+            raise BudgetExceededError(
+                f"Estimated cost ${plan.expected_cost_usd:.4f} still exceeds budget ${plan.max_cost_usd:.4f} "
+                f"after downgrading to {reduced} input tokens per stage"
+            )
+        return plan
@@ -0,0 +1,171 @@
+"""
+تسجيل حركة المرور (Traffic Capture)
+تسجيل اختياري لأشكال الطلبات واستجابات النموذج في ملفات cassette (JSONL):
+الأحجام، أنواع التحليل، التوقيت وتوزيع الوصول — مع حجب المحتوى النصي.
+يُفعَّل عبر متغير البيئة ANALYZER_RECORD_DIR.
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Iterator, List, Literal, Optional, Union, get_args, get_origin
+
+from pydantic import BaseModel
+
+from token_planner import count_arabic, estimate_tokens
+
+CASSETTE_VERSION = 1
+
+
+# =================================================================================================
+# الحجب (Redaction)
+# =================================================================================================
+
+def _unwrap(annotation: Any) -> Any:
+    if get_origin(annotation) is Union:
+        args = [a for a in get_args(annotation) if a is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return annotation
+
+
+def _redact_value(value: Any, annotation: Any) -> Any:
+    annotation = _unwrap(annotation)
+    if isinstance(value, BaseModel):
+        return redact_model(value)
+    if isinstance(value, list):
+        inner = get_args(annotation)[0] if get_args(annotation) else Any
+        return [_redact_value(item, inner) for item in value]
+    if isinstance(value, str):
+        # قيم Literal ليست محتوى حراً ويلزم بقاؤها لتجتاز الاستجابة المعادة التحقق
+        if get_origin(annotation) is Literal:
+            return value
+        return "x" * len(value)
+    return value
+
+
+def redact_model(instance: BaseModel) -> dict:
+    """استبدال كل نص حر بنص بنفس الطول مع الإبقاء على البنية والأرقام وقيم Literal"""
+    return {
+        name: _redact_value(getattr(instance, name), info.annotation)
+        for name, info in type(instance).model_fields.items()
+    }
+
+
+def text_shape(text: str) -> dict:
+    """وصف حجم النص دون محتواه"""
+    arabic = count_arabic(text)
+    return {
+        "text_chars": len(text),
+        "text_tokens": estimate_tokens(text),
+        "arabic_ratio": round(arabic / len(text), 3) if text else 0.0,
+    }
+
+
+# =================================================================================================
+# المسجّل (Recorder)
+# =================================================================================================
+
+@dataclass
+class RequestCapture:
+    """حدث طلب واحد؛ تُضاف إليه استدعاءات النموذج أثناء التنفيذ"""
+    recorder: "TrafficRecorder"
+    request_id: int
+    arrival: float
+    shape: dict
+    status: int = 200
+
+    def observe(self, stage: str, result: BaseModel, latency: float) -> None:
+        """مراقب استدعاءات الوكيل (call_observer)"""
+        self.recorder._write({
+            "kind": "llm",
+            "request_id": self.request_id,
+            "stage": stage,
+            "response_model": type(result).__name__,
+            "started": round(self.recorder._offset() - latency, 4),
+            "latency": round(latency, 4),
+            "response": redact_model(result),
+        })
+
+
+class TrafficRecorder:
+    def __init__(self, directory: str):
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        self.path = path / f"cassette-{datetime.now().strftime('%Y%m%d-%H%M%S')}.jsonl"
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._origin = time.monotonic()
+        self._write({"kind": "header", "version": CASSETTE_VERSION, "started_at": datetime.now().isoformat()})
+
+    @classmethod
+    def from_env(cls) -> Optional["TrafficRecorder"]:
+        directory = os.getenv("ANALYZER_RECORD_DIR")
+        return cls(directory) if directory else None
+
+    def _offset(self) -> float:
+        return time.monotonic() - self._origin
+
+    def _write(self, event: dict) -> None:
+        line = json.dumps(event, ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    @contextmanager
+    def capture(self, text: str, **shape: Any) -> Iterator[RequestCapture]:
+        """تسجيل طلب واحد: وقت الوصول، الشكل، الحالة والمدة"""
+        record = RequestCapture(
+            recorder=self,
+            request_id=next(self._ids),
+            arrival=self._offset(),
+            shape={**shape, **text_shape(text)},
+        )
+        try:
+            yield record
+        except asyncio.CancelledError:
+            record.status = 499
+            raise
+        except Exception as e:
+            record.status = getattr(e, "status_code", 500)
+            raise
+        finally:
+            self._write({
+                "kind": "request",
+                "request_id": record.request_id,
+                "arrival": round(record.arrival, 4),
+                "duration": round(self._offset() - record.arrival, 4),
+                "status": record.status,
+                **record.shape,
+            })
+
+
+# =================================================================================================
+# قراءة الملفات (Cassette Loading)
+# =================================================================================================
+
+@dataclass
+class Cassette:
+    requests: List[dict]
+    llm_calls: List[dict]
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        requests, llm_calls = [], []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                if event["kind"] == "request":
+                    requests.append(event)
+                elif event["kind"] == "llm":
+                    llm_calls.append(event)
+        requests.sort(key=lambda e: e["arrival"])
+        return cls(requests=requests, llm_calls=llm_calls)
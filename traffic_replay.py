@@ -0,0 +1,249 @@
+"""
+إعادة تشغيل حركة المرور المسجلة (Traffic Replay Load Generator)
+يقود تطبيق FastAPI بمعدل N× من معدل الوصول المسجل، مقابل خادم نموذج محلي
+وهمي متوافق مع OpenAI يعيد الاستجابات المحجوبة بنفس أزمنة الاستجابة المسجلة.
+
+الاستخدام:
+    python traffic_replay.py recordings/cassette-20260101-120000.jsonl --speed 5
+    python traffic_replay.py cassette.jsonl --target http://localhost:8000
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import itertools
+import json
+import os
+import statistics
+import sys
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from rich.console import Console
+from rich.table import Table
+
+from token_planner import estimate_tokens
+from traffic_recorder import Cassette
+
+console = Console()
+
+_ARABIC_FILLER = "تحليل معمارية النظام ومكوناته وتدفقات البيانات بين الخدمات "
+_LATIN_FILLER = "replay filler describing services, queues and data flows "
+
+
+def synthesize_text(chars: int, arabic_ratio: float, seed: int) -> str:
+    """نص اصطناعي بنفس الحجم ونسبة العربية (فريد لكل طلب لتجنب إصابة الذاكرة المؤقتة)"""
+    prefix = f"[replay-{seed}] "
+    arabic_chars = int(chars * arabic_ratio)
+    arabic = (_ARABIC_FILLER * (arabic_chars // len(_ARABIC_FILLER) + 1))[:arabic_chars]
+    latin_chars = max(0, chars - arabic_chars - len(prefix))
+    latin = (_LATIN_FILLER * (latin_chars // len(_LATIN_FILLER) + 1))[:latin_chars]
+    return prefix + arabic + latin
+
+
+# =================================================================================================
+# خادم النموذج الوهمي (Mock LLM Server)
+# =================================================================================================
+
+def build_mock_llm(cassette: Cassette, latency_scale: float = 1.0) -> FastAPI:
+    """خادم /v1/chat/completions يعيد الاستجابات المسجلة حسب اسم أداة instructor"""
+    pools: Dict[str, itertools.cycle] = {}
+    by_model = defaultdict(list)
+    for call in cassette.llm_calls:
+        by_model[call["response_model"]].append(call)
+    for name, calls in by_model.items():
+        pools[name] = itertools.cycle(calls)
+
+    mock = FastAPI(title="Replay LLM")
+    counter = itertools.count(1)
+
+    @mock.post("/v1/chat/completions")
+    async def chat_completions(body: dict):
+        tools = body.get("tools") or []
+        name = tools[0]["function"]["name"] if tools else None
+        if name not in pools:
+            raise HTTPException(status_code=404, detail=f"No recorded responses for '{name}'")
+
+        call = next(pools[name])
+        await asyncio.sleep(call["latency"] * latency_scale)
+
+        arguments = json.dumps(call["response"], ensure_ascii=False)
+        prompt_tokens = sum(estimate_tokens(str(m.get("content") or "")) for m in body.get("messages", []))
+        completion_tokens = estimate_tokens(arguments)
+        n = next(counter)
+        return {
+            "id": f"replay-{n}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "replay"),
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {
+                    "role": "assistant",
+                    "content": None,
+                    "tool_calls": [{
+                        "id": f"call_{n}",
+                        "type": "function",
+                        "function": {"name": name, "arguments": arguments},
+                    }],
+                },
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    return mock
+
+
+async def start_mock_llm(app: FastAPI, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    server.task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    return server
+
+
+def load_backend_app():
+    """تحميل تطبيق backend/main.py داخل العملية (الاسم main محجوز لواجهة CLI)"""
+    path = Path(__file__).parent / "backend" / "main.py"
+    spec = importlib.util.spec_from_file_location("backend_main", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.app
+
+
+# =================================================================================================
+# مولّد الحمل (Load Driver)
+# =================================================================================================
+
+async def _send(client: httpx.AsyncClient, event: dict, results: List[dict]) -> None:
+    text = synthesize_text(event["text_chars"], event.get("arabic_ratio", 0.0), event["request_id"])
+    headers = {"X-Priority": event.get("priority") or "interactive"}
+    if event.get("tenant"):
+        headers["X-Tenant-ID"] = event["tenant"]
+    params = {"analysis_type": event.get("analysis_type") or "comprehensive"}
+    if event.get("model_name"):
+        params["model_name"] = event["model_name"]
+
+    started = time.perf_counter()
+    try:
+        if event.get("endpoint") == "/api/analyze-file":
+            response = await client.post(
+                "/api/analyze-file",
+                params=params,
+                headers=headers,
+                files={"file": ("replay.txt", text.encode("utf-8"), "text/plain")},
+            )
+        else:
+            response = await client.post("/api/analyze", json={"text": text, **params}, headers=headers)
+        status = response.status_code
+    except httpx.HTTPError:
+        status = 0
+    results.append({
+        "request_id": event["request_id"],
+        "status": status,
+        "latency": time.perf_counter() - started,
+        "recorded_latency": event.get("duration", 0.0),
+    })
+
+
+async def replay(cassette: Cassette, client: httpx.AsyncClient, speed: float) -> List[dict]:
+    """إرسال الطلبات بنفس توزيع الوصول المسجل مضغوطاً بعامل speed"""
+    results: List[dict] = []
+    if not cassette.requests:
+        return results
+    origin = time.perf_counter()
+    first = cassette.requests[0]["arrival"]
+    tasks = []
+    for event in cassette.requests:
+        due = (event["arrival"] - first) / speed
+        delay = due - (time.perf_counter() - origin)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(_send(client, event, results)))
+    await asyncio.gather(*tasks)
+    return results
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+def print_summary(results: List[dict], wall: float, speed: float) -> None:
+    replayed = [r["latency"] for r in results]
+    recorded = [r["recorded_latency"] for r in results]
+    table = Table(title=f"🔁 Replay summary — {len(results)} requests at {speed}× in {wall:.1f}s")
+    table.add_column("Metric", style="cyan")
+    table.add_column("Recorded", justify="right")
+    table.add_column("Replayed", justify="right")
+    table.add_row("p50 latency (s)", f"{_percentile(recorded, 0.5):.2f}", f"{_percentile(replayed, 0.5):.2f}")
+    table.add_row("p95 latency (s)", f"{_percentile(recorded, 0.95):.2f}", f"{_percentile(replayed, 0.95):.2f}")
+    table.add_row("max latency (s)", f"{max(recorded, default=0):.2f}", f"{max(replayed, default=0):.2f}")
+    table.add_row("mean latency (s)", f"{statistics.fmean(recorded) if recorded else 0:.2f}",
+                  f"{statistics.fmean(replayed) if replayed else 0:.2f}")
+    table.add_row("throughput (req/s)", "", f"{len(results) / wall if wall else 0:.2f}")
+    console.print(table)
+    console.print("Status codes: " + ", ".join(f"{k}: {v}" for k, v in sorted(Counter(r["status"] for r in results).items())))
+
+
+async def run(args: argparse.Namespace) -> List[dict]:
+    cassette = Cassette.load(args.cassette)
+    console.print(f"Loaded {len(cassette.requests)} requests and {len(cassette.llm_calls)} LLM calls from {args.cassette}")
+
+    mock = None
+    if args.target:
+        client = httpx.AsyncClient(base_url=args.target, timeout=None)
+    else:
+        mock = await start_mock_llm(build_mock_llm(cassette, args.latency_scale), args.mock_port)
+        port = mock.servers[0].sockets[0].getsockname()[1]
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{port}/v1"
+        os.environ.setdefault("OPENAI_API_KEY", "replay")
+        # لا نعيد تسجيل حركة الإعادة نفسها
+        os.environ.pop("ANALYZER_RECORD_DIR", None)
+        app = load_backend_app()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://replay", timeout=None)
+
+    try:
+        started = time.perf_counter()
+        results = await replay(cassette, client, args.speed)
+        print_summary(results, time.perf_counter() - started, args.speed)
+        if not args.target:
+            metrics = (await client.get("/api/metrics")).json()["metrics"]
+            console.print({k: v for k, v in metrics.items() if k.startswith(("llm.", "requests.", "scheduler."))})
+        return results
+    finally:
+        await client.aclose()
+        if mock is not None:
+            mock.should_exit = True
+            await mock.task
+
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replay a recorded traffic cassette against the backend")
+    parser.add_argument("cassette", help="Path to a cassette-*.jsonl file")
+    parser.add_argument("--speed", type=float, default=1.0, help="Arrival rate multiplier (default: 1.0)")
+    parser.add_argument("--target", help="Base URL of a running backend (default: in-process app + mock LLM)")
+    parser.add_argument("--mock-port", type=int, default=0, help="Port for the mock LLM (default: random)")
+    parser.add_argument("--latency-scale", type=float, default=1.0,
+                        help="Multiplier applied to recorded LLM latencies (default: 1.0)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(run(parse_arguments()))
+    except KeyboardInterrupt:
+        print("\nReplay interrupted by user")
+        sys.exit(0)